@@ -0,0 +1,90 @@
+"""Redraw latency of the statistics charts.
+
+"full redraw" is what ChartView used to do on every update_graph: clear the
+axes, plot and draw the whole figure. "cache miss" is render_chart on a
+worker thread, producing the PNG the view shows. "cache hit" is switching
+back to a chart shown before. With a display, the cost of turning the PNG
+into a PhotoImage is measured too; cache hits skip it.
+
+    python benchmarks/bench_charts.py --files 10000 --runs 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from grievance_tracker.database import Database
+from grievance_tracker.graphs import render_chart
+from synthetic import build_database
+
+
+def ms(func, runs):
+    """Returns the median time of `func` in milliseconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "charts.db")
+        build_database(path, args.files)
+        db = Database(path)
+        year = max(db.get_years())[0]
+        charts = {"keywords": ("bars", db.get_keywords(year)),
+                  "persons": ("bars", db.get_person(year)),
+                  "density": ("pie", db.get_keywords(year))}
+
+        figure = Figure(figsize=(6, 4), dpi=100)
+        canvas = FigureCanvasAgg(figure)
+        axes = figure.add_subplot(1, 1, 1)
+
+        def full_redraw(kind, data):
+            axes.clear()
+            axes.set_title("Chart")
+            if kind == "pie":
+                axes.pie(list(data.values()), labels=list(data.keys()), autopct='%1.1f%%')
+            else:
+                axes.bar(list(data.keys()), list(data.values()))
+            canvas.draw()
+
+        try:
+            import tkinter as tk
+            root = tk.Tk()
+        except Exception:
+            root = None
+
+        cache = {}
+        print("{:<10}{:>18}{:>16}{:>16}{:>16}".format("chart", "full redraw ms", "cache miss ms", "PhotoImage ms", "cache hit ms"))
+        for name, (kind, data) in charts.items():
+            full = ms(lambda: full_redraw(kind, data), args.runs)
+            miss = ms(lambda: render_chart(kind, "Chart", data.values(), data.keys()), args.runs)
+            png = render_chart(kind, "Chart", data.values(), data.keys())
+            if root is not None:
+                photo = ms(lambda: tk.PhotoImage(data=png, format="png"), args.runs)
+                photo = "{:.2f}".format(photo)
+            else:
+                photo = "no display"
+            key = (name, year, db.data_version(), 600, 400)
+            cache[key] = png
+            hit = ms(lambda: cache.get((name, year, db.data_version(), 600, 400)), args.runs)
+            print("{:<10}{:>18.2f}{:>16.2f}{:>16}{:>16.3f}".format(name, full, miss, photo, hit))
+
+
+if __name__ == "__main__":
+    main()
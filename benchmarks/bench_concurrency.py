@@ -0,0 +1,108 @@
+"""Mixed read/write load on one Database shared by several threads.
+
+Reader threads run uncached searches and lookups while one writer thread
+tags and untags files, one commit each, for a fixed time. "rollback" uses
+SQLite's old defaults (rollback journal, synchronous=FULL, 2 MB page cache,
+no mmap); "wal" uses the ConnectionPool defaults.
+
+    python benchmarks/bench_concurrency.py --files 100000 --readers 4 --seconds 10
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker.database import Database
+from synthetic import build_database
+
+SETTINGS = {
+    "rollback": {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -2000,
+                 "mmap_size": 0, "temp_store": "DEFAULT"},
+    "wal": {},
+}
+TERMS = ["safety", "carrier 1", "orem", "overtime leave", "pro", "2021"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run(path, pragmas, filenames, readers, seconds):
+    """Returns the latencies of all reads and writes, and the error count."""
+    db = Database(path, cache_size=0, pragmas=pragmas)
+    if not db.is_keyword_in_db("Benchmark"):
+        db.add_keyword("Benchmark")
+    stop = threading.Event()
+    reads, writes, errors = [], [], []
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        latencies = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                db.search(rnd.choice(TERMS), 100)
+                db.is_file_in_db(rnd.choice(filenames))
+            except Exception as e:
+                errors.append(e)
+            latencies.append(time.perf_counter() - start)
+        db.close()
+        reads.extend(latencies)
+
+    def writer():
+        rnd = random.Random(0)
+        latencies = []
+        while not stop.is_set():
+            filename = rnd.choice(filenames)
+            start = time.perf_counter()
+            try:
+                db.add_keyword_to_file(filename, "Benchmark")
+                db.delete_keyword_from_file(filename, "Benchmark")
+            except Exception as e:
+                errors.append(e)
+            latencies.append((time.perf_counter() - start) / 2)
+        db.close()
+        writes.extend(latencies)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    db.close_all()
+    return reads, writes, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        filenames = build_database(template, args.files)
+        print("{:<10}{:>10}{:>14}{:>10}{:>14}{:>8}".format(
+            "mode", "reads/s", "read p99 ms", "writes/s", "write p99 ms", "errors"))
+        for mode, pragmas in SETTINGS.items():
+            path = os.path.join(tmp, mode + ".db")
+            shutil.copy(template, path)
+            reads, writes, errors = run(path, pragmas, filenames, args.readers, args.seconds)
+            print("{:<10}{:>10.0f}{:>14.2f}{:>10.0f}{:>14.2f}{:>8}".format(
+                mode, len(reads) / args.seconds, percentile(reads, 0.99) * 1000,
+                len(writes) * 2 / args.seconds, percentile(writes, 0.99) * 1000, len(errors)))
+
+
+if __name__ == "__main__":
+    main()
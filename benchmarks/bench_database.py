@@ -0,0 +1,307 @@
+"""End-to-end benchmarks of the Database layer.
+
+Builds seeded synthetic archives (see synthetic.py) and times a scenario
+for every public Database method plus the search path of the application:
+the search button, paging and search as you type. Every scenario runs on a
+copy of the archive with a cold query cache; reads are timed a second time
+from the cache as well. Writes are undone between runs, outside of the
+timing. Built archives are kept in --data-dir and reused, a 1M file archive
+takes several minutes to build.
+
+Results go to a JSON file. Given an earlier result with --compare, the
+scenarios that got slower by more than --tolerance are listed and the exit
+status is 1.
+
+    python benchmarks/bench_database.py --sizes 1000 100000 1000000 --output results.json
+    python benchmarks/bench_database.py --compare results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker.database import Database
+from synthetic import build_database
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+DATA_DIR = os.path.join(tempfile.gettempdir(), "grievance_benchmarks")
+PAGE_SIZE = 100
+BATCH = 100
+# Typed one character at a time by the "search as you type" scenario
+TYPED = "carrier 12"
+
+
+class Scenario:
+    """A timed call of `run`. `setup` prepares what `run` needs and is not
+    timed, `undo` reverts the writes of `run`. Reads are also timed warm,
+    a second call served from the query cache."""
+
+    def __init__(self, name, run, setup=None, undo=None, write=False, runs=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.undo = undo
+        self.write = write
+        self.runs = runs
+
+    def time(self, db, runs):
+        cold, warm = [], []
+        for _ in range(self.runs or runs):
+            db.cache.invalidate()
+            arg = self.setup() if self.setup else None
+            start = time.perf_counter()
+            result = self.run(arg)
+            cold.append(time.perf_counter() - start)
+            if not self.write:
+                start = time.perf_counter()
+                self.run(arg)
+                warm.append(time.perf_counter() - start)
+            if self.undo:
+                self.undo(result if arg is None else arg)
+        timings = {"cold_ms": statistics.median(cold) * 1000, "min_ms": min(cold) * 1000, "runs": len(cold)}
+        if warm:
+            timings["warm_ms"] = statistics.median(warm) * 1000
+        return timings
+
+
+def drop_files(db, filenames):
+    """Removes files added by a scenario. The links go with them."""
+    with db.write_lock:
+        db.cur.execute("DELETE FROM tbl_file WHERE filename IN (SELECT value FROM json_each(?))", (json.dumps(filenames),))
+        db.conn.commit()
+        db.cache.invalidate()
+        db.prefix_index = None
+
+
+def consume(chunks):
+    return sum(len(chunk) for chunk in chunks)
+
+
+def scenarios(db, filenames, tmp):
+    """Returns the scenarios for `db`, whose files are `filenames`."""
+    filename = filenames[len(filenames) // 2]
+    batch = filenames[:BATCH]
+    year = max(db.get_years())[0]
+    location = db.get_location(filename)
+    keyword = "Safety"
+    # Tags that no file has, so that adding them always writes
+    db.add_keyword("Benchmark Tag")
+    person = db.persons_on_file(filename)["person"].tolist() or ["Carrier 1"]
+    person = person[0]
+    term = "safety orem"
+    upload_dir = os.path.join(tmp, "files") + os.sep
+    os.makedirs(upload_dir, exist_ok=True)
+    source = os.path.join(tmp, "upload.pdf")
+    with open(source, "wb") as fh:
+        fh.write(os.urandom(256 * 1024))
+    fields = {"location": "Orem", "year": year, "payperiod": 1}
+    counter = iter(range(10 ** 9))
+
+    def new_name():
+        return "{}9{:06d} benchmark.pdf".format(year, next(counter))
+
+    def new_rows(n):
+        return [dict(fields, filename=new_name(), keywords=[keyword], persons=[person]) for _ in range(n)]
+
+    def typing(arg):
+        for end in range(1, len(TYPED) + 1):
+            db.prefix_search(TYPED[:end], PAGE_SIZE)
+
+    def build_index(arg):
+        db.prefix_index = None
+        db.get_prefix_index()
+
+    def add_tag(table):
+        return lambda arg: getattr(db, "add_{}_to_file".format(table))(filename, arg)
+
+    return [
+        # The search path of the application
+        Scenario("click_search", lambda arg: (db.search_count(term), db.search(term, PAGE_SIZE, 0))),
+        Scenario("search next page", lambda arg: db.search(term, PAGE_SIZE, PAGE_SIZE)),
+        Scenario("search all files", lambda arg: (db.search_count(""), db.search("", PAGE_SIZE, 0))),
+        Scenario("prefix index build", build_index, write=True),
+        Scenario("search as you type", typing, setup=db.get_prefix_index),
+        # Lookups
+        Scenario("is_file_in_db", lambda arg: db.is_file_in_db(filename)),
+        Scenario("get_location", lambda arg: db.get_location(filename)),
+        Scenario("keywords_on_file", lambda arg: db.keywords_on_file(filename)),
+        Scenario("persons_on_file", lambda arg: db.persons_on_file(filename)),
+        Scenario("file_path", lambda arg: db.file_path(upload_dir, filename)),
+        Scenario("get_blob", lambda arg: db.get_blob("0" * 64)),
+        Scenario("has_blob_of_size", lambda arg: db.has_blob_of_size(12345)),
+        Scenario("is_keyword_in_db", lambda arg: db.is_keyword_in_db(keyword)),
+        Scenario("is_person_in_db", lambda arg: db.is_person_in_db(person)),
+        Scenario("keyword_unused", lambda arg: db.keyword_unused(keyword)),
+        Scenario("get_latest_id", lambda arg: db.get_latest_id()),
+        Scenario("reserve_serials", lambda arg: db.reserve_serials(year), write=True),
+        Scenario("imported_sources", lambda arg: db.imported_sources()),
+        Scenario("schema_version", lambda arg: db.schema_version()),
+        Scenario("data_version", lambda arg: db.data_version()),
+        Scenario("check_external_writes", lambda arg: db.check_external_writes()),
+        Scenario("cache_stats", lambda arg: db.cache_stats()),
+        Scenario("scanning_queries", lambda arg: db.scanning_queries()),
+        # Lists and statistics
+        Scenario("search", lambda arg: db.search(term)),
+        Scenario("search_count", lambda arg: db.search_count(term)),
+        Scenario("search_records", lambda arg: db.search_records(term, 1000)),
+        Scenario("prefix_search", lambda arg: db.prefix_search("saf or", PAGE_SIZE), setup=db.get_prefix_index),
+        Scenario("list_keywords", lambda arg: db.list_keywords()),
+        Scenario("get_keywords", lambda arg: db.get_keywords(year)),
+        Scenario("get_person", lambda arg: db.get_person(year)),
+        Scenario("get_payperiods", lambda arg: db.get_payperiods(year)),
+        Scenario("get_years", lambda arg: db.get_years()),
+        Scenario("keyword_counts_by_year", lambda arg: db.keyword_counts_by_year()),
+        Scenario("person_counts_by_year", lambda arg: db.person_counts_by_year()),
+        Scenario("payperiod_counts_by_year", lambda arg: db.payperiod_counts_by_year()),
+        Scenario("iter_records", lambda arg: consume(db.iter_records(first_year=year, last_year=year))),
+        Scenario("iter_year_stats", lambda arg: consume(db.iter_year_stats())),
+        Scenario("get_filenames_locations", lambda arg: db.get_filenames_locations(), runs=1),
+        # Writes
+        Scenario("file_to_db", lambda name: db.file_to_db(name, fields), setup=new_name,
+                 undo=lambda name: drop_files(db, [name]), write=True),
+        Scenario("files_to_db {}".format(BATCH), lambda rows: db.files_to_db(rows), setup=lambda: new_rows(BATCH),
+                 undo=lambda rows: drop_files(db, [r["filename"] for r in rows]), write=True),
+        Scenario("files_to_db {} with serials".format(BATCH), lambda rows: db.files_to_db(rows),
+                 setup=lambda: [dict(row, filename=None, name="benchmark.pdf") for row in new_rows(BATCH)],
+                 undo=lambda rows: drop_files(db, [r["filename"] for r in rows]), write=True),
+        Scenario("upload_file", lambda arg: db.upload_file(upload_dir, source, fields, name="benchmark.pdf"),
+                 undo=lambda result: db.delete_file(upload_dir, result[0]), write=True),
+        Scenario("delete_file", lambda name: db.delete_file(upload_dir, name),
+                 setup=lambda: db.upload_file(upload_dir, source, fields, name="benchmark.pdf")[0], write=True),
+        Scenario("update_location", lambda arg: db.update_location(filename, "Benchmark"),
+                 undo=lambda result: db.update_location(filename, location), write=True),
+        Scenario("add_keyword", lambda arg: db.add_keyword("Benchmark"),
+                 undo=lambda result: db.delete_keyword("Benchmark"), write=True),
+        Scenario("delete_keyword", lambda arg: db.delete_keyword("Benchmark"),
+                 setup=lambda: db.add_keyword("Benchmark") and None, write=True),
+        Scenario("add_person", lambda arg: db.add_person("Benchmark Person"),
+                 undo=lambda result: drop_person(db, "Benchmark Person"), write=True),
+        Scenario("add_keyword_to_file", add_tag("keyword"), setup=lambda: "Benchmark Tag",
+                 undo=lambda kw: db.delete_keyword_from_file(filename, kw), write=True),
+        Scenario("delete_keyword_from_file", lambda kw: db.delete_keyword_from_file(filename, kw),
+                 setup=lambda: db.add_keyword_to_file(filename, "Benchmark Tag") and "Benchmark Tag", write=True),
+        Scenario("add_person_to_file", add_tag("person"), setup=lambda: "Benchmark Person",
+                 undo=lambda p: db.delete_person_from_file(filename, p), write=True),
+        Scenario("delete_person_from_file", lambda p: db.delete_person_from_file(filename, p),
+                 setup=lambda: db.add_person_to_file(filename, "Benchmark Person") and "Benchmark Person", write=True),
+        Scenario("tag_files {}".format(BATCH), lambda arg: db.tag_files(batch, ["Benchmark Tag"], ["Benchmark Person"]),
+                 undo=lambda result: db.tag_files(batch, ["Benchmark Tag"], ["Benchmark Person"], remove=True), write=True),
+        Scenario("reindex_files {}".format(BATCH), lambda arg: db.reindex_files(batch), setup=db.get_prefix_index, write=True),
+        Scenario("migrate", lambda arg: db.migrate(), write=True),
+    ]
+
+
+def drop_person(db, person):
+    with db.write_lock:
+        db.cur.execute("DELETE FROM tbl_person WHERE name=?", (person,))
+        db.conn.commit()
+        db.cache.invalidate()
+
+
+def archive(data_dir, size, seed):
+    """Returns the path and filenames of the synthetic archive of `size`
+    files, building it unless it is in `data_dir` already."""
+    path = os.path.join(data_dir, "synthetic-{}-{}.db".format(size, seed))
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        filenames = [row[0] for row in conn.execute("SELECT filename FROM tbl_file ORDER BY id")]
+        conn.close()
+        return path, filenames
+    os.makedirs(data_dir, exist_ok=True)
+    print("building {} files...".format(size), file=sys.stderr)
+    partial = path + ".part"
+    if os.path.exists(partial):
+        os.remove(partial)
+    filenames = build_database(partial, size, seed)
+    os.replace(partial, path)
+    return path, filenames
+
+
+def run_size(data_dir, size, seed, runs, only):
+    path, filenames = archive(data_dir, size, seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "bench.db")
+        shutil.copy(path, copy)
+        db = Database(copy)
+        for scenario in scenarios(db, filenames, tmp):
+            if only and not any(name in scenario.name for name in only):
+                continue
+            results[scenario.name] = scenario.time(db, runs)
+            print("{:>9} {:<28}{:>12.3f} ms".format(size, scenario.name, results[scenario.name]["cold_ms"]), file=sys.stderr)
+        db.close_all()
+    return results
+
+
+def environment(seed):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed}
+
+
+def compare(old, new, tolerance):
+    """Prints the scenarios of `new` that are slower than in `old` by more
+    than the factor `tolerance`. Returns how many there are."""
+    slower = 0
+    for size, results in new["results"].items():
+        for name, timings in results.items():
+            before = old.get("results", {}).get(size, {}).get(name)
+            if not before:
+                continue
+            ratio = timings["cold_ms"] / max(before["cold_ms"], 1e-6)
+            if ratio > tolerance:
+                print("{:>9} {:<28}{:>10.3f} ms -> {:>10.3f} ms  x{:.2f}".format(
+                    size, name, before["cold_ms"], timings["cold_ms"], ratio))
+                slower += 1
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="where built archives are kept")
+    parser.add_argument("--only", nargs="+", help="run the scenarios whose name contains one of these")
+    parser.add_argument("--output", default="bench_database.json")
+    parser.add_argument("--compare", help="earlier result to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    old = None
+    if args.compare:
+        with open(args.compare) as fh:
+            old = json.load(fh)
+
+    result = {"environment": environment(args.seed), "results": {}}
+    for size in args.sizes:
+        result["results"][str(size)] = run_size(args.data_dir, size, args.seed, args.runs, args.only)
+    with open(args.output, "w") as fh:
+        json.dump(result, fh, indent=1)
+    print("results written to {}".format(args.output))
+
+    if old is not None:
+        slower = compare(old, result, args.tolerance)
+        print("{} scenarios slower than x{:.2f}".format(slower, args.tolerance))
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
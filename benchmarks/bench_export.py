@@ -0,0 +1,80 @@
+"""Rows per second and peak memory of the export formats.
+
+"stream" writes Database.iter_records chunk by chunk, "materialized" first
+fetches the whole result with search_records, like the export used to.
+Every run happens in a fresh process, so its peak RSS is its own.
+
+    python benchmarks/bench_export.py --files 100000 [--db existing.db]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker import export
+from grievance_tracker.database import Database
+from synthetic import build_database
+
+
+def run(db_path, fmt, mode, term, out_path):
+    """Exports once and returns rows, seconds and peak RSS in MB."""
+    db = Database(db_path)
+    start = time.perf_counter()
+    if mode == "stream":
+        chunks = db.iter_records(term)
+    else:
+        chunks = [db.search_records(term)]
+    rows = export.export(chunks, export.RECORD_FIELDS, out_path, fmt)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"rows": rows, "seconds": seconds, "peak_rss_mb": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--db", help="use this database instead of a synthetic one")
+    parser.add_argument("--term", default="", help="search term to export (default: everything)")
+    parser.add_argument("--child", nargs=4, metavar=("DB", "FORMAT", "MODE", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        db_path, fmt, mode, out_path = args.child
+        print(json.dumps(run(db_path, fmt, mode, args.term, out_path)))
+        return
+
+    formats = ["csv", "jsonl"]
+    # Only look for pyarrow, importing it here would inflate the children's
+    # peak RSS, which Linux carries over across fork and exec
+    if importlib.util.find_spec("pyarrow"):
+        formats.append("parquet")
+    else:
+        print("pyarrow is not installed, skipping parquet")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(tmp, "bench.db")
+            print("building a database with {} files...".format(args.files))
+            build_database(db_path, args.files)
+        print("{:<8}{:<14}{:>10}{:>12}{:>14}".format("format", "mode", "rows", "rows/s", "peak RSS MB"))
+        for fmt in formats:
+            for mode in ("materialized", "stream"):
+                out_path = os.path.join(tmp, "export." + fmt)
+                proc = subprocess.run([sys.executable, __file__, "--term", args.term,
+                                       "--child", db_path, fmt, mode, out_path],
+                                      capture_output=True, text=True, check=True)
+                result = json.loads(proc.stdout)
+                print("{:<8}{:<14}{:>10}{:>12.0f}{:>14.1f}".format(
+                    fmt, mode, result["rows"], result["rows"] / result["seconds"], result["peak_rss_mb"]))
+
+
+if __name__ == "__main__":
+    main()
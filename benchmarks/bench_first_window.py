@@ -0,0 +1,78 @@
+"""Time to first window of the desktop application.
+
+Starts the application in a new interpreter on a synthetic database and
+measures the wall time from starting the process until the main window has
+been mapped and drawn. Also lists the heavy modules loaded by then; the
+statistics page and its matplotlib import are only built on first
+navigation, so none of them should be. Needs a display, run it under
+xvfb-run on a headless machine.
+
+    python benchmarks/bench_first_window.py [--files 10000] [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from synthetic import build_database
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+HEAVY = ("pandas", "numpy", "matplotlib")
+
+# Runs in the child process, prints the time the window was drawn
+CHILD = """
+import json, sys, time
+from grievance_tracker.application import Application
+app = Application(db_file=sys.argv[1])
+app.update()
+drawn = time.time()
+loaded = sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[2].split(",")))
+app.quit()
+print(json.dumps({"drawn": drawn, "loaded": loaded}))
+"""
+
+
+def first_window(path):
+    """Returns the seconds until the window was drawn and the heavy
+    modules loaded by then."""
+    start = time.time()
+    proc = subprocess.run([sys.executable, "-c", CHILD, path, ",".join(HEAVY)],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result["drawn"] - start, result["loaded"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+        print("no display, run under xvfb-run")
+        sys.exit(2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "window.db")
+        build_database(path, args.files)
+        runs = [first_window(path) for _ in range(args.runs)]
+
+    times = [seconds for seconds, loaded in runs]
+    print("time to first window: median {:.1f} ms, best {:.1f} ms".format(
+        statistics.median(times) * 1000, min(times) * 1000))
+    loaded = runs[0][1]
+    if loaded:
+        print("loaded before the first window:", ", ".join(loaded))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Update latency of the keyword and person lists.
+
+"rebuild" is what show_keywords used to do on every change: destroy all
+rows and create a label and a delete button for every name. "reconcile" is
+ItemList.show, which only adds or removes the rows that changed. Each
+update adds or removes one name and is timed until Tk has processed it.
+Needs a display, run it under xvfb-run on a headless machine.
+
+    python benchmarks/bench_lists.py --items 100 500 --runs 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import tkinter as tk
+from tkinter import ttk
+
+from grievance_tracker.view import ItemList
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+
+def rebuild(frame, icon, items):
+    for item in frame.winfo_children():
+        item.destroy()
+    for cnt, item in enumerate(items):
+        name = ttk.Label(frame, text=item, justify="left")
+        name.grid(row=cnt, column=0, sticky=(tk.N+tk.S+tk.E+tk.W))
+        but_del = tk.Button(frame, image=icon, highlightthickness=0, bd=0, borderwidth=0, relief=tk.FLAT, width=25, height=25)
+        but_del.grid(row=cnt, column=2)
+
+
+def updates(root, show, items, runs):
+    """Returns the median time in milliseconds of adding or removing one
+    name in the middle of `items`."""
+    show(items)
+    root.update()
+    times = []
+    extra = "Keyword extra"
+    for run in range(runs):
+        changed = items[:len(items) // 2] + [extra] + items[len(items) // 2:] if run % 2 == 0 else items
+        start = time.perf_counter()
+        show(changed)
+        root.update()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        print("no display, run under xvfb-run")
+        sys.exit(2)
+    icon = tk.PhotoImage(file=os.path.join(ROOT, "icons", "cross.png")).subsample(2, 2)
+
+    print("{:>8}{:>16}{:>18}".format("items", "rebuild ms", "reconcile ms"))
+    for count in args.items:
+        items = ["Keyword {}".format(i) for i in range(count)]
+        frame = tk.Frame(root)
+        frame.pack()
+        before = updates(root, lambda names: rebuild(frame, icon, names), items, args.runs)
+        frame.destroy()
+        lst = ItemList(root, icon)
+        lst.pack()
+        after = updates(root, lst.show, items, args.runs)
+        lst.destroy()
+        print("{:>8}{:>16.2f}{:>18.2f}".format(count, before, after))
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
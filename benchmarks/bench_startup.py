@@ -0,0 +1,53 @@
+"""Import-time budget for the headless command line interface.
+
+Runs `python -X importtime -m grievance_tracker --help`, fails if the CLI
+imports take longer than the budget or if any GUI or data-science module is
+loaded at startup.
+
+    python benchmarks/bench_startup.py [--budget-ms 150]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+FORBIDDEN = ("tkinter", "pandas", "numpy", "matplotlib")
+
+
+def import_times(argv):
+    """Returns {module: cumulative microseconds} as reported by -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "grievance_tracker"] + argv,
+                          cwd=ROOT, capture_output=True, text=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [import_times(["--help"]) for _ in range(args.runs)]
+    best = min(sum(t for name, t in times.items() if "." not in name) for times in runs) / 1000
+    loaded = sorted({name for name in runs[0] if name.split(".")[0] in FORBIDDEN})
+
+    print("import time of `python -m grievance_tracker`: {:.1f} ms (budget {:.1f} ms)".format(best, args.budget_ms))
+    failed = False
+    if loaded:
+        print("modules that should be imported lazily:", ", ".join(loaded))
+        failed = True
+    if best > args.budget_ms:
+        print("import time is over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
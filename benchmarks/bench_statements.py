@@ -0,0 +1,73 @@
+"""Statements per second for the hot Database lookups.
+
+"before" runs the SQL the way Database used to build it, with str.format, so
+every call is a new statement text that SQLite has to parse and plan.
+"after" runs the same SQL text Database uses now, with bound parameters, so
+the prepared statement is reused from the connection's statement cache.
+add_keyword_to_file is timed end to end, including its commit.
+
+    python benchmarks/bench_statements.py --files 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker.database import Database, HOT_QUERIES
+from synthetic import build_database
+
+LEGACY = {
+    "is_file_in_db": "SELECT id FROM tbl_file WHERE filename='{}'",
+    "get_location": "SELECT location FROM tbl_file WHERE filename='{}'",
+    "keywords_on_file": "SELECT f.id,k.keyword FROM tbl_file f JOIN tbl_hlp_file_keyword h ON f.id=h.file_id JOIN tbl_keyword k ON h.keyword_id=k.id WHERE filename='{}'",
+    "persons_on_file": "SELECT f.id,p.name FROM tbl_file f JOIN tbl_hlp_file_person h ON f.id=h.file_id JOIN tbl_person p ON h.person_id=p.id WHERE filename='{}'",
+}
+
+
+def rate(calls, func):
+    start = time.perf_counter()
+    for args in calls:
+        func(*args)
+    return len(calls) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        filenames = build_database(path, args.files)
+        rnd = random.Random(1)
+        sample = [(f,) for f in rnd.sample(filenames, args.calls)]
+
+        legacy = sqlite3.connect(path)
+        db = Database(path)
+        print("{:<22}{:>14}{:>14}".format("statement", "before [1/s]", "after [1/s]"))
+        for name, sql_string in LEGACY.items():
+            before = rate(sample, lambda f: legacy.execute(sql_string.format(f)).fetchall())
+            after = rate(sample, lambda f: db.cur.execute(HOT_QUERIES[name][0], (f,)).fetchall())
+            print("{:<22}{:>14.0f}{:>14.0f}".format(name, before, after))
+
+        legacy_insert = "INSERT INTO tbl_hlp_file_keyword (file_id,keyword_id) VALUES ('{}','{}')"
+        db.add_keyword("Benchmark before")
+        db.add_keyword("Benchmark after")
+        def before_tag(f, k):
+            fileid = legacy.execute(LEGACY["is_file_in_db"].format(f)).fetchone()
+            keywordid = legacy.execute("SELECT id FROM tbl_keyword WHERE keyword='{}'".format(k)).fetchone()
+            legacy.execute(legacy_insert.format(fileid[0], keywordid[0]))
+            legacy.commit()
+        before = rate([(f, "Benchmark before") for (f,) in sample], before_tag)
+        after = rate([(f, "Benchmark after") for (f,) in sample], db.add_keyword_to_file)
+        print("{:<22}{:>14.0f}{:>14.0f}".format("add_keyword_to_file", before, after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compression ratio, write throughput and open latency of the blob store.
+
+Three kinds of files are stored with and without compression: typed
+letters (text), PDFs with uncompressed content streams and scans, which
+are compressed already and stay as they are. Opening a compressed file
+the first time decompresses it into the cache ("cold"), later opens find
+the copy there ("warm").
+
+    python benchmarks/bench_storage.py --size 4 --runs 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker import store
+
+WORDS = ("grievance steward overtime route carrier safety dock supervisor letter "
+         "article contract remedy violation management branch").split()
+
+
+def letter(rnd, size):
+    text, length = [], 0
+    while length < size:
+        text.append(" ".join(rnd.choice(WORDS) for _ in range(12)) + ".\n")
+        length += len(text[-1])
+    return "".join(text).encode()[:size]
+
+
+def pdf(rnd, size):
+    lines, length = [b"%PDF-1.4\n"], 0
+    while length < size:
+        lines.append(b"BT /F1 12 Tf %d %d Td (%s) Tj ET\n" % (
+            rnd.randint(0, 600), rnd.randint(0, 800), rnd.choice(WORDS).encode()))
+        length += len(lines[-1])
+    return b"".join(lines)[:size]
+
+
+def scan(rnd, size):
+    return rnd.randbytes(size)
+
+
+KINDS = {".txt": letter, ".pdf": pdf, ".jpg": scan}
+
+
+def timed(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=float, default=4, help="file size in MB")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    size = int(args.size * 1024 * 1024)
+    rnd = random.Random(0)
+
+    print("{:>6}{:>7}{:>8}{:>12}{:>12}{:>11}{:>11}{:>11}".format(
+        "kind", "codec", "ratio", "raw MB/s", "store MB/s", "raw ms", "cold ms", "warm ms"))
+    with tempfile.TemporaryDirectory() as directory:
+        for ext, make in KINDS.items():
+            src = os.path.join(directory, "source" + ext)
+            with open(src, "wb") as fh:
+                fh.write(make(rnd, size))
+            results = {}
+            for compress in (False, True):
+                upload_dir = os.path.join(directory, "compressed" if compress else "raw")
+
+                def put():
+                    blob = store.BlobWriter(upload_dir, compress)
+                    with open(src, "rb") as fh:
+                        for chunk in iter(lambda: fh.read(store.CHUNK_SIZE), b""):
+                            blob.write(chunk)
+                    results[compress] = blob.finish(ext)
+                seconds = timed(put, args.runs)
+                results[compress, "MB/s"] = args.size / seconds
+            path = os.path.join(directory, "compressed", results[True]["path"])
+            cache = store.BlobCache(os.path.join(directory, "cache"))
+
+            def cold():
+                cache.discard(path)
+                cache.path(path)
+            raw = timed(lambda: store.BlobCache().path(os.path.join(directory, "raw", results[False]["path"])), args.runs)
+            print("{:>6}{:>7}{:>8.2f}{:>12.0f}{:>12.0f}{:>11.2f}{:>11.2f}{:>11.2f}".format(
+                ext, store.blob_codec(path) or "-", os.path.getsize(path) / size,
+                results[False, "MB/s"], results[True, "MB/s"],
+                raw * 1000, timed(cold, args.runs) * 1000, timed(lambda: cache.path(path), args.runs) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Tagging many files: one commit per (file, tag) against tag_files.
+
+"before" runs the statements add_keyword_to_file and add_person_to_file
+used to run for every pair: two id lookups, an INSERT and a commit.
+"after" is a single Database.tag_files call.
+
+    python benchmarks/bench_tagging.py --files 100000 --tagged 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker.database import Database
+from synthetic import build_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--tagged", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        filenames = build_database(path, args.files)
+        rnd = random.Random(2)
+        sample = rnd.sample(filenames, 2 * args.tagged)
+        before_files, after_files = sample[:args.tagged], sample[args.tagged:]
+
+        db = Database(path)
+        for keyword in ("Class Action before", "Class Action after"):
+            db.add_keyword(keyword)
+        for person in ("Steward before", "Steward after"):
+            db.add_person(person)
+
+        start = time.perf_counter()
+        cur = db.conn.cursor()
+        for filename in before_files:
+            for table, column, link, link_column, tag in (
+                    ("tbl_keyword", "keyword", "tbl_hlp_file_keyword", "keyword_id", "Class Action before"),
+                    ("tbl_person", "name", "tbl_hlp_file_person", "person_id", "Steward before")):
+                file_id = cur.execute("SELECT id FROM tbl_file WHERE filename=?", (filename,)).fetchone()
+                tag_id = cur.execute("SELECT id FROM {} WHERE {}=?".format(table, column), (tag,)).fetchone()
+                cur.execute("INSERT INTO {}(file_id,{}) VALUES (?,?)".format(link, link_column), (file_id[0], tag_id[0]))
+                db.conn.commit()
+        before = time.perf_counter() - start
+
+        start = time.perf_counter()
+        db.tag_files(after_files, ["Class Action after"], ["Steward after"])
+        after = time.perf_counter() - start
+
+        print("tagging {} files with a keyword and a person".format(args.tagged))
+        print("{:<28}{:>10.3f} s".format("before, a commit per pair", before))
+        print("{:<28}{:>10.3f} s".format("after, tag_files", after))
+
+
+if __name__ == "__main__":
+    main()
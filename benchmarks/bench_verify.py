@@ -0,0 +1,72 @@
+"""Time of verify over a synthetic archive, by number of scanner threads.
+
+Every file of a synthetic database gets a small blob in a temporary upload
+directory. A few blobs are removed and a few orphans added, so the diff has
+something to find. The threads pay off on network shares and cold caches;
+with the directory in the page cache the scan is bound by Python.
+
+    python benchmarks/bench_verify.py --files 20000 --threads 1 8 [--hash]
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker import store, verify
+from grievance_tracker.database import Database
+
+from synthetic import build_database
+
+DAMAGE = 10
+
+
+def build_archive(directory, n_files):
+    path = os.path.join(directory, "bench.db")
+    build_database(path, n_files)
+    upload_dir = os.path.join(directory, "upload", "")
+    blobs = []
+    for file_id in range(1, n_files + 1):
+        content = "grievance {}\n".format(file_id).encode()
+        sha256 = hashlib.sha256(content).hexdigest()
+        relpath = store.blob_relpath(sha256, ".pdf")
+        os.makedirs(os.path.dirname(os.path.join(upload_dir, relpath)), exist_ok=True)
+        with open(os.path.join(upload_dir, relpath), "wb") as fh:
+            fh.write(content)
+        blobs.append((file_id, sha256, len(content), relpath))
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO tbl_blob(id,sha256,size,path) VALUES(?,?,?,?)", blobs)
+    conn.execute("UPDATE tbl_file SET blob_id=id")
+    conn.commit()
+    conn.close()
+    for file_id, sha256, size, relpath in blobs[:DAMAGE]:
+        os.remove(os.path.join(upload_dir, relpath))
+    for i in range(DAMAGE):
+        with open(os.path.join(upload_dir, "orphan {}.pdf".format(i)), "w") as fh:
+            fh.write("orphan")
+    return Database(path), upload_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--hash", action="store_true", help="also time the hash check")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db, upload_dir = build_archive(directory, args.files)
+        print("{:>8}{:>12}{:>14}{:>10}{:>10}".format("threads", "seconds", "files/s", "missing", "orphans"))
+        for threads in args.threads:
+            result = verify.verify(db, upload_dir, args.hash, threads)
+            print("{:>8}{:>12.2f}{:>14.0f}{:>10}{:>10}".format(
+                threads, result["seconds"], result["scanned"] / result["seconds"],
+                len(result["missing"]), len(result["orphans"])))
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Fails if any hot query in Database falls back to a full table or index scan.
+
+    python benchmarks/check_query_plans.py [--files 10000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker.database import Database
+from synthetic import build_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plans.db")
+        build_database(path, args.files)
+        db = Database(path)
+        scans = db.scanning_queries()
+        db.close()
+
+    for name, detail in scans:
+        print("{}: {}".format(name, detail))
+    if scans:
+        sys.exit("{} hot queries use a full table or index scan.".format(len(scans)))
+    print("All hot queries use an index.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Many processes adding files to one database at once, then a check that
+no serial number was handed out twice.
+
+Every process adds single files, like uploads through the application, and
+batches, like bulk imports, over a few years. Afterwards the serials of
+each year must be unique and without gaps. --legacy numbers the files like
+before tbl_serial, from max(id) read before the insert, to show the race.
+
+    python benchmarks/stress_serials.py --processes 8 --files 500 [--legacy]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker.database import SERIAL_FORMAT, Database
+
+YEARS = [2023, 2024, 2025]
+MAX_BATCH = 20
+
+
+def add_files(path, worker, n_files, legacy):
+    """Adds `n_files` files to the database at `path`. Returns the number added."""
+    rnd = random.Random(worker)
+    db = Database(path)
+    added = 0
+    while added < n_files:
+        count = 1 if rnd.random() < 0.7 else min(rnd.randint(2, MAX_BATCH), n_files - added)
+        year = rnd.choice(YEARS)
+        rows = [{"name": "w{} f{}.pdf".format(worker, added + i), "location": "Orem", "year": year, "payperiod": 1}
+                for i in range(count)]
+        if legacy:
+            latest = db.get_latest_id()
+            for offset, row in enumerate(rows):
+                row["filename"] = SERIAL_FORMAT.format(year, latest + 1 + offset, row["name"])
+        if db.files_to_db(rows) >= 0:
+            added += count
+    db.close_all()
+    return added
+
+
+def duplicates(path):
+    """Returns (year, serial, count) of the serials used more than once and
+    the number of gaps in the serials of each year."""
+    conn = sqlite3.connect(path)
+    serials = "CAST(substr(filename,5,instr(filename,' ')-5) AS INTEGER)"
+    dups = conn.execute("SELECT year,{0},count(*) FROM tbl_file GROUP BY year,{0} HAVING count(*)>1".format(serials)).fetchall()
+    gaps = conn.execute("SELECT sum(max_serial-n) FROM (SELECT max({}) AS max_serial, count(*) AS n FROM tbl_file GROUP BY year)".format(serials)).fetchone()[0]
+    conn.close()
+    return dups, gaps or 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--files", type=int, default=500, help="files per process")
+    parser.add_argument("--legacy", action="store_true", help="number the files from max(id) like before")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stress.db")
+        Database(path).close_all()
+        start = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            added = sum(pool.starmap(add_files, [(path, worker, args.files, args.legacy)
+                                                 for worker in range(args.processes)]))
+        seconds = time.perf_counter() - start
+        dups, gaps = duplicates(path)
+
+    print("{} files added by {} processes in {:.1f} s ({:.0f} files/s)".format(
+        added, args.processes, seconds, added / seconds))
+    for year, serial, count in dups[:10]:
+        print("serial {}{:04d} used {} times".format(year, serial, count))
+    print("{} duplicate serials, {} gaps".format(len(dups), gaps))
+    if not args.legacy and (dups or gaps):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
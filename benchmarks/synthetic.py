@@ -0,0 +1,99 @@
+"""Builds synthetic grievance databases for the benchmarks.
+
+The data is seeded, so the same size and seed always give the same
+database. Like a real archive it is skewed: a few keywords are on most
+grievances, a few employees file many of them, the busier offices have
+more, and every year has more files than the one before.
+
+    python benchmarks/synthetic.py data.db --files 100000 [--seed 0]
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from grievance_tracker.database import Database
+
+# Most common first, see zipf
+KEYWORDS = ["Safety", "Personnel", "Time Card", "Maintenance", "Pay/Earnings",
+            "Overtime", "Route Inspection", "Leave", "Discipline", "Harassment"]
+LOCATIONS = ["Orem", "Provo", "Lehi", "American Fork", "Springville", "Pleasant Grove"]
+FIRST_YEAR = 2015
+LAST_YEAR = 2024
+# How many keywords and persons a file has, and how often
+KEYWORDS_PER_FILE = ((0, 1, 2, 3), (10, 45, 30, 15))
+PERSONS_PER_FILE = ((0, 1, 2), (20, 60, 20))
+# Rows inserted per executemany, bounds the memory of large builds
+CHUNK = 50000
+
+
+def filename(year, serial):
+    return "{}{:04d} grievance_{}.pdf".format(year, serial, serial)
+
+
+def zipf(n, s=1.1):
+    """Cumulative weights of `n` ranks with a Zipf-like distribution."""
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+def pick(rnd, population, cum_weights, counts):
+    """Returns up to k distinct items of `population`, k drawn from `counts`."""
+    k = rnd.choices(*counts)[0]
+    return list(dict.fromkeys(rnd.choices(population, cum_weights=cum_weights, k=k)))
+
+
+def build_database(path, n_files, seed=0):
+    """Fills the database at `path` with `n_files` files and their links.
+    Returns the filenames."""
+    rnd = random.Random(seed)
+    Database(path).close()
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO tbl_keyword(keyword) VALUES(?)", [(k,) for k in KEYWORDS])
+    n_persons = max(10, n_files // 50)
+    conn.executemany("INSERT INTO tbl_person(name) VALUES(?)",
+                     [("Carrier {}".format(i),) for i in range(n_persons)])
+    keyword_ids = list(range(1, len(KEYWORDS) + 1))
+    keyword_weights = zipf(len(KEYWORDS))
+    person_ids = list(range(1, n_persons + 1))
+    person_weights = zipf(n_persons, 1.2)
+    years = list(range(FIRST_YEAR, LAST_YEAR + 1))
+    year_weights = list(itertools.accumulate(range(1, len(years) + 1)))
+    location_weights = zipf(len(LOCATIONS), 0.8)
+
+    filenames = []
+    for start in range(1, n_files + 1, CHUNK):
+        files, keyword_links, person_links = [], [], []
+        for serial in range(start, min(start + CHUNK, n_files + 1)):
+            year = rnd.choices(years, cum_weights=year_weights)[0]
+            location = rnd.choices(LOCATIONS, cum_weights=location_weights)[0]
+            files.append((serial, filename(year, serial), location, year, rnd.randint(1, 26)))
+            keyword_links.extend((serial, k) for k in pick(rnd, keyword_ids, keyword_weights, KEYWORDS_PER_FILE))
+            person_links.extend((serial, p) for p in pick(rnd, person_ids, person_weights, PERSONS_PER_FILE))
+        conn.executemany("INSERT INTO tbl_file(id,filename,location,year,payperiod) VALUES(?,?,?,?,?)", files)
+        conn.executemany("INSERT INTO tbl_hlp_file_keyword(file_id,keyword_id) VALUES(?,?)", keyword_links)
+        conn.executemany("INSERT INTO tbl_hlp_file_person(file_id,person_id) VALUES(?,?)", person_links)
+        conn.commit()
+        filenames.extend(f[1] for f in files)
+    conn.execute("ANALYZE")
+    conn.close()
+    return filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if os.path.exists(args.path):
+        parser.error("{} exists already".format(args.path))
+    build_database(args.path, args.files, args.seed)
+    print("{} files written to {}".format(args.files, args.path))
+
+
+if __name__ == "__main__":
+    main()
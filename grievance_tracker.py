@@ -1,4 +1,9 @@
+import sys
+
 from grievance_tracker.application import Application
 
-app = Application()
-app.mainloop()
\ No newline at end of file
+# python grievance_tracker.py [http://server:8750] uses a shared archive server
+# The guard keeps the text extraction processes from starting the GUI again
+if __name__ == "__main__":
+    app = Application(server=sys.argv[1] if len(sys.argv) > 1 else None)
+    app.mainloop()
\ No newline at end of file
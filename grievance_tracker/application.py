@@ -1,6 +1,6 @@
 import os
 import platform
-import shutil
+import subprocess
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog, messagebox
@@ -10,14 +10,41 @@ from tkinter import filedialog, messagebox
 # from . import model as m
 from . import view as v
 from . import database
-from . import graphs as g
+from . import worker
+
+DB_FILE = 'grievance_tracker/data.db'
+
+
+def open_with_default_app(path):
+    """Opens `path` in the program the desktop associates with its type."""
+    if platform.system()=="Windows":
+        os.startfile(path, 'open')
+    elif platform.system()=="Darwin":
+        subprocess.Popen(["open", path])
+    else:
+        subprocess.Popen(["xdg-open", path])
+
 
 class Application(tk.Tk):
     """Application for the comparison of dayly data
     The Application class is the controller part of the app.
     Subclass of tk.TK, so the root of the GUI"""
 
-    def __init__(self, *args, **kwargs):
+    # Search as you type waits for this pause in typing
+    SEARCH_DEBOUNCE_MS = 150
+    # Charts are rendered again once resizing has paused this long
+    GRAPH_RESIZE_MS = 200
+    # Chart type and title of the graphs on the statistics page
+    GRAPHS = {1: ("bars", "Keyword Count {}"),
+              2: ("bars", "Employee Issue Count {}"),
+              3: ("pie", "Keyword Density {}"),
+              4: ("stacked", "Keyword Count over the Years"),
+              5: ("heatmap", "Issues per Payperiod"),
+              6: ("top", "Top {} Employees over the Years")}
+    # Builds and connects each content view, see view()
+    VIEW_SETUP = ("setup_upload", "setup_search", "setup_keywords", "setup_graphics", "setup_details")
+
+    def __init__(self, *args, server=None, db_file=DB_FILE, **kwargs):
         super().__init__(*args,**kwargs)
         self.title("Union Grievance Tracker")
         self.geometry("800x600")
@@ -38,213 +65,496 @@ class Application(tk.Tk):
         for cnt,but in enumerate(self.mv.nav_view.buttons):
             but.configure(command=lambda cnt=cnt: self.change_frame(cnt))
 
+        self.search_after = None
+        self.search_incremental = False
+        self.searchterm = ''
+        self.search_page = 0
+        self.search_total = 0
+        self.all_keywords = None
+        self.graph = None
+        self.graph_after = None
+        # Data version of the last chart query, keys the chart cache
+        self.data_version = None
+        self.text_indexer = None
+
+        # Connect to the database, or to the archive server at `server`
+        if server:
+            from . import remote
+            self.db = remote.RemoteDatabase(server)
+        else:
+            self.db = database.Database(db_file)
+
+        # Database and file work runs on worker threads
+        self.worker = worker.Worker(self, on_busy=self.mv.status_view.show_tasks)
+        self.mv.status_view.but_cancel.configure(command=self.worker.cancel_all)
+        self.protocol("WM_DELETE_WINDOW", self.quit)
+        self.search_task = None
+        self.details_task = None
+        self.graph_task = None
+
+        # Only the upload page is built now, the others on first navigation
+        self.change_frame(0)
+
+    def view(self, view_no):
+        """Returns content view `view_no`. A view is built and connected to
+        the application the first time it is needed."""
+        view = self.mv.content_view.get(view_no)
+        if view is None:
+            view = self.mv.build_view(view_no)
+            getattr(self, self.VIEW_SETUP[view_no])(view)
+        return view
+
+    def setup_upload(self, view):
         # Connect filedialog to button
-        self.mv.content_view[0].but_get_filename.configure(command=self.click_select_file)
+        view.but_get_filename.configure(command=self.click_select_file)
 
         # Connect upload function to button
-        self.mv.content_view[0].but_upload_file.configure(command=self.click_upload_file)
+        view.but_upload_file.configure(command=self.click_upload_file)
 
+    def setup_search(self, view):
         # Connect search function to button
-        self.mv.content_view[1].but_search.configure(command=self.click_search)
-        
+        view.but_search.configure(command=self.click_search)
+        view.but_prev.configure(command=lambda: self.show_search_page(self.search_page-1))
+        view.but_next.configure(command=lambda: self.show_search_page(self.search_page+1))
+        view.but_show.configure(command=self.show_selected_details)
+        view.but_del.configure(command=self.delete_selected_entry)
+        view.tree_res.bind("<Double-1>", lambda event: self.show_selected_details())
+        view.but_tag.configure(command=lambda: self.tag_selected(remove=False))
+        view.but_untag.configure(command=lambda: self.tag_selected(remove=True))
+        view.inp_search.bind("<KeyRelease>", self.schedule_incremental_search)
+        view.inp_search.bind("<Return>", lambda event: self.click_search())
+        self.update_keywords()
+
+    def setup_keywords(self, view):
         # Connect keyword add function to button
-        self.mv.content_view[2].but_keyword.configure(command=self.click_keyword_add)
+        view.but_keyword.configure(command=self.click_keyword_add)
+        view.lst_keywords.on_delete = self.delete_keyword
+        self.update_keywords()
+
+    def setup_graphics(self, view):
+        # matplotlib is only imported once the statistics page is opened
+        from . import graphs as g
 
-        # Connect to the database
-        self.db = database.Database('grievance_tracker/data.db')
-        
         # Configure graph window
         self.var_radio_graph = tk.IntVar(value=1)
         graphs=[("Keyword Count by Year",1),
                 ("Employee Issue Count by Year",2),
-                ("Keyword Density",3)]
+                ("Keyword Density",3),
+                ("Keywords over the Years",4),
+                ("Issues per Payperiod and Year",5),
+                ("Top Employees over the Years",6)]
         for cnt, (key, val) in enumerate(graphs):
-            opt=ttk.Radiobutton(self.mv.content_view[3],
+            opt=ttk.Radiobutton(view,
                     text=key,
                     # padx=20,
                     variable=self.var_radio_graph,
                     command=self.update_graph,value=val)
             opt.grid(row=2+cnt,column=0,padx=(50,5),sticky=tk.W)
-        
-        self.mv.content_view[3].cmb_sel_year.input['values']=self.db.get_years()
-        self.mv.content_view[3].cmb_sel_year.input.configure(postcommand=self.update_graph)
-        self.graph = g.ChartView(self.mv.content_view[3])
-        self.graph.grid(row=10, column=0, columnspan=2, padx=(50,5), sticky=(tk.N+tk.S+tk.E+tk.W))
 
-        self.update_keywords()
+        self.worker.submit(lambda task: self.db.get_years(),
+                on_done=lambda years: view.cmb_sel_year.input.configure(values=years),
+                description="Loading years")
+        view.cmb_sel_year.input.bind("<<ComboboxSelected>>", lambda event: self.update_graph())
+        self.graph = g.ChartView(view)
+        self.graph.grid(row=10, column=0, columnspan=2, padx=(50,5), sticky=(tk.N+tk.S+tk.E+tk.W))
+        self.graph.bind("<Configure>", self.schedule_graph_resize)
         self.update_graph()
 
+    def setup_details(self, view):
+        # The buttons act on the file that is shown when they are clicked
+        view.lst_keywords.on_delete = lambda keyword: self.delete_keyword_from_file(keyword, view.var_filename.get())
+        view.lst_persons.on_delete = lambda person: self.delete_person_from_file(person, view.var_filename.get())
+        if self.all_keywords is None:
+            self.update_keywords()
+
+    def quit(self):
+        # No job may still use a connection once the pool closes them
+        self.worker.shutdown(wait=True)
+        if self.text_indexer is not None:
+            self.text_indexer.abort()
+        self.db.close_all()
+        self.destroy()
+
     def update_graph(self):
-        year = self.mv.content_view[3].var_sel_year.get()
-        keywords = self.db.get_keywords(year)
+        """Shows the selected graph. A graph that has been rendered for the
+        same data and size before is taken from the chart cache, otherwise
+        it is rendered on a worker thread. The cache is keyed by the data
+        version of the last chart query; the worker checks whether the data
+        has changed since and renders the chart again if it has."""
+        from . import graphs as g
         selection = self.var_radio_graph.get()
-        if selection==1:
-            self.graph.draw_bars("Keyword Count {}".format(year), keywords.values(),keywords.keys())
-        elif selection==2:
-            person = self.db.get_person(year)
-            self.graph.draw_bars("Employee Issue Count {}".format(year), person.values(),person.keys())
-        elif selection==3:
-            self.graph.draw_pie("Keyword Density {}".format(year), keywords.values(),keywords.keys(),None,'%1.1f%%')
+        kind, title = self.GRAPHS[selection]
+        # The charts over all years do not depend on the selected year
+        year = None if kind in g.TREND_CHARTS else self.view(3).var_sel_year.get()
+        width, height = self.graph.size()
+        key = (selection, year, width, height)
+        if self.graph_task:
+            self.graph_task.cancel()
+            self.graph_task = None
+        known = self.data_version
+        cached = self.graph.show_cached(key + (known,))
+        def render(task):
+            version = self.db.data_version()
+            if cached and version == known:
+                return version, None
+            if kind in g.TREND_CHARTS:
+                load = {"stacked": self.db.keyword_counts_by_year,
+                        "heatmap": self.db.payperiod_counts_by_year,
+                        "top": self.db.person_counts_by_year}[kind]
+                rows = load()
+                task.check()
+                return version, g.render_trend(kind, title.format(g.TOP_N), rows, width, height)
+            data = self.db.get_person(year) if selection==2 else self.db.get_keywords(year)
+            task.check()
+            return version, g.render_chart(kind, title.format(year), data.values(), data.keys(), width, height)
+        self.graph_task = self.worker.submit(render,
+                on_done=lambda res: self.graph_done(key, *res),
+                description="Drawing graph")
+
+    def graph_done(self, key, version, png):
+        self.data_version = version
+        if png is not None:
+            self.graph.show_png(key + (version,), png)
+
+    def schedule_graph_resize(self, event):
+        if self.graph_after:
+            self.after_cancel(self.graph_after)
+        self.graph_after = self.after(self.GRAPH_RESIZE_MS, self.graph_resized)
+
+    def graph_resized(self):
+        self.graph_after = None
+        self.update_graph()
 
 
     def update_keywords(self):
-        self.all_keywords = self.db.list_keywords()
-        self.mv.content_view[2].show_keywords(list(self.all_keywords["keyword"]))
-
-        for cnt,keyword,but_del,label in self.mv.content_view[2].keywords_list:
-            but_del.configure(command=lambda cnt=cnt: self.delete_keyword(cnt))
+        self.worker.submit(lambda task: self.db.list_keywords(),
+                on_done=self.update_keywords_done,
+                description="Loading keywords")
+
+    def update_keywords_done(self, all_keywords):
+        self.all_keywords = all_keywords
+        keywords = list(self.all_keywords["keyword"])
+        # Views that have not been built yet get the keywords when they are
+        if 1 in self.mv.content_view:
+            self.mv.content_view[1].cmb_tag_keyword.configure(values=keywords)
+        if 2 in self.mv.content_view:
+            self.mv.content_view[2].show_keywords(keywords)
+        if 4 in self.mv.content_view:
+            self.mv.content_view[4].cmb_keywords.configure(values=keywords)
+
+    def keyword_names(self):
+        """Returns the known keywords, none while they are still loading."""
+        return [] if self.all_keywords is None else list(self.all_keywords["keyword"])
 
 
     def change_frame(self,frm_no):
-        for frm in self.mv.content_view:
+        view = self.view(frm_no)
+        for frm in self.mv.content_view.values():
             frm.grid_forget()
-        self.mv.content_view[frm_no].grid(row=1,column=1,sticky=(tk.N+tk.E+tk.S+tk.W))
+        view.grid(row=1,column=1,sticky=(tk.N+tk.E+tk.S+tk.W))
 
     def click_select_file(self):
         filename = filedialog.askopenfilename(title="Select file to add to the database...")       
         if filename:
             self.upload_filename_dir, self.upload_filename = filename.rsplit("/",1)
             print(self.upload_filename_dir)
-            self.mv.content_view[0].var_filename.set(self.upload_filename)
+            self.view(0).var_filename.set(self.upload_filename)
 
 
     def click_upload_file(self):
         fields = {}
-        # fields["serial_no"] = self.mv.content_view[0].inp_serialno.get()
-        fields["filename"] = self.mv.content_view[0].inp_filename.get()
-        fields["location"] = self.mv.content_view[0].inp_location.get()
-        fields["year"] = self.mv.content_view[0].inp_year.get()
-        fields["payperiod"] = self.mv.content_view[0].inp_payperiod.get()
+        # fields["serial_no"] = self.view(0).inp_serialno.get()
+        fields["filename"] = self.view(0).inp_filename.get()
+        fields["location"] = self.view(0).inp_location.get()
+        fields["year"] = self.view(0).inp_year.get()
+        fields["payperiod"] = self.view(0).inp_payperiod.get()
 
         if '' in fields.values():
             ans = messagebox.showwarning("Please fill all data","All information needs to be filled. Please enter missing values.")
         else:
-            serial = str(fields["year"]) + "{:04d}".format(1+self.db.get_latest_id())
-            new_filename = serial + " " + self.upload_filename
-            shutil.copyfile(self.upload_filename_dir + "/" + self.upload_filename, self.upload_dir + new_filename)
-            res = self.db.file_to_db(new_filename,fields)
-            if res < 0:
-                messagebox.showarning("Upload failed","File '{}' could not be stored in database".format(new_filename))
-            else:
-                messagebox.showinfo("Success","File '{}' has been stored to database successfully. Go to 'Search' to find and modify the record.".format(new_filename))
+            source = self.upload_filename_dir + "/" + self.upload_filename
+            upload_filename = self.upload_filename
+            upload = lambda task: self.db.upload_file(self.upload_dir, source, fields, task, upload_filename)
+            self.worker.submit(upload,
+                    on_done=self.upload_done,
+                    on_error=lambda e: messagebox.showwarning("Upload failed","File '{}' could not be uploaded: {}".format(upload_filename, e)),
+                    on_progress=self.mv.status_view.show_progress,
+                    description="Uploading {}".format(upload_filename))
+
+    def upload_done(self, result):
+        new_filename, res = result
+        if res < 0:
+            messagebox.showwarning("Upload failed","File '{}' could not be stored in database".format(new_filename))
+        else:
+            self.index_text([new_filename])
+            messagebox.showinfo("Success","File '{}' has been stored to database successfully. Go to 'Search' to find and modify the record.".format(new_filename))
+
+    def index_text(self, filenames):
+        """Extracts the text of uploaded files for the search, in worker
+        processes. The archive server indexes its own files."""
+        if not isinstance(self.db, database.Database):
+            return
+        if self.text_indexer is None:
+            from . import extract
+            self.text_indexer = extract.TextIndexer(self.db, self.upload_dir)
+        indexer = self.text_indexer
+        self.worker.submit(lambda task: indexer.submit(filenames) or indexer.flush(),
+                description="Indexing text of {} files".format(len(filenames)))
 
 
     def click_search(self):
-        searchterm = self.mv.content_view[1].inp_search.get()
+        if self.search_after:
+            self.after_cancel(self.search_after)
+            self.search_after = None
+        searchterm = self.view(1).inp_search.get()
         print("Searching for {}...".format(searchterm))
-        filename_location = self.db.get_filenames_locations()
-        # print([any(filename_location[col].str.contains(searchterm)) for col in filename_location])
-        # print(filename_location)
-        if len(filename_location) == 0:
-            messagebox.showwarning("No results found","No data found.")
-            return
-        try:
-            result = set(filename_location.loc[[any(filename_location.loc[row].str.contains(searchterm)) for row in filename_location.index],0].values)
-        except KeyError:
+        page_size = self.view(1).PAGE_SIZE
+        if self.search_task:
+            self.search_task.cancel()
+        self.search_task = self.worker.submit(
+                lambda task: (self.db.search_count(searchterm), self.db.search(searchterm, page_size, 0)),
+                on_done=lambda res: self.search_done(searchterm, *res),
+                description="Searching for '{}'".format(searchterm))
+
+        self.view(1).var_searchterm.set('')
+
+    def search_done(self, searchterm, total, result):
+        if total == 0:
             messagebox.showwarning("No results found","No results found for searchterm '{}'.".format(searchterm))
             return
 
-        self.mv.content_view[1].show_results(result)
+        self.searchterm = searchterm
+        self.search_incremental = False
+        self.search_total = total
+        self.search_page = 0
+        self.view(1).show_results(result, 0, total)
 
-        for cnt,filename,but_show,but_del,label in self.mv.content_view[1].search_result_list:
-            but_show.configure(command=lambda cnt=cnt: self.show_details(cnt))
-            but_del.configure(command=lambda cnt=cnt: self.delete_entry(cnt))
+    def schedule_incremental_search(self, event):
+        """Restarts the debounce timer on every keystroke in the search box."""
+        if event.keysym in ("Return", "KP_Enter"):
+            return
+        if self.search_after:
+            self.after_cancel(self.search_after)
+        self.search_after = self.after(self.SEARCH_DEBOUNCE_MS, self.incremental_search)
+
+    def incremental_search(self):
+        """Searches for the text typed so far, once typing has paused.
+        A newer search cancels one that has not finished yet, which
+        interrupts its query."""
+        self.search_after = None
+        searchterm = self.view(1).var_searchterm.get()
+        if self.search_incremental and searchterm == self.searchterm:
+            return
+        if self.search_task:
+            self.search_task.cancel()
+            self.search_task = None
+        page_size = self.view(1).PAGE_SIZE
+        self.search_task = self.worker.submit(
+                lambda task: self.db.prefix_search(searchterm, page_size, 0, task),
+                on_done=lambda res: self.incremental_search_done(searchterm, *res),
+                description="Searching for '{}'".format(searchterm))
+
+    def incremental_search_done(self, searchterm, total, result):
+        self.searchterm = searchterm
+        self.search_incremental = True
+        self.search_total = total
+        self.search_page = 0
+        self.view(1).show_results(result, 0, total)
+
+    def show_search_page(self,page):
+        """Fetches and shows only page `page` of the current search."""
+        page_size = self.view(1).PAGE_SIZE
+        searchterm, total = self.searchterm, self.search_total
+        if self.search_incremental:
+            fetch = lambda task: self.db.prefix_search(searchterm, page_size, page*page_size, task)[1]
+        else:
+            fetch = lambda task: self.db.search(searchterm, page_size, page*page_size)
+        if self.search_task:
+            self.search_task.cancel()
+        self.search_task = self.worker.submit(fetch,
+                on_done=lambda result: self.show_search_result(page, result, total),
+                description="Searching for '{}'".format(searchterm))
+
+    def show_search_result(self, page, result, total):
+        self.search_page = page
+        self.view(1).show_results(result, page, total)
+
+    def show_selected_details(self):
+        filename = self.view(1).selected_result()
+        if filename:
+            self.show_details(filename)
+
+    def tag_selected(self, remove):
+        """Adds the keyword and person entered below the results to all
+        selected files, or removes them, in one transaction."""
+        filenames = self.view(1).selected_results()
+        keyword = self.view(1).var_tag_keyword.get().strip()
+        person = self.view(1).var_tag_person.get().strip()
+        if not filenames:
+            messagebox.showwarning("No files selected","Please select the files to tag in the search results.")
+            return
+        if not keyword and not person:
+            messagebox.showwarning("Nothing to tag","Please enter a keyword or a person.")
+            return
+        if keyword and not remove and keyword not in self.keyword_names():
+            messagebox.showwarning("Unknown keyword","Keyword '{}' does not exist. Please add it on the keywords page first.".format(keyword))
+            return
+        keywords = [keyword] if keyword else []
+        persons = [person] if person else []
+        self.worker.submit(lambda task: self.db.tag_files(filenames, keywords, persons, remove),
+                on_done=lambda count: self.tag_done(count, len(filenames), remove),
+                description="Tagging {} files".format(len(filenames)))
+
+    def tag_done(self, count, files, remove):
+        if count < 0:
+            messagebox.showwarning("Tagging failed","The selected files could not be tagged.")
+            return
+        self.view(1).var_tag_person.set('')
+        if remove:
+            messagebox.showinfo("Tags removed","{} tags removed from {} files.".format(count, files))
+        else:
+            messagebox.showinfo("Files tagged","{} tags added to {} files.".format(count, files))
 
-        self.mv.content_view[1].var_searchterm.set('')
+    def delete_selected_entry(self):
+        filename = self.view(1).selected_result()
+        if filename:
+            self.delete_entry(filename)
 
 
     def click_keyword_add(self):
-        keyword = self.mv.content_view[2].inp_keyword.get()
-        id_no = self.db.add_keyword(keyword)
-        self.update_keywords()
-        self.mv.content_view[2].var_keyword.set('')
+        keyword = self.view(2).inp_keyword.get()
+        self.worker.submit(lambda task: self.db.add_keyword(keyword),
+                on_done=lambda id_no: self.update_keywords(),
+                description="Adding keyword {}".format(keyword))
+        self.view(2).var_keyword.set('')
 
-    def delete_entry(self,cnt):
-        filename = self.mv.content_view[1].search_result_list[cnt][1]
+    def delete_entry(self,filename):
         print(filename,"will be deleted.")
-        self.db.delete_file(self.upload_dir,filename)
-        for item in self.mv.content_view[1].search_result_list[cnt][2:]:
-            item.destroy()
-
-    def delete_keyword(self,cnt):
-        keyword = self.mv.content_view[2].keywords_list[cnt][1]
+        searchterm, incremental = self.searchterm, self.search_incremental
+        def delete(task):
+            self.db.delete_file(self.upload_dir,filename)
+            # Refill the page, the following results move up by one
+            if incremental:
+                return self.db.prefix_search(searchterm, 0)[0]
+            return self.db.search_count(searchterm)
+        self.worker.submit(delete,
+                on_done=lambda total: self.delete_entry_done(filename, total),
+                description="Deleting {}".format(filename))
+
+    def delete_entry_done(self, filename, total):
+        self.view(1).remove_result(filename)
+        self.search_total = total
+        page_size = self.view(1).PAGE_SIZE
+        self.show_search_page(min(self.search_page, max(0, self.search_total-1) // page_size))
+
+    def delete_keyword(self,keyword):
         print(keyword,"will be deleted.")
-        ret = self.db.delete_keyword(keyword)
+        self.worker.submit(lambda task: self.db.delete_keyword(keyword),
+                on_done=lambda ret: self.delete_keyword_done(keyword, ret),
+                description="Deleting keyword {}".format(keyword))
+
+    def delete_keyword_done(self, keyword, ret):
         if ret != -1:
-            for item in self.mv.content_view[2].keywords_list[cnt][2:]:
-                item.destroy()
+            self.update_keywords()
         else:
             messagebox.showwarning("Keyword cannot be deleted","Keyword '{}' is in use and cannot be deleted. Please delete the keyword from all files, first.".format(keyword))
 
-    def show_details(self,cnt):
-        filename = self.mv.content_view[1].search_result_list[cnt][1]
-        location = self.db.get_location(filename)
+    def show_details(self,filename):
         self.change_frame(4)
-        self.mv.content_view[4].var_filename.set(filename)
-        self.mv.content_view[4].var_location.set(location)
-        self.mv.content_view[4].but_open_file.configure(command=lambda filename=filename: self.open_file(filename))
-        self.mv.content_view[4].but_upd_location.configure(command=self.upd_location)
+        self.view(4).var_filename.set(filename)
+        if self.details_task:
+            self.details_task.cancel()
+        self.details_task = self.worker.submit(
+                lambda task: (self.db.get_location(filename), self.db.keywords_on_file(filename), self.db.persons_on_file(filename)),
+                on_done=lambda res: self.show_details_done(filename, *res),
+                description="Loading {}".format(filename))
+
+    def show_details_done(self, filename, location, file_keywords, file_persons):
+        self.view(4).var_location.set(location)
+        self.view(4).but_open_file.configure(command=lambda filename=filename: self.open_file(filename))
+        self.view(4).but_upd_location.configure(command=self.upd_location)
        
-        self.file_keywords = self.db.keywords_on_file(filename)
-        self.mv.content_view[4].show_keywords(list(self.file_keywords["keyword"]))
+        self.file_keywords = file_keywords
+        self.view(4).show_keywords(list(self.file_keywords["keyword"]))
 
-        for cnt,keyword,but_del,label in self.mv.content_view[4].keywords_list:
-            but_del.configure(command=lambda cnt=cnt: self.delete_keyword_from_file(cnt,filename))
-        
-        self.mv.content_view[4].cmb_keywords.configure(values=list(self.all_keywords['keyword']))
-        self.mv.content_view[4].but_add_keyword.configure(command=lambda filename=filename: self.add_keyword_to_file(filename))
+        self.view(4).cmb_keywords.configure(values=self.keyword_names())
+        self.view(4).but_add_keyword.configure(command=lambda filename=filename: self.add_keyword_to_file(filename))
 
-        self.file_persons = self.db.persons_on_file(filename)
-        self.mv.content_view[4].show_persons(list(self.file_persons["person"]))
+        self.file_persons = file_persons
+        self.view(4).show_persons(list(self.file_persons["person"]))
 
-        for cnt,person,but_del,label in self.mv.content_view[4].persons_list:
-            but_del.configure(command=lambda cnt=cnt: self.delete_person_from_file(cnt,filename))
-        
-        self.mv.content_view[4].but_add_person.configure(command=lambda filename=filename: self.add_person_to_file(filename))
+        self.view(4).but_add_person.configure(command=lambda filename=filename: self.add_person_to_file(filename))
 
     def open_file(self,filename):
-        os.startfile(self.upload_dir + filename, 'open')
+        # Compressed files are decompressed first, which can take a moment
+        self.worker.submit(lambda task: self.db.file_path(self.upload_dir, filename),
+                on_done=lambda path: self.open_file_done(filename, path),
+                on_error=lambda e: messagebox.showwarning("File could not be opened","File '{}' could not be opened: {}".format(filename, e)),
+                description="Opening {}".format(filename))
+
+    def open_file_done(self, filename, path):
+        try:
+            open_with_default_app(path)
+        except OSError as e:
+            messagebox.showwarning("File could not be opened","File '{}' could not be opened: {}".format(filename, e))
 
 
     def upd_location(self):
-        filename = self.mv.content_view[4].var_filename.get()
-        location = self.mv.content_view[4].var_location.get()
-        res = self.db.update_location(filename, location)
+        filename = self.view(4).var_filename.get()
+        location = self.view(4).var_location.get()
+        self.worker.submit(lambda task: self.db.update_location(filename, location),
+                on_done=lambda res: self.upd_location_done(filename, location, res),
+                description="Updating location of {}".format(filename))
+
+    def upd_location_done(self, filename, location, res):
         if res == -1:
             messagebox.showwarning("Location could not be changed","The location could not be changed as intended")
         elif res == 0:
             messagebox.showinfo("Location updated","The location of '{}' has been updated to '{}' successfully.".format(filename, location))
 
+    def details_shown(self, filename):
+        """True if the details page still shows `filename`."""
+        return self.view(4).var_filename.get() == filename
+
 
     def add_keyword_to_file(self,filename):
-        keyword = self.mv.content_view[4].cmb_keywords.get()
-        if keyword in ([x[1] for x in self.mv.content_view[4].keywords_list]):
+        keyword = self.view(4).cmb_keywords.get()
+        if keyword in self.view(4).lst_keywords.items:
             messagebox.showwarning("Keyword already there","The keyword is already connected to the file")
-        else:
-            self.db.add_keyword_to_file(filename,keyword)
-            self.file_keywords = self.db.keywords_on_file(filename)
-            self.mv.content_view[4].show_keywords(list(self.file_keywords["keyword"]))
-            for cnt,keyword,but_del,label in self.mv.content_view[4].keywords_list:
-                but_del.configure(command=lambda cnt=cnt: self.delete_keyword_from_file(cnt,filename))
+            return
+        def done(res):
+            # Only the new row is added to the list, nothing is queried again
+            if res > 0 and self.details_shown(filename):
+                self.view(4).lst_keywords.add(keyword)
+        self.worker.submit(lambda task: self.db.add_keyword_to_file(filename,keyword),
+                on_done=done,
+                description="Adding {} to {}".format(keyword, filename))
 
 
     def add_person_to_file(self,filename):
-        person = self.mv.content_view[4].var_person.get()
-        self.db.add_person_to_file(filename,person)
-        self.file_persons = self.db.persons_on_file(filename)
-        self.mv.content_view[4].show_persons(list(self.file_persons["person"]))
-        self.mv.content_view[4].var_person.set('')
-
-
-    def delete_keyword_from_file(self,cnt,filename):
-        keyword = self.mv.content_view[4].keywords_list[cnt][1]
-        self.db.delete_keyword_from_file(filename,keyword)
-        self.file_keywords = self.db.keywords_on_file(filename)
-        self.mv.content_view[4].show_keywords(list(self.file_keywords["keyword"]))
-
-
-    def delete_person_from_file(self,cnt,filename):
-        person = self.mv.content_view[4].persons_list[cnt][1]
-        self.db.delete_person_from_file(filename,person)
-        self.file_persons = self.db.persons_on_file(filename)
-        self.mv.content_view[4].show_persons(list(self.file_persons["person"]))
+        person = self.view(4).var_person.get()
+        def done(res):
+            if res > 0 and self.details_shown(filename):
+                self.view(4).lst_persons.add(person)
+        self.worker.submit(lambda task: self.db.add_person_to_file(filename,person),
+                on_done=done,
+                description="Adding {} to {}".format(person, filename))
+        self.view(4).var_person.set('')
+
+
+    def delete_keyword_from_file(self,keyword,filename):
+        def done(res):
+            if self.details_shown(filename):
+                self.view(4).lst_keywords.remove(keyword)
+        self.worker.submit(lambda task: self.db.delete_keyword_from_file(filename,keyword),
+                on_done=done,
+                description="Removing {} from {}".format(keyword, filename))
+
+
+    def delete_person_from_file(self,person,filename):
+        def done(res):
+            if self.details_shown(filename):
+                self.view(4).lst_persons.remove(person)
+        self.worker.submit(lambda task: self.db.delete_person_from_file(filename,person),
+                on_done=done,
+                description="Removing {} from {}".format(person, filename))
@@ -0,0 +1,252 @@
+"""Bulk import of whole directories or manifest CSVs into the archive.
+
+    python -m grievance_tracker.bulk_import DIRECTORY --location Orem --year 2021 --payperiod 3
+    python -m grievance_tracker.bulk_import manifest.csv
+
+The same import is the `import` subcommand of `python -m grievance_tracker`.
+
+A manifest has the columns path, location, year, payperiod, keywords and
+persons. Several keywords or persons are separated by ';'. Relative paths are
+taken relative to the manifest. Rows with a missing path or a year or
+payperiod that is not a number are reported and counted as failed.
+
+Files are copied into the content-addressed store by a thread pool and added to the database in batches, one
+transaction per batch. The next batch is copied while the current one is
+committed. An import is remembered by the directory or manifest it came
+from and the path, modification time and size of every file. Running the
+same command again skips the files imported before, so an interrupted
+import is resumed, but imports a file that has changed since, as a new
+file. A file whose time changed but whose content did not is skipped.
+Importing the same files through another directory or manifest adds them
+again, with that run's fields.
+
+The text of the imported files is extracted in a process pool while the
+import goes on, see extract.py.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import database
+from . import store
+
+DB_FILE = "grievance_tracker/data.db"
+UPLOAD_DIR = "report_files" + os.sep
+BATCH_SIZE = 500
+THREADS = 8
+# Key of an import in tbl_import: origin, path, mtime_ns and size
+SOURCE_FORMAT = "{}|{}#{}:{}"
+
+
+def source_prefix(origin, path):
+    """Returns the start of the keys of all imports of `path` from `origin`."""
+    return "{}|{}#".format(origin, path)
+
+
+def split_list(value):
+    return [x.strip() for x in (value or "").split(";") if x.strip()]
+
+
+def read_manifest(filename):
+    """Yields one job dict per row of the manifest CSV `filename`. A row
+    that cannot be read yields a job with only an "error", which
+    bulk_import counts as failed."""
+    base = os.path.dirname(os.path.abspath(filename))
+    with open(filename, newline="") as fh:
+        reader = csv.DictReader(fh)
+        for row in reader:
+            try:
+                yield {"path": os.path.join(base, row["path"]),
+                       "location": row.get("location", ""),
+                       "year": int(row["year"]),
+                       "payperiod": int(row["payperiod"]),
+                       "keywords": split_list(row.get("keywords")),
+                       "persons": split_list(row.get("persons"))}
+            except KeyError as e:
+                yield {"error": "line {} of {}: no {} column".format(reader.line_num, filename, e)}
+            except (TypeError, ValueError) as e:
+                yield {"error": "line {} of {}: {}".format(reader.line_num, filename, e)}
+
+
+def read_source(source, fields):
+    """Returns the jobs of `source`, a directory whose files all get
+    `fields`, or a manifest CSV. Raises ValueError if a directory is given
+    without a year and payperiod."""
+    if not os.path.isdir(source):
+        return read_manifest(source)
+    if fields.get("year") is None or fields.get("payperiod") is None:
+        raise ValueError("--year and --payperiod are needed to import a directory")
+    return scan_directory(source, fields)
+
+
+def scan_directory(directory, fields):
+    """Yields one job dict per file in `directory`, all with the same `fields`."""
+    with os.scandir(directory) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            if entry.is_file() and not entry.name.startswith("."):
+                job = dict(fields)
+                job["path"] = os.path.abspath(entry.path)
+                yield job
+
+
+def batches(jobs, size):
+    batch = []
+    for job in jobs:
+        batch.append(job)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_job(db, job, upload_dir):
+    # The blob's path replaces the job's path, src stays
+    job.update(store.put_file(db, upload_dir, job["src"]))
+    return job
+
+
+def bulk_import(db, jobs, upload_dir=UPLOAD_DIR, batch_size=BATCH_SIZE, threads=THREADS, report=print,
+                text=True, indexer=None, resume=True, origin=""):
+    """Copies and adds all `jobs` to `db`. With `text`, the text of the
+    added files is extracted on `indexer`, an extract.TextIndexer, or on
+    one made for this import. With `resume`, files imported from `origin`
+    before are skipped unless they changed, see the module docstring;
+    without, every job is added.
+    Returns a dict with the number of imported, skipped and failed files,
+    the elapsed time and the files per second."""
+    own_indexer = text and indexer is None
+    if own_indexer:
+        from . import extract
+        indexer = extract.TextIndexer(db, upload_dir)
+    done = db.imported_sources() if resume else set()
+    stats = {"imported": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+
+    def unchanged(job):
+        # Only touched since the last import from origin: remembered under
+        # the new key as well, so the file is not hashed again next time
+        previous = db.last_import(source_prefix(origin, job["src"]))
+        if previous is None or previous[1] is None or previous[1] != store.hash_file(job["src"]):
+            return False
+        db.remember_import(job["source"], previous[0])
+        return True
+
+    def named(jobs):
+        # The serial numbers are reserved by files_to_db, one block per year and batch
+        for job in jobs:
+            if "error" in job:
+                print("Skipping", job["error"])
+                stats["failed"] += 1
+                continue
+            job["src"] = os.path.abspath(job["path"])
+            try:
+                stat = os.stat(job["src"])
+            except OSError as e:
+                print("Cannot read file:", e)
+                stats["failed"] += 1
+                continue
+            job["source"] = SOURCE_FORMAT.format(origin, job["src"], stat.st_mtime_ns, stat.st_size)
+            if job["source"] in done or (resume and unchanged(job)):
+                stats["skipped"] += 1
+                continue
+            job["name"] = os.path.basename(job["path"])
+            yield job
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = None
+        for batch in batches(named(jobs), batch_size):
+            copies = [pool.submit(copy_job, db, job, upload_dir) for job in batch]
+            if pending:
+                added = commit_batch(db, pending, upload_dir, stats)
+                if text and added:
+                    indexer.submit(added)
+                elapsed = time.perf_counter() - start
+                report("{imported} files imported, {skipped} skipped, {failed} failed".format(**stats)
+                        + " ({:.1f} files/s)".format(stats["imported"] / elapsed))
+            pending = copies
+        if pending:
+            added = commit_batch(db, pending, upload_dir, stats)
+            if text and added:
+                indexer.submit(added)
+    if own_indexer:
+        indexer.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["files_per_second"] = stats["imported"] / stats["seconds"] if stats["seconds"] else 0
+    report("{imported} files imported, {skipped} skipped, {failed} failed".format(**stats)
+            + " in {seconds:.1f} s ({files_per_second:.1f} files/s)".format(**stats))
+    return stats
+
+
+def commit_batch(db, copies, upload_dir, stats):
+    """Adds the copied files in one transaction. Returns their filenames,
+    or an empty list if the batch failed. Files whose stored content was
+    deleted after it was found are stored again and added once more."""
+    rows = []
+    for future in copies:
+        try:
+            rows.append(future.result())
+        except OSError as e:
+            print("Cannot copy file:", e)
+            stats["failed"] += 1
+    added = []
+    for attempt in (0, 1):
+        if not rows:
+            break
+        if db.files_to_db(rows, upload_dir) < 0:
+            stats["failed"] += len(rows)
+            break
+        added += [row["filename"] for row in rows if not row.get("blob_missing")]
+        gone = [row for row in rows if row.pop("blob_missing", False)]
+        if attempt:
+            stats["failed"] += len(gone)
+            break
+        # Their content was deleted after put_file found it, it is stored again
+        rows = []
+        for row in gone:
+            try:
+                rows.append(copy_job(db, row, upload_dir))
+            except OSError as e:
+                print("Cannot copy file:", e)
+                stats["failed"] += 1
+    stats["imported"] += len(added)
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a directory or manifest CSV of grievance files.")
+    parser.add_argument("source", help="directory of files or manifest CSV")
+    parser.add_argument("--location", default="")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--payperiod", type=int)
+    parser.add_argument("--keywords", default="", help="';' separated keywords for all files of a directory")
+    parser.add_argument("--persons", default="", help="';' separated persons for all files of a directory")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--upload-dir", default=UPLOAD_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=THREADS)
+    parser.add_argument("--no-text", action="store_true", help="do not extract the text of the files")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = read_source(args.source, {"location": args.location,
+                                         "year": args.year,
+                                         "payperiod": args.payperiod,
+                                         "keywords": split_list(args.keywords),
+                                         "persons": split_list(args.persons)})
+    except ValueError as e:
+        parser.error(str(e))
+
+    upload_dir = os.path.join(args.upload_dir, "")
+    db = database.Database(args.db)
+    stats = bulk_import(db, jobs, upload_dir, args.batch_size, args.threads, text=not args.no_text,
+                        origin=os.path.abspath(args.source))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
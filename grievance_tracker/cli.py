@@ -0,0 +1,271 @@
+"""Command line interface to the archive, without Tk.
+
+    python -m grievance_tracker upload FILE... --location Orem --year 2021 --payperiod 3
+    python -m grievance_tracker import DIRECTORY --location Orem --year 2021 --payperiod 3
+    python -m grievance_tracker import manifest.csv
+    python -m grievance_tracker search TERM
+    python -m grievance_tracker tag FILENAME... --keyword Safety --person "Jane Doe"
+    python -m grievance_tracker stats --year 2021 [--chart stats.png]
+    python -m grievance_tracker export TERM --output results.csv [--from-year 2020] [--to-year 2022]
+    python -m grievance_tracker export --stats --output stats.parquet
+    python -m grievance_tracker serve --port 8750
+    python -m grievance_tracker reindex [--processes 4] [--all]
+    python -m grievance_tracker watch INBOX [--interval 5] [--location Orem]
+    python -m grievance_tracker verify [--hash] [--repair]
+
+Only the modules a subcommand needs are imported; pandas, numpy and
+matplotlib are never loaded at startup.
+"""
+import argparse
+import os
+import sys
+
+from . import database
+
+DB_FILE = "grievance_tracker/data.db"
+UPLOAD_DIR = "report_files" + os.sep
+
+
+def cmd_upload(db, args):
+    from . import bulk_import
+    fields = {"location": args.location,
+              "year": args.year,
+              "payperiod": args.payperiod,
+              "keywords": bulk_import.split_list(args.keywords),
+              "persons": bulk_import.split_list(args.persons)}
+    jobs = [dict(fields, path=path) for path in args.files]
+    # Files named explicitly are always added, even if they were imported before
+    stats = bulk_import.bulk_import(db, jobs, os.path.join(args.upload_dir, ""), report=lambda msg: None,
+                                    text=not args.no_text, resume=False)
+    print("{imported} files uploaded, {failed} failed.".format(**stats))
+    return 1 if stats["failed"] else 0
+
+
+def cmd_import(db, args):
+    from . import bulk_import
+    try:
+        jobs = bulk_import.read_source(args.source, {"location": args.location,
+                                                     "year": args.year,
+                                                     "payperiod": args.payperiod,
+                                                     "keywords": bulk_import.split_list(args.keywords),
+                                                     "persons": bulk_import.split_list(args.persons)})
+    except ValueError as e:
+        print(e)
+        return 1
+    # Running the same import again resumes it, see bulk_import
+    stats = bulk_import.bulk_import(db, jobs, os.path.join(args.upload_dir, ""), args.batch_size, args.threads,
+                                    text=not args.no_text, origin=os.path.abspath(args.source))
+    return 1 if stats["failed"] else 0
+
+
+def cmd_search(db, args):
+    for filename in db.search(args.term, args.limit):
+        print(filename)
+    return 0
+
+
+def cmd_tag(db, args):
+    missing = [filename for filename in args.filenames if not db.is_file_in_db(filename)]
+    for filename in missing:
+        print("File {} is not in the database.".format(filename))
+    if missing:
+        return 1
+    count = db.tag_files(args.filenames, args.keyword, args.person, remove=args.remove)
+    if count < 0:
+        return 1
+    print("{} tags {} {} files.".format(count, "removed from" if args.remove else "added to", len(args.filenames)))
+    return 0
+
+
+def cmd_stats(db, args):
+    if args.year is None:
+        for (year,) in sorted(db.get_years()):
+            print(year)
+        return 0
+    keywords = db.get_keywords(args.year)
+    persons = db.get_person(args.year)
+    print("Keyword Count {}".format(args.year))
+    for keyword, count in sorted(keywords.items(), key=lambda x: -x[1]):
+        print("  {:<30}{:>6}".format(keyword, count))
+    print("Employee Issue Count {}".format(args.year))
+    for person, count in sorted(persons.items(), key=lambda x: -x[1]):
+        print("  {:<30}{:>6}".format(person, count))
+    if args.chart:
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=(6, 8), dpi=100)
+        axes = figure.add_subplot(2, 1, 1)
+        axes.set_title("Keyword Count {}".format(args.year))
+        axes.bar(list(keywords.keys()), list(keywords.values()))
+        axes = figure.add_subplot(2, 1, 2)
+        axes.set_title("Employee Issue Count {}".format(args.year))
+        axes.bar(list(persons.keys()), list(persons.values()))
+        figure.tight_layout()
+        figure.savefig(args.chart)
+    return 0
+
+
+def cmd_export(db, args):
+    from . import export
+    if args.stats:
+        chunks, fields = db.iter_year_stats(args.from_year, args.to_year), export.STAT_FIELDS
+    else:
+        chunks, fields = db.iter_records(args.term, args.from_year, args.to_year), export.RECORD_FIELDS
+    fmt = args.format or export.format_of(args.output)
+    if fmt == "parquet":
+        try:
+            import pyarrow
+        except ImportError:
+            print("Parquet export needs pyarrow: pip install pyarrow", file=sys.stderr)
+            return 1
+    count = export.export(chunks, fields, args.output, fmt)
+    if args.output:
+        print("{} rows exported to {}.".format(count, args.output))
+    return 0
+
+
+def cmd_serve(db, args):
+    import asyncio
+    from . import server
+    try:
+        asyncio.run(server.serve(db, os.path.join(args.upload_dir, ""), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_reindex(db, args):
+    from . import extract
+    if args.all:
+        db.drop_texts()
+    try:
+        stats = extract.reindex(db, os.path.join(args.upload_dir, ""), args.processes)
+    except KeyboardInterrupt:
+        print("Interrupted, run reindex again to continue.")
+        return 1
+    print("Text of {extracted} files indexed, {skipped} left for later, in {seconds:.1f} s ({files_per_second:.1f} files/s).".format(**stats))
+    return 0
+
+
+def cmd_watch(db, args):
+    from . import ingest
+    patterns = args.pattern or ingest.PATTERNS
+    defaults = {"location": args.location, "year": args.year, "payperiod": args.payperiod}
+    ingest.watch(db, args.inbox, os.path.join(args.upload_dir, ""), patterns, defaults, args.interval,
+                 args.settle, args.once, text=not args.no_text)
+    return 0
+
+
+def cmd_verify(db, args):
+    from . import verify
+    upload_dir = os.path.join(args.upload_dir, "")
+    if not os.path.isdir(upload_dir):
+        print("{} is not a directory.".format(args.upload_dir))
+        return 1
+    result = verify.verify(db, upload_dir, args.hash, args.threads)
+    verify.print_result(result)
+    if args.repair:
+        return 1 if verify.repair(db, upload_dir, result) else 0
+    return 1 if verify.problems(result) else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="grievance_tracker", description="Union Grievance Tracker")
+    parser.add_argument("--db", default=DB_FILE, help="database file (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("upload", help="copy files into the archive and add them to the database")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--location", required=True)
+    p.add_argument("--year", type=int, required=True)
+    p.add_argument("--payperiod", type=int, required=True)
+    p.add_argument("--keywords", default="", help="';' separated keywords")
+    p.add_argument("--persons", default="", help="';' separated persons")
+    p.add_argument("--upload-dir", default=UPLOAD_DIR)
+    p.add_argument("--no-text", action="store_true", help="do not extract the text of the files")
+    p.set_defaults(func=cmd_upload)
+
+    p = sub.add_parser("import", help="import a directory of files or a manifest CSV, resuming an earlier import")
+    p.add_argument("source", help="directory of files or manifest CSV")
+    p.add_argument("--location", default="")
+    p.add_argument("--year", type=int)
+    p.add_argument("--payperiod", type=int)
+    p.add_argument("--keywords", default="", help="';' separated keywords for all files of a directory")
+    p.add_argument("--persons", default="", help="';' separated persons for all files of a directory")
+    p.add_argument("--upload-dir", default=UPLOAD_DIR)
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--no-text", action="store_true", help="do not extract the text of the files")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("search", help="list files matching a search term")
+    p.add_argument("term", nargs="?", default="")
+    p.add_argument("--limit", type=int)
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("tag", help="add or remove keywords and persons of files")
+    p.add_argument("filenames", nargs="+", metavar="filename")
+    p.add_argument("--keyword", action="append", default=[])
+    p.add_argument("--person", action="append", default=[])
+    p.add_argument("--remove", action="store_true", help="remove the given tags instead of adding them")
+    p.set_defaults(func=cmd_tag)
+
+    p = sub.add_parser("stats", help="keyword and employee counts of a year")
+    p.add_argument("--year", type=int, help="without a year, the years in the database are listed")
+    p.add_argument("--chart", help="also save the counts as a bar chart image")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("export", help="write the files matching a search term, or the yearly counts, to a file")
+    p.add_argument("term", nargs="?", default="")
+    p.add_argument("--output", help="output file (default: stdout)")
+    p.add_argument("--format", choices=["csv", "jsonl", "parquet"],
+                   help="default: from the extension of --output, else csv")
+    p.add_argument("--from-year", type=int)
+    p.add_argument("--to-year", type=int)
+    p.add_argument("--stats", action="store_true", help="export the yearly keyword, employee and payperiod counts")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("serve", help="share the archive with other users over HTTP")
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    p.add_argument("--port", type=int, default=8750)
+    p.add_argument("--upload-dir", default=UPLOAD_DIR)
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("reindex", help="extract the text of stored files for the search")
+    p.add_argument("--processes", type=int, help="worker processes (default: one per core)")
+    p.add_argument("--all", action="store_true", help="extract the text of all files again")
+    p.add_argument("--upload-dir", default=UPLOAD_DIR)
+    p.set_defaults(func=cmd_reindex)
+
+    p = sub.add_parser("watch", help="import the files put into an inbox folder as they arrive")
+    p.add_argument("inbox")
+    p.add_argument("--interval", type=float, default=5.0, help="seconds between scans (default: %(default)s)")
+    p.add_argument("--settle", type=float, default=2.0,
+                   help="seconds a file must be unchanged before it is imported (default: %(default)s)")
+    p.add_argument("--pattern", action="append",
+                   help="regular expression with groups location, year and payperiod matched against the path"
+                        " in the inbox; replaces the built-in ones")
+    p.add_argument("--location", help="location of files without one in their path")
+    p.add_argument("--year", type=int, help="year of files without one in their path")
+    p.add_argument("--payperiod", type=int, help="payperiod of files without one in their path")
+    p.add_argument("--once", action="store_true", help="scan once and exit")
+    p.add_argument("--upload-dir", default=UPLOAD_DIR)
+    p.add_argument("--no-text", action="store_true", help="do not extract the text of the files")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("verify", help="check that the stored files and the database agree")
+    p.add_argument("--hash", action="store_true", help="also check the SHA-256 of every stored file")
+    p.add_argument("--repair", action="store_true",
+                   help="delete rows of missing files and orphaned rows, move orphaned files to orphans/")
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--upload-dir", default=UPLOAD_DIR)
+    p.set_defaults(func=cmd_verify)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = database.Database(args.db)
+    return args.func(db, args)
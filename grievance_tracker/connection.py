@@ -0,0 +1,90 @@
+"""SQLite connections, one per thread, all set up the same way.
+
+Every connection runs in WAL mode, so readers work on a snapshot and never
+wait for the writer, and the writer never waits for readers. The remaining
+pragmas trade a little durability for speed and can be tuned per pool:
+
+    synchronous   NORMAL only syncs at checkpoints. A power cut can lose the
+                  last commits, but never corrupts the database.
+    cache_size    page cache per connection, negative values are KiB
+    mmap_size     bytes of the file read through memory mapping
+    temp_store    MEMORY keeps sort and temp tables off the disk
+"""
+import sqlite3
+import threading
+from sqlite3 import Error
+
+# Number of compiled statements sqlite3 keeps per connection. All queries use
+# bound parameters, so the SQL text of each call site is constant and the hot
+# lookups are parsed and planned only once per connection.
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+# Seconds a connection waits for another process to finish writing
+BUSY_TIMEOUT = 10.0
+
+
+class ConnectionPool:
+    """Hands every thread its own connection to `filename`, opened on first
+    use and set up with `pragmas` (see PRAGMAS)."""
+
+    def __init__(self, filename, pragmas=None, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE):
+        self.filename = filename
+        self.pragmas = dict(PRAGMAS, **(pragmas or {}))
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """Opens a new connection with the pool's pragmas."""
+        # check_same_thread is off so close_all can close the connections of
+        # other threads; during use every connection stays on its own thread.
+        conn = sqlite3.connect(self.filename, timeout=self.timeout,
+                               cached_statements=self.cached_statements, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            try:
+                conn.execute("PRAGMA {}={}".format(name, value))
+            except Error as e:
+                print("Cannot set PRAGMA {}:".format(name), e)
+        return conn
+
+    def connection(self):
+        """Returns the calling thread's connection."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None or conn not in self.connections:
+            # First use on this thread, or close_all closed it
+            conn = self.local.conn = self.connect()
+            with self.lock:
+                self.connections.add(conn)
+        return conn
+
+    def settings(self):
+        """Returns the pragmas as the calling thread's connection reports them."""
+        conn = self.connection()
+        return {name: conn.execute("PRAGMA {}".format(name)).fetchone()[0] for name in self.pragmas}
+
+    def close(self):
+        """Closes the calling thread's connection."""
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            with self.lock:
+                self.connections.discard(conn)
+            conn.close()
+            self.local.conn = None
+
+    def close_all(self):
+        """Closes the connections of all threads, e.g. at shutdown once the
+        worker threads have stopped."""
+        with self.lock:
+            connections, self.connections = self.connections, set()
+        for conn in connections:
+            conn.close()
@@ -1,33 +1,452 @@
 import os
-import pandas as pd
-import sqlite3
+import contextlib
+import functools
+import json
+import threading
+from collections import OrderedDict
 from sqlite3 import Error
-import datetime as dt
-import numpy as np
+
+from . import prefix_index
+from . import store
+from .connection import ConnectionPool
+
+
+# Full-text index over everything a user can search for. One row per file,
+# rowid = tbl_file.id. The triggers keep it in sync with every write to the
+# base tables, so no method in Database has to maintain it by hand.
+SEARCH_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tbl_search USING fts5(
+        filename, location, keywords, persons, prefix='2 3 4')""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_file_insert AFTER INSERT ON tbl_file BEGIN
+        INSERT INTO tbl_search(rowid,filename,location,keywords,persons)
+        VALUES (NEW.id, NEW.filename, coalesce(NEW.location,''), '', '');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_file_update AFTER UPDATE OF filename, location ON tbl_file BEGIN
+        UPDATE tbl_search SET filename=NEW.filename, location=coalesce(NEW.location,'') WHERE rowid=NEW.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_file_delete AFTER DELETE ON tbl_file BEGIN
+        DELETE FROM tbl_search WHERE rowid=OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_keyword_link_insert AFTER INSERT ON tbl_hlp_file_keyword BEGIN
+        UPDATE tbl_search SET keywords=(SELECT coalesce(group_concat(k.keyword,' '),'') FROM tbl_hlp_file_keyword h JOIN tbl_keyword k ON h.keyword_id=k.id WHERE h.file_id=NEW.file_id)
+        WHERE rowid=NEW.file_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_keyword_link_delete AFTER DELETE ON tbl_hlp_file_keyword BEGIN
+        UPDATE tbl_search SET keywords=(SELECT coalesce(group_concat(k.keyword,' '),'') FROM tbl_hlp_file_keyword h JOIN tbl_keyword k ON h.keyword_id=k.id WHERE h.file_id=OLD.file_id)
+        WHERE rowid=OLD.file_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_person_link_insert AFTER INSERT ON tbl_hlp_file_person BEGIN
+        UPDATE tbl_search SET persons=(SELECT coalesce(group_concat(p.name,' '),'') FROM tbl_hlp_file_person h JOIN tbl_person p ON h.person_id=p.id WHERE h.file_id=NEW.file_id)
+        WHERE rowid=NEW.file_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_person_link_delete AFTER DELETE ON tbl_hlp_file_person BEGIN
+        UPDATE tbl_search SET persons=(SELECT coalesce(group_concat(p.name,' '),'') FROM tbl_hlp_file_person h JOIN tbl_person p ON h.person_id=p.id WHERE h.file_id=OLD.file_id)
+        WHERE rowid=OLD.file_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_keyword_rename AFTER UPDATE OF keyword ON tbl_keyword BEGIN
+        UPDATE tbl_search SET keywords=(SELECT coalesce(group_concat(k.keyword,' '),'') FROM tbl_hlp_file_keyword h JOIN tbl_keyword k ON h.keyword_id=k.id WHERE h.file_id=tbl_search.rowid)
+        WHERE rowid IN (SELECT file_id FROM tbl_hlp_file_keyword WHERE keyword_id=NEW.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_search_person_rename AFTER UPDATE OF name ON tbl_person BEGIN
+        UPDATE tbl_search SET persons=(SELECT coalesce(group_concat(p.name,' '),'') FROM tbl_hlp_file_person h JOIN tbl_person p ON h.person_id=p.id WHERE h.file_id=tbl_search.rowid)
+        WHERE rowid IN (SELECT file_id FROM tbl_hlp_file_person WHERE person_id=NEW.id);
+    END""",
+]
+
+SEARCH_REBUILD = """INSERT INTO tbl_search(rowid,filename,location,keywords,persons)
+    SELECT f.id, f.filename, coalesce(f.location,''),
+        (SELECT coalesce(group_concat(k.keyword,' '),'') FROM tbl_hlp_file_keyword h JOIN tbl_keyword k ON h.keyword_id=k.id WHERE h.file_id=f.id),
+        (SELECT coalesce(group_concat(p.name,' '),'') FROM tbl_hlp_file_person h JOIN tbl_person p ON h.person_id=p.id WHERE h.file_id=f.id)
+    FROM tbl_file f"""
+
+# bm25 weights for filename, location, keywords and persons
+SEARCH_WEIGHTS = (10.0, 2.0, 5.0, 5.0)
+# Matches in the text of a file rank below matches in the fields typed in by hand
+TEXT_WEIGHT = 0.5
+# Files matching a query in their fields, and files matching only in their
+# text. A file that matches in both ranks by its fields, which spares
+# merging the two result sets. The query is given three times.
+TEXT_ONLY_SQL = "tbl_text MATCH ? AND tbl_text.rowid NOT IN (SELECT rowid FROM tbl_search WHERE tbl_search MATCH ?)"
+MATCH_SQL = """SELECT rowid, bm25(tbl_search,{},{},{},{}) AS rank FROM tbl_search WHERE tbl_search MATCH ?
+    UNION ALL
+    SELECT rowid, bm25(tbl_text)*{} FROM tbl_text WHERE {}""".format(*SEARCH_WEIGHTS, TEXT_WEIGHT, TEXT_ONLY_SQL)
+SEARCH_SQL = """SELECT filename, bm25(tbl_search,{},{},{},{}) AS rank FROM tbl_search WHERE tbl_search MATCH ?
+    UNION ALL
+    SELECT f.filename, bm25(tbl_text)*{} FROM tbl_text JOIN tbl_file f ON f.id=tbl_text.rowid WHERE {}
+    ORDER BY rank LIMIT ? OFFSET ?""".format(*SEARCH_WEIGHTS, TEXT_WEIGHT, TEXT_ONLY_SQL)
+COUNT_SQL = "SELECT (SELECT count(*) FROM tbl_search WHERE tbl_search MATCH ?) + (SELECT count(*) FROM tbl_text WHERE {})".format(TEXT_ONLY_SQL)
+
+BASE_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS tbl_file (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, filename TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, location TEXT, year INTEGER NOT NULL, payperiod INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tbl_person (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, name TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tbl_keyword (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, keyword TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tbl_hlp_file_person (file_id INTEGER NOT NULL, person_id INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tbl_hlp_file_keyword (file_id INTEGER NOT NULL, keyword_id INTEGER NOT NULL)",
+]
+
+INDEX_SCHEMA = [
+    # Older versions inserted a person row on every add_person_to_file, so
+    # duplicates are merged before the UNIQUE indexes can be built.
+    "UPDATE tbl_hlp_file_person SET person_id=(SELECT min(p2.id) FROM tbl_person p1 JOIN tbl_person p2 ON p1.name=p2.name WHERE p1.id=tbl_hlp_file_person.person_id) WHERE person_id IN (SELECT id FROM tbl_person)",
+    "DELETE FROM tbl_person WHERE id NOT IN (SELECT min(id) FROM tbl_person GROUP BY name)",
+    "UPDATE tbl_hlp_file_keyword SET keyword_id=(SELECT min(k2.id) FROM tbl_keyword k1 JOIN tbl_keyword k2 ON k1.keyword=k2.keyword WHERE k1.id=tbl_hlp_file_keyword.keyword_id) WHERE keyword_id IN (SELECT id FROM tbl_keyword)",
+    "DELETE FROM tbl_keyword WHERE id NOT IN (SELECT min(id) FROM tbl_keyword GROUP BY keyword)",
+    "DELETE FROM tbl_hlp_file_person WHERE rowid NOT IN (SELECT min(rowid) FROM tbl_hlp_file_person GROUP BY file_id, person_id)",
+    "DELETE FROM tbl_hlp_file_keyword WHERE rowid NOT IN (SELECT min(rowid) FROM tbl_hlp_file_keyword GROUP BY file_id, keyword_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_file_filename ON tbl_file(filename)",
+    "CREATE INDEX IF NOT EXISTS idx_file_year ON tbl_file(year)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_keyword_keyword ON tbl_keyword(keyword)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_person_name ON tbl_person(name)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_hlp_file_keyword ON tbl_hlp_file_keyword(file_id, keyword_id)",
+    "CREATE INDEX IF NOT EXISTS idx_hlp_keyword_file ON tbl_hlp_file_keyword(keyword_id, file_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_hlp_file_person ON tbl_hlp_file_person(file_id, person_id)",
+    "CREATE INDEX IF NOT EXISTS idx_hlp_person_file ON tbl_hlp_file_person(person_id, file_id)",
+    "ANALYZE",
+]
+
+# Per-year counts for the Graphics view, kept up to date by triggers so the
+# charts read a handful of rows instead of joining over all files. Deleting a
+# file first deletes its links, which keeps the keyword and person counts right.
+STATS_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS tbl_stat_keyword_year (year INTEGER NOT NULL, keyword_id INTEGER NOT NULL, cnt INTEGER NOT NULL, PRIMARY KEY (year, keyword_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS tbl_stat_person_year (year INTEGER NOT NULL, person_id INTEGER NOT NULL, cnt INTEGER NOT NULL, PRIMARY KEY (year, person_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS tbl_stat_payperiod_year (year INTEGER NOT NULL, payperiod INTEGER NOT NULL, cnt INTEGER NOT NULL, PRIMARY KEY (year, payperiod)) WITHOUT ROWID",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_keyword_link_insert AFTER INSERT ON tbl_hlp_file_keyword BEGIN
+        INSERT INTO tbl_stat_keyword_year(year,keyword_id,cnt) SELECT year, NEW.keyword_id, 1 FROM tbl_file WHERE id=NEW.file_id
+        ON CONFLICT(year,keyword_id) DO UPDATE SET cnt=cnt+1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_keyword_link_delete AFTER DELETE ON tbl_hlp_file_keyword BEGIN
+        UPDATE tbl_stat_keyword_year SET cnt=cnt-1 WHERE keyword_id=OLD.keyword_id AND year=(SELECT year FROM tbl_file WHERE id=OLD.file_id);
+        DELETE FROM tbl_stat_keyword_year WHERE keyword_id=OLD.keyword_id AND cnt<=0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_person_link_insert AFTER INSERT ON tbl_hlp_file_person BEGIN
+        INSERT INTO tbl_stat_person_year(year,person_id,cnt) SELECT year, NEW.person_id, 1 FROM tbl_file WHERE id=NEW.file_id
+        ON CONFLICT(year,person_id) DO UPDATE SET cnt=cnt+1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_person_link_delete AFTER DELETE ON tbl_hlp_file_person BEGIN
+        UPDATE tbl_stat_person_year SET cnt=cnt-1 WHERE person_id=OLD.person_id AND year=(SELECT year FROM tbl_file WHERE id=OLD.file_id);
+        DELETE FROM tbl_stat_person_year WHERE person_id=OLD.person_id AND cnt<=0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_file_insert AFTER INSERT ON tbl_file BEGIN
+        INSERT INTO tbl_stat_payperiod_year(year,payperiod,cnt) VALUES (NEW.year, NEW.payperiod, 1)
+        ON CONFLICT(year,payperiod) DO UPDATE SET cnt=cnt+1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_file_delete_links BEFORE DELETE ON tbl_file BEGIN
+        DELETE FROM tbl_hlp_file_keyword WHERE file_id=OLD.id;
+        DELETE FROM tbl_hlp_file_person WHERE file_id=OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_file_delete AFTER DELETE ON tbl_file BEGIN
+        UPDATE tbl_stat_payperiod_year SET cnt=cnt-1 WHERE year=OLD.year AND payperiod=OLD.payperiod;
+        DELETE FROM tbl_stat_payperiod_year WHERE year=OLD.year AND payperiod=OLD.payperiod AND cnt<=0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_file_update AFTER UPDATE OF year, payperiod ON tbl_file
+    WHEN OLD.year IS NOT NEW.year OR OLD.payperiod IS NOT NEW.payperiod BEGIN
+        UPDATE tbl_stat_payperiod_year SET cnt=cnt-1 WHERE year=OLD.year AND payperiod=OLD.payperiod;
+        DELETE FROM tbl_stat_payperiod_year WHERE year=OLD.year AND payperiod=OLD.payperiod AND cnt<=0;
+        INSERT INTO tbl_stat_payperiod_year(year,payperiod,cnt) VALUES (NEW.year, NEW.payperiod, 1)
+        ON CONFLICT(year,payperiod) DO UPDATE SET cnt=cnt+1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_stat_file_update_year AFTER UPDATE OF year ON tbl_file
+    WHEN OLD.year IS NOT NEW.year BEGIN
+        UPDATE tbl_stat_keyword_year SET cnt=cnt-1 WHERE year=OLD.year AND keyword_id IN (SELECT keyword_id FROM tbl_hlp_file_keyword WHERE file_id=NEW.id);
+        DELETE FROM tbl_stat_keyword_year WHERE year=OLD.year AND cnt<=0;
+        INSERT INTO tbl_stat_keyword_year(year,keyword_id,cnt) SELECT NEW.year, keyword_id, 1 FROM tbl_hlp_file_keyword WHERE file_id=NEW.id
+        ON CONFLICT(year,keyword_id) DO UPDATE SET cnt=cnt+1;
+        UPDATE tbl_stat_person_year SET cnt=cnt-1 WHERE year=OLD.year AND person_id IN (SELECT person_id FROM tbl_hlp_file_person WHERE file_id=NEW.id);
+        DELETE FROM tbl_stat_person_year WHERE year=OLD.year AND cnt<=0;
+        INSERT INTO tbl_stat_person_year(year,person_id,cnt) SELECT NEW.year, person_id, 1 FROM tbl_hlp_file_person WHERE file_id=NEW.id
+        ON CONFLICT(year,person_id) DO UPDATE SET cnt=cnt+1;
+    END""",
+    "DELETE FROM tbl_stat_keyword_year",
+    "INSERT INTO tbl_stat_keyword_year(year,keyword_id,cnt) SELECT f.year, h.keyword_id, count(*) FROM tbl_file f JOIN tbl_hlp_file_keyword h ON f.id=h.file_id GROUP BY f.year, h.keyword_id",
+    "DELETE FROM tbl_stat_person_year",
+    "INSERT INTO tbl_stat_person_year(year,person_id,cnt) SELECT f.year, h.person_id, count(*) FROM tbl_file f JOIN tbl_hlp_file_person h ON f.id=h.file_id GROUP BY f.year, h.person_id",
+    "DELETE FROM tbl_stat_payperiod_year",
+    "INSERT INTO tbl_stat_payperiod_year(year,payperiod,cnt) SELECT year, payperiod, count(*) FROM tbl_file GROUP BY year, payperiod",
+]
+
+# Migration n brings a database from user_version n-1 to n. Append new
+# migrations to the end of the list; never change one that has shipped.
+MIGRATIONS = [
+    BASE_SCHEMA,
+    INDEX_SCHEMA,
+    # A search table created before the migrations existed is rebuilt.
+    ["DROP TABLE IF EXISTS tbl_search"] + SEARCH_SCHEMA + [SEARCH_REBUILD],
+    # Source paths of bulk imports, written in the same transaction as the
+    # files, so an interrupted import can be resumed without duplicates.
+    ["CREATE TABLE IF NOT EXISTS tbl_import (source TEXT PRIMARY KEY NOT NULL, file_id INTEGER NOT NULL)",
+     """CREATE TRIGGER IF NOT EXISTS trg_import_file_delete AFTER DELETE ON tbl_file BEGIN
+        DELETE FROM tbl_import WHERE file_id=OLD.id;
+     END"""],
+    STATS_SCHEMA,
+    # Content-addressed storage: files with the same SHA-256 share one blob.
+    # tbl_blob.path is relative to the upload directory.
+    ["CREATE TABLE IF NOT EXISTS tbl_blob (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, sha256 TEXT NOT NULL, size INTEGER NOT NULL, path TEXT NOT NULL)",
+     "CREATE UNIQUE INDEX IF NOT EXISTS idx_blob_sha256 ON tbl_blob(sha256)",
+     "CREATE INDEX IF NOT EXISTS idx_blob_size ON tbl_blob(size)",
+     "ALTER TABLE tbl_file ADD COLUMN blob_id INTEGER REFERENCES tbl_blob(id)",
+     "CREATE INDEX IF NOT EXISTS idx_file_blob ON tbl_file(blob_id)"],
+    # Text extracted from the stored files, see extract.py. rowid = tbl_file.id.
+    # Files without text get an empty row, so a reindex knows they are done.
+    ["CREATE VIRTUAL TABLE IF NOT EXISTS tbl_text USING fts5(content)",
+     """CREATE TRIGGER IF NOT EXISTS trg_text_file_delete AFTER DELETE ON tbl_file BEGIN
+        DELETE FROM tbl_text WHERE rowid=OLD.id;
+     END"""],
+    # The last serial number handed out per year, see reserve_serials. A
+    # year's row is created on first use, from the filenames of that year.
+    ["CREATE TABLE IF NOT EXISTS tbl_serial (year INTEGER PRIMARY KEY NOT NULL, last INTEGER NOT NULL)"],
+]
+
+# Lookups that run on every click. Database.scanning_queries() checks that
+# none of them needs a full table scan.
+HOT_QUERIES = {
+    "is_file_in_db": ("SELECT id FROM tbl_file WHERE filename=?", ("",)),
+    "get_location": ("SELECT location FROM tbl_file WHERE filename=?", ("",)),
+    "is_keyword_in_db": ("SELECT id FROM tbl_keyword WHERE keyword=?", ("",)),
+    "is_person_in_db": ("SELECT id FROM tbl_person WHERE name=?", ("",)),
+    "keyword_unused": ("SELECT * FROM tbl_hlp_file_keyword JOIN tbl_keyword ON keyword_id=tbl_keyword.id WHERE tbl_keyword.keyword = ?", ("",)),
+    "get_keywords": ("SELECT k.keyword,s.cnt FROM tbl_stat_keyword_year s JOIN tbl_keyword k ON s.keyword_id=k.id WHERE s.year=?", (0,)),
+    "get_person": ("SELECT p.name,s.cnt FROM tbl_stat_person_year s JOIN tbl_person p ON s.person_id=p.id WHERE s.year=?", (0,)),
+    "get_payperiods": ("SELECT payperiod,cnt FROM tbl_stat_payperiod_year WHERE year=? ORDER BY payperiod", (0,)),
+    "keywords_on_file": ("SELECT f.id,k.keyword FROM tbl_file f JOIN tbl_hlp_file_keyword h ON f.id=h.file_id JOIN tbl_keyword k ON h.keyword_id=k.id WHERE filename=?", ("",)),
+    "persons_on_file": ("SELECT f.id,p.name FROM tbl_file f JOIN tbl_hlp_file_person h ON f.id=h.file_id JOIN tbl_person p ON h.person_id=p.id WHERE filename=?", ("",)),
+    "delete_keyword_from_file": ("SELECT h.rowid FROM tbl_file f JOIN tbl_hlp_file_keyword h ON f.id=h.file_id JOIN tbl_keyword k ON h.keyword_id=k.id WHERE f.filename=? AND k.keyword=?", ("", "")),
+    "delete_person_from_file": ("SELECT h.rowid FROM tbl_file f JOIN tbl_hlp_file_person h ON f.id=h.file_id JOIN tbl_person p ON h.person_id=p.id WHERE f.filename=? AND p.name=?", ("", "")),
+    "get_latest_id": ("SELECT max(id) from tbl_file;", ()),
+    "get_blob": ("SELECT sha256,size,path FROM tbl_blob WHERE sha256=?", ("",)),
+    "has_blob_of_size": ("SELECT 1 FROM tbl_blob WHERE size=? LIMIT 1", (0,)),
+    "file_path": ("SELECT f.blob_id,b.path FROM tbl_file f LEFT JOIN tbl_blob b ON f.blob_id=b.id WHERE f.filename=?", ("",)),
+    "last_import": ("SELECT i.file_id,b.sha256 FROM tbl_import i JOIN tbl_file f ON f.id=i.file_id LEFT JOIN tbl_blob b ON f.blob_id=b.id WHERE i.source>=? AND i.source<? ORDER BY i.file_id DESC LIMIT 1", ("", "")),
+}
+
+# Filenames are the year, a serial number per year and the original name
+SERIAL_FORMAT = "{}{:04d} {}"
+# The highest serial used in a year, for years that have no counter yet
+SERIAL_SEED_SQL = """SELECT coalesce(max(CAST(substr(filename,5,instr(filename,' ')-5) AS INTEGER)),0)
+    FROM tbl_file WHERE year=? AND instr(filename,' ')>5"""
+
+# Rows fetched at a time by the streaming iter_* methods
+EXPORT_CHUNK_SIZE = 1000
+
+# One row per file for exports. Keywords and persons are joined with ';' like
+# in an import manifest, names with spaces stay intact.
+RECORD_SQL = """SELECT f.filename,f.location,f.year,f.payperiod,
+    (SELECT group_concat(k.keyword,';') FROM tbl_hlp_file_keyword h JOIN tbl_keyword k ON h.keyword_id=k.id WHERE h.file_id=f.id),
+    (SELECT group_concat(p.name,';') FROM tbl_hlp_file_person h JOIN tbl_person p ON h.person_id=p.id WHERE h.file_id=f.id)
+    FROM tbl_file f"""
+
+# The aggregate tables as (year, kind, name, count) rows
+YEAR_STATS_SQL = """SELECT year,kind,name,cnt FROM (
+    SELECT s.year,'keyword' AS kind,k.keyword AS name,s.cnt FROM tbl_stat_keyword_year s JOIN tbl_keyword k ON k.id=s.keyword_id
+    UNION ALL
+    SELECT s.year,'person',p.name,s.cnt FROM tbl_stat_person_year s JOIN tbl_person p ON p.id=s.person_id
+    UNION ALL
+    SELECT year,'payperiod',CAST(payperiod AS TEXT),cnt FROM tbl_stat_payperiod_year)"""
+
+# Rows that point at a file, keyword or person that is gone, see verify.py.
+# The triggers prevent them, but databases from before the triggers and
+# crashed writes can have some.
+ORPHAN_ROWS = {
+    "tbl_hlp_file_keyword": "file_id NOT IN (SELECT id FROM tbl_file) OR keyword_id NOT IN (SELECT id FROM tbl_keyword)",
+    "tbl_hlp_file_person": "file_id NOT IN (SELECT id FROM tbl_file) OR person_id NOT IN (SELECT id FROM tbl_person)",
+    "tbl_import": "file_id NOT IN (SELECT id FROM tbl_file)",
+    "tbl_text": "rowid NOT IN (SELECT id FROM tbl_file)",
+}
+UNUSED_BLOBS_SQL = "id NOT IN (SELECT blob_id FROM tbl_file WHERE blob_id IS NOT NULL)"
+
+
+# Default number of query results kept by QueryCache.
+QUERY_CACHE_SIZE = 256
+
+
+class QueryCache:
+    """LRU cache for the results of read-only Database methods.
+    Entries are keyed by method name and arguments. Every write bumps the
+    generation, which drops all entries of older generations. Results are
+    shared between callers and threads and must not be modified."""
+
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self.generation = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            generation = self.generation
+        value = compute()
+        with self.lock:
+            # A write during compute() makes the result stale before it is stored.
+            if self.size > 0 and generation == self.generation:
+                self.entries[key] = value
+                if len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0,
+                    "entries": len(self.entries),
+                    "size": self.size,
+                    "generation": self.generation}
+
+
+def cached(method):
+    """Serves the result of `method` from the query cache."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.check_external_writes()
+        key = (method.__name__,) + args + tuple(sorted(kwargs.items()))
+        return self.cache.lookup(key, lambda: method(self, *args, **kwargs))
+    return wrapper
+
+
+def mutating(method):
+    """Runs `method` while holding the write lock and invalidates the query
+    cache after it has written to the database."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock:
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.cache.invalidate()
+    return wrapper
 
 
 class Database:
-    def __init__(self, filename=None):
+    """Access to the grievance database.
+    Every thread that uses a Database gets its own SQLite connection from a
+    ConnectionPool, so the same instance can be shared between the Tk thread
+    and worker threads. `pragmas` override the pool's connection settings.
+    The query cache is shared by all threads. Writes of this process take
+    turns on `write_lock`; reads run next to them thanks to WAL mode."""
+
+    def __init__(self, filename=None, cache_size=QUERY_CACHE_SIZE, pragmas=None):
+        self.filename = filename
+        self.pool = ConnectionPool(filename, pragmas) if filename else None
+        self.cache = QueryCache(cache_size)
+        self.local = threading.local()
+        self.write_lock = threading.RLock()
+        self.prefix_index = None
+        self.index_lock = threading.Lock()
         if filename:
-            self.conn = Database.connect(filename)
-            self.cur = self.conn.cursor()
-        else:
-            self.conn = None
-            self.cur = None
-
-
-    @staticmethod
-    def connect(filename):
-        """connect connects to database `filename`
-        If `filename` does not exist, it will be created.""" 
-        try:
-            conn = sqlite3.connect(filename)
-        except Error as e:
-            print(e)
+            self.migrate()
+
+    @property
+    def conn(self):
+        if self.pool is None:
+            return None
+        conn = self.pool.connection()
+        if conn is not getattr(self.local, "conn", None):
+            self.local.conn = conn
+            self.local.cur = conn.cursor()
+            self.local.data_version = None
+            self.local.generation = None
         return conn
 
+    @property
+    def cur(self):
+        return self.local.cur if self.conn else None
+
+    def close(self):
+        """Closes the connection of the calling thread."""
+        if self.pool is not None:
+            self.pool.close()
+
+    def close_all(self):
+        """Closes the connections of all threads."""
+        if self.pool is not None:
+            self.pool.close_all()
+
+    def check_external_writes(self):
+        """Invalidates the query cache if another connection, e.g. a bulk
+        import or the command line, has committed since the last check."""
+        data_version = self.cur.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.local.data_version:
+            if self.local.data_version is not None:
+                # The prefix index is updated by our own writes, which also
+                # bump the cache generation. A change without such a bump
+                # came from another process, so the index is rebuilt.
+                if self.cache.generation == self.local.generation:
+                    self.prefix_index = None
+                self.cache.invalidate()
+            self.local.data_version = data_version
+        self.local.generation = self.cache.generation
+
+    def get_prefix_index(self):
+        """Returns the in-memory prefix index, building it on first use.
+        The build holds the write lock: a write of this process that commits
+        meanwhile would find no index to update and be missing from it.
+        Writes of other processes are caught by check_external_writes."""
+        with self.index_lock:
+            if self.prefix_index is None:
+                with self.write_lock:
+                    self.cur.execute("SELECT rowid,filename,location,keywords,persons FROM tbl_search")
+                    self.prefix_index = prefix_index.PrefixIndex.build(self.cur.fetchall())
+            return self.prefix_index
+
+    def reindex_files(self,filenames):
+        """Updates the prefix index after `filenames` have been written."""
+        if self.prefix_index is None:
+            return
+        self.cur.execute("SELECT s.rowid,s.filename,s.location,s.keywords,s.persons FROM tbl_file f JOIN tbl_search s ON s.rowid=f.id WHERE f.filename IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(filenames)),))
+        self.prefix_index.update_files(self.cur.fetchall())
+
+    def prefix_search(self, searchterm, limit=None, offset=0, task=None):
+        """Returns the number of files matching every word of `searchterm` as
+        a prefix, and one page of their filenames, newest first, for search
+        as you type. The files match like in search(): the fields come from
+        the in-memory prefix index, the extracted text from tbl_text, and an
+        empty searchterm returns all files. Cancelling `task` interrupts the
+        text query."""
+        self.check_external_writes()
+        index = self.get_prefix_index()
+        query = self.search_query(searchterm)
+        text_ids = []
+        if query:
+            with task.interrupting(self.conn.interrupt) if task else contextlib.nullcontext():
+                try:
+                    self.cur.execute("SELECT rowid FROM tbl_text WHERE tbl_text MATCH ?", (query,))
+                    text_ids = [row[0] for row in self.cur.fetchall()]
+                except Error as e:
+                    if task:
+                        task.check()
+                    print("Cannot search database:", e)
+        return index.search(searchterm, limit, offset, text_ids)
+
+    def data_version(self):
+        """Returns a number that changes whenever the data changes, through
+        this Database or another process. Keys caches kept outside of
+        Database, like the rendered charts."""
+        self.check_external_writes()
+        return self.cache.generation
+
+    def cache_stats(self):
+        """Returns hit/miss statistics of the query cache."""
+        return self.cache.stats()
+
+    @mutating
     def file_to_db(self,filename,fields):
-        """Adds `filename` to the database"""
+        """Adds `filename` to the database
+        If `fields` has the sha256, size and path of a stored blob, the file
+        is linked to that blob."""
         location = fields["location"]
         year = fields["year"]
         payperiod = fields["payperiod"]
@@ -35,33 +454,337 @@ class Database:
             print("File {} is in database already.".format(filename))
             ret_val = -1
         else:
-            sql_string = "INSERT INTO tbl_file(filename,location,year,payperiod) VALUES('{}','{}','{}','{}')".format(filename,location,year,payperiod)
+            sql_string = "INSERT INTO tbl_file(filename,location,year,payperiod,blob_id) VALUES(?,?,?,?,(SELECT id FROM tbl_blob WHERE sha256=?))"
             try:
-                self.cur.execute(sql_string)
+                if fields.get("sha256"):
+                    self.cur.execute("INSERT OR IGNORE INTO tbl_blob(sha256,size,path) VALUES(?,?,?)",
+                            (fields["sha256"],fields["size"],fields["path"]))
+                self.cur.execute(sql_string, (filename,location,year,payperiod,fields.get("sha256")))
                 ret_val = self.cur.lastrowid
             except:
                 print("Cannot add file to the database. Cancelling.")
                 ret_val = -2
             self.conn.commit()
+            self.reindex_files([filename])
         return ret_val
 
+    @mutating
+    def files_to_db(self,rows,directory=None):
+        """Adds many files in one transaction.
+        `rows` are dicts with filename, location, year, payperiod, keywords,
+        persons, source and the sha256, size and path of the stored blob. Missing keywords and persons are created.
+        Rows with a name instead of a filename get the next serial numbers of
+        their year, in the same transaction; their filename is set in the row.
+        With the upload `directory`, the blobs are looked for inside the
+        transaction: a blob that put_file found may have been deleted since.
+        Rows whose blob is gone are not added and get "blob_missing" set;
+        store their content again and retry them.
+        Returns the number of files added or -2 if the batch was rolled back."""
+        unnamed = [r for r in rows if not r.get("filename")]
+        try:
+            self.cur.execute("BEGIN IMMEDIATE")
+            if directory is not None:
+                # delete_file removes blobs before it commits, so a blob that
+                # is there now stays until this transaction has committed
+                for r in rows:
+                    if r.get("path") and not os.path.exists(os.path.join(directory, r["path"])):
+                        r["blob_missing"] = True
+                rows = [r for r in rows if not r.get("blob_missing")]
+            self.assign_filenames([r for r in unnamed if not r.get("blob_missing")])
+            self.cur.executemany("INSERT OR IGNORE INTO tbl_blob(sha256,size,path) VALUES(?,?,?)",
+                    [(r["sha256"],r["size"],r["path"]) for r in rows if r.get("sha256")])
+            self.cur.executemany("INSERT INTO tbl_file(filename,location,year,payperiod,blob_id) VALUES(?,?,?,?,(SELECT id FROM tbl_blob WHERE sha256=?))",
+                    [(r["filename"],r["location"],r["year"],r["payperiod"],r.get("sha256")) for r in rows])
+            self.cur.executemany("INSERT OR IGNORE INTO tbl_keyword(keyword) VALUES(?)",
+                    [(k,) for r in rows for k in r.get("keywords",())])
+            self.cur.executemany("INSERT OR IGNORE INTO tbl_person(name) VALUES(?)",
+                    [(p,) for r in rows for p in r.get("persons",())])
+            self.cur.executemany("INSERT OR IGNORE INTO tbl_hlp_file_keyword(file_id,keyword_id) SELECT f.id,k.id FROM tbl_file f, tbl_keyword k WHERE f.filename=? AND k.keyword=?",
+                    [(r["filename"],k) for r in rows for k in r.get("keywords",())])
+            self.cur.executemany("INSERT OR IGNORE INTO tbl_hlp_file_person(file_id,person_id) SELECT f.id,p.id FROM tbl_file f, tbl_person p WHERE f.filename=? AND p.name=?",
+                    [(r["filename"],p) for r in rows for p in r.get("persons",())])
+            self.cur.executemany("INSERT OR REPLACE INTO tbl_import(source,file_id) SELECT ?,id FROM tbl_file WHERE filename=?",
+                    [(r["source"],r["filename"]) for r in rows if r.get("source")])
+            self.conn.commit()
+            self.reindex_files([r["filename"] for r in rows])
+            ret_val = len(rows)
+        except Error as e:
+            self.conn.rollback()
+            # The serials were rolled back as well
+            for r in unnamed:
+                r.pop("filename", None)
+            print("Cannot add files to the database. Cancelling batch.", e)
+            ret_val = -2
+        return ret_val
+
+    def assign_filenames(self,rows):
+        """Sets the filename of `rows` from their year, the next serial
+        numbers of that year and their name. Runs inside a write transaction."""
+        by_year = {}
+        for r in rows:
+            by_year.setdefault(r["year"], []).append(r)
+        for year, year_rows in by_year.items():
+            first = self.reserve_serials(year, len(year_rows))
+            for serial, r in enumerate(year_rows, start=first):
+                r["filename"] = SERIAL_FORMAT.format(year, serial, r["name"])
+
+    @mutating
+    def reserve_serials(self,year,count=1):
+        """Reserves `count` consecutive serial numbers of `year` and returns
+        the first. Inside a write transaction the numbers are only taken if
+        it commits; otherwise they are taken at once. Other processes wait
+        for the transaction, so no number is handed out twice."""
+        own_transaction = not self.conn.in_transaction
+        try:
+            if own_transaction:
+                self.cur.execute("BEGIN IMMEDIATE")
+            self.cur.execute("UPDATE tbl_serial SET last=last+? WHERE year=?", (count, year))
+            if self.cur.rowcount == 0:
+                seed = self.cur.execute(SERIAL_SEED_SQL, (year,)).fetchone()[0]
+                self.cur.execute("INSERT INTO tbl_serial(year,last) VALUES(?,?)", (year, seed + count))
+            last = self.cur.execute("SELECT last FROM tbl_serial WHERE year=?", (year,)).fetchone()[0]
+            if own_transaction:
+                self.conn.commit()
+        except Error:
+            if own_transaction:
+                self.conn.rollback()
+            raise
+        return last - count + 1
+
+    def upload_file(self,directory,source,fields,task=None,name=None):
+        """Stores the file `source` in `directory` and adds it to the database
+        under the next serial number of its year. Returns the new filename and
+        the result of files_to_db, -3 if the stored content was deleted
+        twice before the file could be added."""
+        for attempt in (0, 1):
+            row = dict(fields, **store.put_file(self, directory, source, task))
+            row.pop("filename", None)
+            row["name"] = name or os.path.basename(source)
+            res = self.files_to_db([row], directory)
+            if not row.pop("blob_missing", False):
+                return row.get("filename", row["name"]), res
+            # The same content was deleted meanwhile, it is stored again
+        print("Cannot store {}, its content was deleted while it was added.".format(source))
+        return row["name"], -3
+
+    def imported_sources(self):
+        """Returns the set of source paths added by earlier bulk imports."""
+        try:
+            self.cur.execute("SELECT source FROM tbl_import")
+        except:
+            print("Cannot access database.")
+            return set()
+        return {row[0] for row in self.cur.fetchall()}
+
+    def last_import(self,prefix):
+        """Returns the file id and sha256 of the latest import whose source
+        starts with `prefix`, or None."""
+        try:
+            self.cur.execute(HOT_QUERIES["last_import"][0], (prefix, prefix + chr(0x10FFFF)))
+        except Error as e:
+            print("Cannot access database:", e)
+            return None
+        return self.cur.fetchone()
+
+    @mutating
+    def remember_import(self,source,file_id):
+        """Records that `source` has been imported as the file `file_id`."""
+        try:
+            self.cur.execute("INSERT OR REPLACE INTO tbl_import(source,file_id) VALUES(?,?)", (source,file_id))
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            print("Cannot access database:", e)
+
+    @mutating
     def delete_file(self,directory,filename):
-        if self.is_file_in_db(filename):
-            sql_string = "DELETE FROM tbl_file WHERE filename = '{}'".format(filename)
+        """Deletes `filename` from the database and its stored file from
+        `directory`. A blob is only removed when no other file uses it. It is
+        moved aside before the transaction commits, so files_to_db, which
+        looks for its blobs in its own transaction, never links a file to
+        a blob that is being deleted."""
+        if not self.is_file_in_db(filename):
+            print("File not in database")
+            return
+        path = self.stored_path(directory,filename)
+        trash = None
+        try:
+            self.cur.execute("BEGIN IMMEDIATE")
+            row = self.cur.execute(HOT_QUERIES["file_path"][0], (filename,)).fetchone()
+            if row is None:
+                # Deleted by another process meanwhile
+                self.conn.rollback()
+                return
+            blob_id = row[0]
+            file_id = self.cur.execute(HOT_QUERIES["is_file_in_db"][0], (filename,)).fetchone()[0]
+            self.cur.execute("DELETE FROM tbl_file WHERE filename = ?", (filename,))
+            if blob_id is not None:
+                self.cur.execute("DELETE FROM tbl_blob WHERE id=? AND NOT EXISTS (SELECT 1 FROM tbl_file WHERE blob_id=?)", (blob_id,blob_id))
+            if (blob_id is None or self.cur.rowcount > 0) and os.path.exists(path):
+                # Only removed for good once the delete has committed
+                trash = path + store.DELETED_SUFFIX
+                os.replace(path, trash)
+            self.conn.commit()
+        except (Error, OSError) as e:
+            self.conn.rollback()
+            if trash and os.path.exists(trash):
+                os.replace(trash, path)
+            print("Could not delete file from database.", e)
+            return
+        if self.prefix_index is not None:
+            self.prefix_index.remove_file(file_id)
+        if trash:
+            os.remove(trash)
+            store.cache.discard(path)
+
+    def file_path(self,directory,filename):
+        """Returns the path of a plain file with the content of `filename`.
+        Compressed content is decompressed into the cache first."""
+        return store.cache.path(self.stored_path(directory,filename))
+
+    def stored_path(self,directory,filename):
+        """Returns the path of the stored content of `filename`, which may be
+        compressed, see store.open_blob."""
+        try:
+            self.cur.execute(HOT_QUERIES["file_path"][0], (filename,))
+        except:
+            print("Cannot access database.")
+        row = self.cur.fetchone()
+        if row and row[1]:
+            return os.path.join(directory, row[1])
+        return directory + filename
+
+    def files_without_text(self,directory,filenames=None):
+        """Returns (file id, path of the stored content) of the files whose
+        text has not been extracted yet, of all files or of `filenames`."""
+        sql_string = "SELECT f.id,f.filename,b.path FROM tbl_file f LEFT JOIN tbl_blob b ON f.blob_id=b.id WHERE f.id NOT IN (SELECT rowid FROM tbl_text)"
+        params = ()
+        if filenames is not None:
+            sql_string += " AND f.filename IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(list(filenames)),)
+        try:
+            self.cur.execute(sql_string + " ORDER BY f.id", params)
+        except Error as e:
+            print("Cannot access database:", e)
+            return []
+        return [(file_id, os.path.join(directory, path) if path else directory + filename)
+                for file_id, filename, path in self.cur.fetchall()]
+
+    @mutating
+    def add_texts(self,rows):
+        """Stores the extracted text of files, (file id, text) each, in one
+        transaction. Files deleted in the meantime are skipped. Returns the
+        number of rows or -2 if the batch was rolled back."""
+        try:
+            self.cur.execute("BEGIN IMMEDIATE")
+            self.cur.executemany("DELETE FROM tbl_text WHERE rowid=?", [(file_id,) for file_id, text in rows])
+            self.cur.executemany("INSERT INTO tbl_text(rowid,content) SELECT id,? FROM tbl_file WHERE id=?",
+                    [(text, file_id) for file_id, text in rows])
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            print("Cannot store extracted text. Cancelling batch.", e)
+            return -2
+        return len(rows)
+
+    @mutating
+    def drop_texts(self):
+        """Forgets all extracted text, so that a reindex extracts it again."""
+        self.cur.execute("DELETE FROM tbl_text")
+        self.conn.commit()
+
+    def stored_files(self):
+        """Returns (file id, filename, path relative to the upload directory,
+        sha256, size) of the stored content of every file. sha256 and size
+        are None for files uploaded before the blob store."""
+        sql_string = "SELECT f.id,f.filename,coalesce(b.path,f.filename),b.sha256,b.size FROM tbl_file f LEFT JOIN tbl_blob b ON f.blob_id=b.id"
+        try:
+            self.cur.execute(sql_string)
+        except Error as e:
+            print("Cannot access database:", e)
+            return []
+        return self.cur.fetchall()
+
+    def unused_blobs(self):
+        """Returns (blob id, path) of the blobs no file uses."""
+        try:
+            self.cur.execute("SELECT id,path FROM tbl_blob WHERE " + UNUSED_BLOBS_SQL)
+        except Error as e:
+            print("Cannot access database:", e)
+            return []
+        return self.cur.fetchall()
+
+    def orphan_rows(self):
+        """Returns the number of orphaned rows per table, see ORPHAN_ROWS."""
+        counts = {}
+        for table, condition in ORPHAN_ROWS.items():
             try:
-                self.cur.execute(sql_string)
-            except:
-                print("Could not delete file from database.")
+                counts[table] = self.cur.execute("SELECT count(*) FROM {} WHERE {}".format(table, condition)).fetchone()[0]
+            except Error as e:
+                print("Cannot access database:", e)
+        return counts
+
+    @mutating
+    def delete_orphan_rows(self):
+        """Deletes the orphaned rows and the blobs no file uses, in one
+        transaction. Returns the number of rows deleted or -2."""
+        count = 0
+        try:
+            self.cur.execute("BEGIN IMMEDIATE")
+            for table, condition in ORPHAN_ROWS.items():
+                self.cur.execute("DELETE FROM {} WHERE {}".format(table, condition))
+                count += self.cur.rowcount
+            self.cur.execute("DELETE FROM tbl_blob WHERE " + UNUSED_BLOBS_SQL)
+            count += self.cur.rowcount
             self.conn.commit()
-            os.remove(directory+filename)    
-        else:
-            print("File not in database")
+        except Error as e:
+            self.conn.rollback()
+            print("Cannot delete orphaned rows.", e)
+            return -2
+        return count
+
+    @mutating
+    def forget_files(self,file_ids):
+        """Deletes the files with `file_ids` from the database without
+        touching the upload directory, for files whose stored content is lost.
+        Returns the number of files deleted or -2."""
+        try:
+            self.cur.execute("BEGIN IMMEDIATE")
+            self.cur.execute("DELETE FROM tbl_file WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(file_ids)),))
+            count = self.cur.rowcount
+            self.cur.execute("DELETE FROM tbl_blob WHERE " + UNUSED_BLOBS_SQL)
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            print("Cannot delete files from the database.", e)
+            return -2
+        if self.prefix_index is not None:
+            for file_id in file_ids:
+                self.prefix_index.remove_file(file_id)
+        return count
+
+    def get_blob(self,sha256):
+        """Returns a dict with sha256, size and path of a stored blob or None."""
+        try:
+            self.cur.execute(HOT_QUERIES["get_blob"][0], (sha256,))
+        except:
+            print("Cannot access database.")
+        row = self.cur.fetchone()
+        return dict(zip(("sha256","size","path"), row)) if row else None
 
+    def has_blob_of_size(self,size):
+        try:
+            self.cur.execute(HOT_QUERIES["has_blob_of_size"][0], (size,))
+        except:
+            print("Cannot access database.")
+        return self.cur.fetchone() is not None
+
+    @cached
     def is_file_in_db(self,filename):
 
-        sql_string = "SELECT id FROM tbl_file WHERE filename='{}'".format(filename)
+        sql_string = HOT_QUERIES["is_file_in_db"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (filename,))
         except:
             print("Cannot access database.")
 
@@ -78,12 +801,164 @@ class Database:
 
         filename_location = self.cur.fetchall()
 
+        import pandas as pd
         return pd.DataFrame(filename_location)
 
+    def schema_version(self):
+        return self.cur.execute("PRAGMA user_version").fetchone()[0]
+
+    @mutating
+    def migrate(self):
+        """Brings the schema up to date, creating it if the database is empty.
+        Every migration runs in its own transaction together with the bump of
+        PRAGMA user_version, so an interrupted upgrade is simply repeated."""
+        version = self.schema_version()
+        for number, statements in enumerate(MIGRATIONS[version:], start=version+1):
+            try:
+                self.cur.execute("BEGIN IMMEDIATE")
+                if self.schema_version() >= number:
+                    # Another process migrated while we waited for the lock
+                    self.conn.commit()
+                    continue
+                for sql_string in statements:
+                    self.cur.execute(sql_string)
+                self.cur.execute("PRAGMA user_version = {:d}".format(number))
+                self.conn.commit()
+            except Error as e:
+                self.conn.rollback()
+                print("Cannot migrate database to version {}:".format(number), e)
+                return -1
+        return self.schema_version()
+
+    def scanning_queries(self):
+        """Returns (name, plan) for every hot query whose EXPLAIN QUERY PLAN
+        contains a full table or index scan. An empty list means all of them
+        search an index."""
+        scans = []
+        for name, (sql_string, params) in HOT_QUERIES.items():
+            plan = self.cur.execute("EXPLAIN QUERY PLAN " + sql_string, params).fetchall()
+            for row in plan:
+                detail = row[-1]
+                # Walking a whole index is O(n) as well; only FTS5 tables,
+                # which are searched through their own index, may be scanned
+                if detail.startswith("SCAN") and "VIRTUAL TABLE INDEX" not in detail:
+                    scans.append((name, detail))
+        return scans
+
+    @staticmethod
+    def search_query(searchterm):
+        """Turns the user's input into an FTS5 query.
+        Every word is matched as a prefix and all words have to match. The
+        words are split like the prefix index splits them."""
+        return " ".join('"{}"*'.format(term) for term in prefix_index.tokenize(searchterm))
+
+    @cached
+    def search(self, searchterm, limit=None, offset=0):
+        """Returns the filenames matching `searchterm` in their fields or
+        their text, best match first. An empty searchterm returns all files.
+        `limit` and `offset` select one page of the results."""
+        query = self.search_query(searchterm)
+        if query:
+            sql_string = SEARCH_SQL
+            params = (query, query, query, -1 if limit is None else limit, offset)
+        else:
+            sql_string = "SELECT filename FROM tbl_file ORDER BY id DESC LIMIT ? OFFSET ?"
+            params = (-1 if limit is None else limit, offset)
+        try:
+            self.cur.execute(sql_string, params)
+        except Error as e:
+            print("Cannot search database:", e)
+            return []
+
+        return [row[0] for row in self.cur.fetchall()]
+
+    @cached
+    def search_count(self, searchterm):
+        """Returns the number of files matching `searchterm`."""
+        query = self.search_query(searchterm)
+        if query:
+            sql_string = COUNT_SQL
+            params = (query, query, query)
+        else:
+            sql_string = "SELECT count(*) FROM tbl_file"
+            params = ()
+        try:
+            self.cur.execute(sql_string, params)
+        except Error as e:
+            print("Cannot search database:", e)
+            return 0
+
+        return self.cur.fetchone()[0]
+
+    def search_records(self, searchterm, limit=None):
+        """Like `search`, but returns tuples of filename, location, year,
+        payperiod, keywords and persons."""
+        return [row for chunk in self.iter_records(searchterm, limit=limit) for row in chunk]
+
+    @staticmethod
+    def year_range(column, first_year, last_year):
+        """Returns the WHERE conditions and parameters for a range of years,
+        either end may be None."""
+        conditions, params = [], []
+        if first_year is not None:
+            conditions.append(column + ">=?")
+            params.append(first_year)
+        if last_year is not None:
+            conditions.append(column + "<=?")
+            params.append(last_year)
+        return conditions, params
+
+    def iter_chunks(self, sql_string, params, chunk_size):
+        """Runs `sql_string` on a cursor of its own and yields the result in
+        lists of up to `chunk_size` rows. Must be consumed on the thread that
+        started it, like every use of the connection."""
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql_string, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        except Error as e:
+            print("Cannot read database:", e)
+        finally:
+            cur.close()
+
+    def iter_records(self, searchterm="", first_year=None, last_year=None, limit=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Streams the files matching `searchterm` in the given years as
+        chunks of (filename, location, year, payperiod, keywords, persons)
+        rows, best match first, or newest first without a searchterm."""
+        query = self.search_query(searchterm)
+        conditions, params = self.year_range("f.year", first_year, last_year)
+        sql_string = RECORD_SQL
+        if query:
+            sql_string += " JOIN ({}) m ON m.rowid=f.id".format(MATCH_SQL)
+            params = [query, query, query] + params
+            order = "m.rank"
+        else:
+            order = "f.id DESC"
+        if conditions:
+            sql_string += " WHERE " + " AND ".join(conditions)
+        sql_string += " ORDER BY {} LIMIT ?".format(order)
+        params.append(-1 if limit is None else limit)
+        return self.iter_chunks(sql_string, params, chunk_size)
+
+    def iter_year_stats(self, first_year=None, last_year=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Streams the yearly keyword, employee and payperiod counts as
+        chunks of (year, kind, name, count) rows."""
+        conditions, params = self.year_range("year", first_year, last_year)
+        sql_string = YEAR_STATS_SQL
+        if conditions:
+            sql_string += " WHERE " + " AND ".join(conditions)
+        sql_string += " ORDER BY year,kind,cnt DESC,name"
+        return self.iter_chunks(sql_string, params, chunk_size)
+
+    @cached
     def get_location(self,filename):
-        sql_string = "SELECT location FROM tbl_file WHERE filename='{}'".format(filename)
+        sql_string = HOT_QUERIES["get_location"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (filename,))
         except:
             print("Cannot access database.")
 
@@ -91,34 +966,37 @@ class Database:
 
         return location[0]
 
+    @mutating
     def update_location(self, filename, location):
-        sql_string = "UPDATE tbl_file SET location = '{}' WHERE filename = '{}'".format(location, filename)
+        sql_string = "UPDATE tbl_file SET location = ? WHERE filename = ?"
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (location, filename))
             ret_val = 0
         except:
             print("Cannot access database.")
             ret_val = -1
         self.conn.commit()
+        self.reindex_files([filename])
         return ret_val        
 
     def get_latest_id(self):
-        sql_string= "SELECT id from tbl_file ORDER BY id DESC LIMIT 1;"
+        sql_string= HOT_QUERIES["get_latest_id"][0]
         try:                            
             self.cur.execute(sql_string)
         except:                             
             print("Cannot access database.")
         lastid = self.cur.fetchone()
-        if lastid:
+        if lastid and lastid[0] is not None:
             return int(lastid[0])
         else:
             return 0
 
+    @cached
     def is_keyword_in_db(self,keyword):
 
-        sql_string = "SELECT id FROM tbl_keyword WHERE keyword='{}'".format(keyword)
+        sql_string = HOT_QUERIES["is_keyword_in_db"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (keyword,))
         except:
             print("Cannot access database.")
 
@@ -126,11 +1004,12 @@ class Database:
 
         return True if keyword_id else False
 
+    @cached
     def keyword_unused(self,keyword):
         if self.is_keyword_in_db(keyword):
-            sql_string = "SELECT * FROM tbl_hlp_file_keyword JOIN tbl_keyword ON keyword_id=tbl_keyword.id WHERE tbl_keyword.keyword = '{}'".format(keyword)
+            sql_string = HOT_QUERIES["keyword_unused"][0]
             try:
-                self.cur.execute(sql_string)
+                self.cur.execute(sql_string, (keyword,))
             except:
                 print("Cannot access database.")
             uses = self.cur.fetchall()
@@ -144,6 +1023,7 @@ class Database:
         return ret_val
 
 
+    @cached
     def list_keywords(self):
         sql_string = "SELECT id, keyword FROM tbl_keyword"
         try:
@@ -153,13 +1033,15 @@ class Database:
 
         keywords = self.cur.fetchall()
 
+        import pandas as pd
         return pd.DataFrame(keywords,columns=["id","keyword"])
 
 
+    @cached
     def get_keywords(self,year):
-        sql_string =  "SELECT keyword,count(keyword) FROM tbl_file f JOIN tbl_hlp_file_keyword h ON f.id=h.file_id JOIN tbl_keyword k ON h.keyword_id=k.id WHERE year={} GROUP BY keyword;".format(year)
+        sql_string = HOT_QUERIES["get_keywords"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (year,))
         except:
             print("Cannot access database.")
 
@@ -168,10 +1050,11 @@ class Database:
         return dict(keywords) 
 
 
+    @cached
     def get_person(self,year):
-        sql_string =  "SELECT name,count(name) FROM tbl_file f JOIN tbl_hlp_file_person h ON f.id=h.file_id JOIN tbl_person p ON h.person_id=p.id WHERE year={} GROUP BY name;".format(year)
+        sql_string = HOT_QUERIES["get_person"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (year,))
         except:
             print("Cannot access database.")
 
@@ -180,8 +1063,46 @@ class Database:
         return dict(persons) 
 
 
+    @cached
+    def get_payperiods(self,year):
+        sql_string = HOT_QUERIES["get_payperiods"][0]
+        try:
+            self.cur.execute(sql_string, (year,))
+        except:
+            print("Cannot access database.")
+
+        payperiods = self.cur.fetchall()
+
+        return dict(payperiods)
+
+
+    @cached
+    def keyword_counts_by_year(self):
+        """Returns (year, keyword, count) for every year, read in one query
+        from the aggregate table."""
+        return self.counts_by_year("SELECT s.year,k.keyword,s.cnt FROM tbl_stat_keyword_year s JOIN tbl_keyword k ON k.id=s.keyword_id")
+
+    @cached
+    def person_counts_by_year(self):
+        """Returns (year, person, count) for every year."""
+        return self.counts_by_year("SELECT s.year,p.name,s.cnt FROM tbl_stat_person_year s JOIN tbl_person p ON p.id=s.person_id")
+
+    @cached
+    def payperiod_counts_by_year(self):
+        """Returns (year, payperiod, count) for every year."""
+        return self.counts_by_year("SELECT year,payperiod,cnt FROM tbl_stat_payperiod_year")
+
+    def counts_by_year(self, sql_string):
+        try:
+            self.cur.execute(sql_string)
+        except Error as e:
+            print("Cannot access database:", e)
+            return []
+        return self.cur.fetchall()
+
+    @cached
     def get_years(self):
-        sql_string = "SELECT DISTINCT year FROM tbl_file;"
+        sql_string = "SELECT DISTINCT year FROM tbl_stat_payperiod_year;"
         try:
             self.cur.execute(sql_string)
         except:
@@ -194,37 +1115,42 @@ class Database:
 
 
 
+    @cached
     def keywords_on_file(self, filename):
-        sql_string = "SELECT f.id,k.keyword FROM tbl_file f JOIN tbl_hlp_file_keyword h ON f.id=h.file_id JOIN tbl_keyword k ON h.keyword_id=k.id WHERE filename='{}'".format(filename)
+        sql_string = HOT_QUERIES["keywords_on_file"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (filename,))
         except:
             print("Cannot access database.")
 
         keywords = self.cur.fetchall()
 
+        import pandas as pd
         return pd.DataFrame(keywords,columns=["id","keyword"])
 
 
+    @cached
     def persons_on_file(self, filename):
-        sql_string = "SELECT f.id,p.name FROM tbl_file f JOIN tbl_hlp_file_person h ON f.id=h.file_id JOIN tbl_person p ON h.person_id=p.id WHERE filename='{}'".format(filename)
+        sql_string = HOT_QUERIES["persons_on_file"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (filename,))
         except:
             print("Cannot access database.")
 
         persons = self.cur.fetchall()
 
+        import pandas as pd
         return pd.DataFrame(persons,columns=["id","person"])
 
 
+    @mutating
     def delete_keyword(self,keyword):
         kw_in_db = self.is_keyword_in_db(keyword)
         kw_unused = self.keyword_unused(keyword)
         if kw_in_db and kw_unused:
-            sql_string = "DELETE FROM tbl_keyword WHERE keyword = '{}'".format(keyword)
+            sql_string = "DELETE FROM tbl_keyword WHERE keyword = ?"
             try:
-                self.cur.execute(sql_string)
+                self.cur.execute(sql_string, (keyword,))
             except:
                 print("Could not delete keyword from database.")
             self.conn.commit()
@@ -235,32 +1161,48 @@ class Database:
             print("Keyword not in database")
 
 
-    def add_person(self,person):
-        """Adds `person` to the database"""
-        # if self.is_keyword_in_db(keyword):
-            # print("Keyword {} is in database already.".format(keyword))
-            # ret_val = -1
-        # else:
-        sql_string = "INSERT INTO tbl_person(name) VALUES('{}')".format(person)
+    @cached
+    def is_person_in_db(self,person):
+
+        sql_string = HOT_QUERIES["is_person_in_db"][0]
         try:
-            self.cur.execute(sql_string)
-            ret_val = self.cur.lastrowid
+            self.cur.execute(sql_string, (person,))
         except:
-            print("Cannot add person to the database. Cancelling.")
-            ret_val = -2
-        self.conn.commit()
+            print("Cannot access database.")
+
+        person_id = self.cur.fetchone()
+
+        return True if person_id else False
+
+
+    @mutating
+    def add_person(self,person):
+        """Adds `person` to the database"""
+        if self.is_person_in_db(person):
+            print("Person {} is in database already.".format(person))
+            ret_val = -1
+        else:
+            sql_string = "INSERT INTO tbl_person(name) VALUES(?)"
+            try:
+                self.cur.execute(sql_string, (person,))
+                ret_val = self.cur.lastrowid
+            except:
+                print("Cannot add person to the database. Cancelling.")
+                ret_val = -2
+            self.conn.commit()
         return ret_val
 
 
+    @mutating
     def add_keyword(self,keyword):
         """Adds `filename` to the database"""
         if self.is_keyword_in_db(keyword):
             print("Keyword {} is in database already.".format(keyword))
             ret_val = -1
         else:
-            sql_string = "INSERT INTO tbl_keyword(keyword) VALUES('{}')".format(keyword)
+            sql_string = "INSERT INTO tbl_keyword(keyword) VALUES(?)"
             try:
-                self.cur.execute(sql_string)
+                self.cur.execute(sql_string, (keyword,))
                 ret_val = self.cur.lastrowid
             except:
                 print("Cannot add keyword to the database. Cancelling.")
@@ -270,78 +1212,83 @@ class Database:
 
 
     def add_person_to_file(self,filename,person):
-        self.add_person(person)
-        sql_string1 = "SELECT id FROM tbl_file WHERE filename='{}'".format(filename)
-        sql_string2 = "SELECT id FROM tbl_person WHERE name='{}'".format(person)
-        try:
-            self.cur.execute(sql_string1)
-        except:
-            print("Could not get file from database.")
-        fileid = self.cur.fetchone() 
-        try:
-            self.cur.execute(sql_string2)
-        except:
-            print("Could not get person from database.")
-        personid = self.cur.fetchone() 
-        print(personid) 
-        sql_string3 = "INSERT INTO tbl_hlp_file_person (file_id,person_id) VALUES ('{}','{}')".format(fileid[0],personid[0])
-
-        try:
-            self.cur.execute(sql_string3)
-        except:
-            print("Could not insert person to database.")
-        self.conn.commit()
-
+        """Adds `person` to `filename`, creating the person if necessary.
+        Returns the number of links added, see tag_files."""
+        return self.tag_files([filename], persons=[person])
 
 
     def add_keyword_to_file(self,filename,keyword):
-        sql_string1 = "SELECT id FROM tbl_file WHERE filename='{}'".format(filename)
-        sql_string2 = "SELECT id FROM tbl_keyword WHERE keyword='{}'".format(keyword)
-        try:
-            self.cur.execute(sql_string1)
-        except:
-            print("Could not delete keyword from database.")
-        fileid = self.cur.fetchone() 
+        """Adds the existing `keyword` to `filename`. Returns the number of
+        links added, see tag_files."""
+        return self.tag_files([filename], keywords=[keyword], create=False)
+
+
+    @mutating
+    def tag_files(self,filenames,keywords=(),persons=(),remove=False,create=True):
+        """Adds `keywords` and `persons` to every file of `filenames`, or
+        removes them with remove=True, in one transaction. Links that exist
+        already are skipped. With `create`, missing keywords and persons are
+        added first. Returns the number of links added or removed, or -2 if
+        the transaction was rolled back."""
+        # The lists are bound as one JSON array each, so every statement runs
+        # once for all files, however many there are
+        files = json.dumps(list(filenames))
+        tags = [("tbl_hlp_file_keyword", "keyword_id", "tbl_keyword", "keyword", json.dumps(list(keywords))),
+                ("tbl_hlp_file_person", "person_id", "tbl_person", "name", json.dumps(list(persons)))]
+        count = 0
         try:
-            self.cur.execute(sql_string2)
-        except:
-            print("Could not delete keyword from database.")
-        keywordid = self.cur.fetchone() 
-        
-        sql_string3 = "INSERT INTO tbl_hlp_file_keyword (file_id,keyword_id) VALUES ('{}','{}')".format(fileid[0],keywordid[0])
-
-        try:
-            self.cur.execute(sql_string3)
-        except:
-            print("Could not delete keyword from database.")
-        self.conn.commit()
+            self.cur.execute("BEGIN IMMEDIATE")
+            for link_table, link_column, table, column, values in tags:
+                if values == "[]":
+                    continue
+                if remove:
+                    sql_string = ("DELETE FROM {0} WHERE file_id IN (SELECT id FROM tbl_file WHERE filename IN (SELECT value FROM json_each(?))) "
+                                  "AND {1} IN (SELECT id FROM {2} WHERE {3} IN (SELECT value FROM json_each(?)))").format(link_table, link_column, table, column)
+                else:
+                    if create:
+                        self.cur.execute("INSERT OR IGNORE INTO {0}({1}) SELECT DISTINCT value FROM json_each(?)".format(table, column), (values,))
+                    sql_string = ("INSERT OR IGNORE INTO {0}(file_id,{1}) SELECT f.id,t.id FROM tbl_file f, {2} t "
+                                  "WHERE f.filename IN (SELECT value FROM json_each(?)) AND t.{3} IN (SELECT value FROM json_each(?))").format(link_table, link_column, table, column)
+                self.cur.execute(sql_string, (files, values))
+                count += self.cur.rowcount
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            print("Cannot tag files. Cancelling.", e)
+            return -2
+        self.reindex_files(filenames)
+        return count
 
 
+    @mutating
     def delete_keyword_from_file(self,filename, keyword):
-        sql_string = "SELECT h.rowid FROM tbl_file f JOIN tbl_hlp_file_keyword h ON f.id=h.file_id JOIN tbl_keyword k ON h.keyword_id=k.id WHERE f.filename='{}' AND k.keyword='{}'".format(filename,keyword)
+        sql_string = HOT_QUERIES["delete_keyword_from_file"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (filename,keyword))
         except:
             print("Could not connect to database.")
         rowid = self.cur.fetchone() 
-        sql_string_del = "DELETE FROM tbl_hlp_file_keyword WHERE rowid='{}'".format(rowid[0])
+        sql_string_del = "DELETE FROM tbl_hlp_file_keyword WHERE rowid=?"
         try:
-            self.cur.execute(sql_string_del)
+            self.cur.execute(sql_string_del, (rowid[0],))
         except:
             print("Could not connect to database.")
         self.conn.commit() 
+        self.reindex_files([filename])
 
+    @mutating
     def delete_person_from_file(self,filename, person):
-        sql_string = "SELECT h.rowid FROM tbl_file f JOIN tbl_hlp_file_person h ON f.id=h.file_id JOIN tbl_person p ON h.person_id=p.id WHERE f.filename='{}' AND p.name='{}'".format(filename,person)
+        sql_string = HOT_QUERIES["delete_person_from_file"][0]
         try:
-            self.cur.execute(sql_string)
+            self.cur.execute(sql_string, (filename,person))
         except:
             print("Could not connect to database.")
         rowid = self.cur.fetchone() 
-        sql_string_del = "DELETE FROM tbl_hlp_file_person WHERE rowid='{}'".format(rowid[0])
+        sql_string_del = "DELETE FROM tbl_hlp_file_person WHERE rowid=?"
         try:
-            self.cur.execute(sql_string_del)
+            self.cur.execute(sql_string_del, (rowid[0],))
         except:
             print("Could not connect to database.")
         self.conn.commit() 
+        self.reindex_files([filename])
  
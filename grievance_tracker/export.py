@@ -0,0 +1,102 @@
+"""Streaming export of search results and yearly statistics.
+
+The rows come from Database.iter_records and Database.iter_year_stats in
+chunks, and every chunk is written out before the next one is fetched, so
+the memory used does not grow with the size of the archive.
+
+    with open("results.jsonl", "w") as out:
+        export.write_jsonl(db.iter_records("safety", 2020, 2022), export.RECORD_FIELDS, out)
+
+Parquet needs pyarrow, which is optional and only imported for that format.
+"""
+import csv
+import json
+import os
+import sys
+
+RECORD_FIELDS = ("filename", "location", "year", "payperiod", "keywords", "persons")
+STAT_FIELDS = ("year", "kind", "name", "count")
+INTEGER_FIELDS = ("year", "payperiod", "count")
+
+# Parquet readers are fastest with large row groups, so chunks are collected
+# up to this many rows before they are written
+PARQUET_ROW_GROUP = 16384
+
+
+def write_csv(chunks, fields, out):
+    """Writes the rows as CSV with a header line. Returns the row count."""
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_jsonl(chunks, fields, out):
+    """Writes one JSON object per row. Returns the row count."""
+    count = 0
+    for rows in chunks:
+        out.write("".join(json.dumps(dict(zip(fields, row))) + "\n" for row in rows))
+        count += len(rows)
+    return count
+
+
+def write_parquet(chunks, fields, out):
+    """Writes the rows as a Parquet file. Returns the row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(field, pa.int64() if field in INTEGER_FIELDS else pa.string()) for field in fields])
+
+    def flush(writer, pending):
+        columns = list(zip(*pending)) or [()] * len(fields)
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=schema.field(i).type) for i, column in enumerate(columns)],
+            schema=schema))
+
+    count = 0
+    pending = []
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in chunks:
+            pending.extend(rows)
+            count += len(rows)
+            if len(pending) >= PARQUET_ROW_GROUP:
+                flush(writer, pending)
+                pending = []
+        if pending or not count:
+            flush(writer, pending)
+    return count
+
+
+# format: (writer, opens the output in binary mode)
+FORMATS = {
+    "csv": (write_csv, False),
+    "jsonl": (write_jsonl, False),
+    "parquet": (write_parquet, True),
+}
+
+
+def format_of(filename, default="csv"):
+    """Guesses the format from the extension of `filename`."""
+    ext = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if ext == "json":
+        ext = "jsonl"
+    return ext if ext in FORMATS else default
+
+
+def export(chunks, fields, filename=None, fmt=None):
+    """Writes `chunks` to `filename`, or to stdout without one. Returns the
+    row count."""
+    if fmt is None:
+        fmt = format_of(filename)
+    write, binary = FORMATS[fmt]
+    if filename is None:
+        return write(chunks, fields, sys.stdout.buffer if binary else sys.stdout)
+    if binary:
+        out = open(filename, "wb")
+    else:
+        out = open(filename, "w", newline="", encoding="utf-8")
+    with out:
+        return write(chunks, fields, out)
@@ -0,0 +1,173 @@
+"""Text extraction from the stored files for the full-text search.
+
+    python -m grievance_tracker reindex [--processes 4] [--all]
+
+The text of PDFs and plain text files is extracted in a process pool, so
+large scans use every core and neither the GUI nor an import waits for
+them. It is stored in tbl_text, which search() matches besides the fields
+typed in by hand. PDFs need pypdf (pip install pypdf); without it they are
+left for a later reindex.
+
+A reindex stores the text in batches and only picks files that have none,
+so an interrupted reindex is resumed by running it again.
+"""
+import io
+import lzma
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from . import store
+
+TEXT_EXTENSIONS = {".txt", ".text", ".md", ".csv", ".log", ".eml"}
+# Characters kept per file, the letters are far shorter
+MAX_TEXT = 1000000
+# Texts stored per transaction
+BATCH_SIZE = 100
+# Extractions queued per process before submit() waits for results
+QUEUED_PER_PROCESS = 8
+
+
+def extract_text(path):
+    """Returns the text of the file at `path`, "" if there is none to
+    extract, or None if it has to be tried again later: a PDF without pypdf
+    installed or a file that cannot be read. Runs in a worker process."""
+    ext = os.path.splitext(store.blob_name(path))[1].lower()
+    try:
+        if ext in TEXT_EXTENSIONS:
+            with io.TextIOWrapper(store.open_blob(path), encoding="utf-8", errors="replace") as fh:
+                return fh.read(MAX_TEXT)
+        if ext == ".pdf":
+            try:
+                from pypdf import PdfReader
+            except ImportError:
+                return None
+            stream = path
+            if store.blob_codec(path):
+                # pypdf seeks back and forth, which is slow in a compressed stream
+                with store.open_blob(path) as fh:
+                    stream = io.BytesIO(fh.read())
+            pages, size = [], 0
+            for page in PdfReader(stream).pages:
+                pages.append(page.extract_text() or "")
+                size += len(pages[-1])
+                if size >= MAX_TEXT:
+                    break
+            return "\n".join(pages)[:MAX_TEXT]
+    except (OSError, EOFError, lzma.LZMAError, zlib.error) as e:
+        print("Cannot read {}: {}".format(path, e))
+        return None
+    except Exception as e:
+        # A broken PDF; it is marked as done, retrying will not help
+        print("Cannot extract text of {}: {}".format(path, e))
+    return ""
+
+
+def ignore_interrupt():
+    # Ctrl-C reaches the whole process group; the parent decides what to do
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class TextIndexer:
+    """Extracts the text of stored files in a process pool and stores it in
+    `db`. submit() returns right away; results are stored as they come in by
+    later calls, by flush() and by close(). Can be shared between threads."""
+
+    def __init__(self, db, directory, processes=None, batch_size=BATCH_SIZE, report=None):
+        self.db = db
+        self.directory = directory
+        self.batch_size = batch_size
+        self.report = report
+        self.processes = processes or os.cpu_count() or 1
+        # Workers are started fresh instead of forked from a process with Tk
+        # and threads in it
+        self.pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=ignore_interrupt)
+        self.lock = threading.RLock()
+        self.pending = deque()
+        self.texts = []
+        self.stats = {"extracted": 0, "skipped": 0}
+
+    def submit(self, filenames=None):
+        """Queues the files of `filenames` that have no text yet, or all such files."""
+        self.add(self.db.files_without_text(self.directory, filenames))
+
+    def add(self, files):
+        """Queues (file id, path) rows."""
+        with self.lock:
+            for file_id, path in files:
+                while len(self.pending) >= self.processes * QUEUED_PER_PROCESS:
+                    self.collect(wait=True)
+                self.pending.append((file_id, self.pool.submit(extract_text, path)))
+            self.collect()
+
+    def collect(self, wait=False):
+        """Takes the finished extractions off the queue, in order. With
+        `wait`, waits for the first one."""
+        with self.lock:
+            while self.pending and (wait or self.pending[0][1].done()):
+                wait = False
+                file_id, future = self.pending.popleft()
+                text = future.result()
+                if text is None:
+                    self.stats["skipped"] += 1
+                else:
+                    self.texts.append((file_id, text))
+                if len(self.texts) >= self.batch_size:
+                    self.store()
+
+    def store(self):
+        with self.lock:
+            if self.texts and self.db.add_texts(self.texts) >= 0:
+                self.stats["extracted"] += len(self.texts)
+            self.texts = []
+            if self.report:
+                self.report(self.stats)
+
+    def flush(self):
+        """Waits for all queued files and stores their text."""
+        with self.lock:
+            while self.pending:
+                self.collect(wait=True)
+            self.store()
+        return self.stats
+
+    def close(self):
+        stats = self.flush()
+        self.pool.shutdown()
+        return stats
+
+    def abort(self):
+        """Stores what has been extracted and drops the queued files."""
+        with self.lock:
+            self.store()
+            self.pending.clear()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def reindex(db, directory, processes=None, report=print):
+    """Extracts the text of every file that has none yet.
+    Returns the number of extracted and skipped files and the files per second."""
+    files = db.files_without_text(directory)
+    start = time.perf_counter()
+
+    def progress(stats):
+        done = stats["extracted"] + stats["skipped"]
+        if done:
+            report("{} of {} files ({:.1f} files/s)".format(done, len(files), done / (time.perf_counter() - start)))
+
+    indexer = TextIndexer(db, directory, processes, report=progress)
+    try:
+        indexer.add(files)
+        stats = indexer.close()
+    except BaseException:
+        indexer.abort()
+        raise
+    stats["seconds"] = time.perf_counter() - start
+    stats["files_per_second"] = (stats["extracted"] + stats["skipped"]) / stats["seconds"] if stats["seconds"] else 0
+    return stats
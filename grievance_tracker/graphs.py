@@ -1,46 +1,143 @@
+"""Charts of the statistics page.
+
+Charts are rendered to PNG with matplotlib's Agg canvas, which does not
+touch Tk and can run on a worker thread. ChartView keeps the rendered
+images in an LRU cache keyed by (chart, year, data version, size), so going
+back to a chart that has been shown before only swaps the image.
+
+The charts over all years get (year, name, count) rows from one query and
+pivot them into a year x name table in a single pandas operation.
+"""
+import io
 import tkinter as tk
-import pandas as pd
+from collections import OrderedDict
+
 import numpy as np
-import matplotlib
-matplotlib.use("TkAgg")
+import pandas as pd
+
 from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import (
-        FigureCanvasTkAgg, NavigationToolbar2Tk)
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+DPI = 100
+# Charts kept as images, a few years of every chart type
+CHART_CACHE_SIZE = 32
+# Charts over all years, see render_trend
+TREND_CHARTS = ("stacked", "heatmap", "top")
+# Employees shown in the "top" chart
+TOP_N = 10
+
+
+def render_chart(kind, title, values, labels, width=600, height=400):
+    """Renders a "bars" or "pie" chart of `width` x `height` pixels and
+    returns it as PNG bytes. Safe to call from any thread."""
+    figure = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title)
+    values, labels = list(values), list(labels)
+    if kind == "pie":
+        if values:
+            axes.pie(values, labels=labels, autopct='%1.1f%%')
+    else:
+        axes.bar(labels, values)
+    out = io.BytesIO()
+    figure.savefig(out, format="png")
+    return out.getvalue()
+
+
+def pivot(rows):
+    """Turns (year, name, count) rows into a table with a row per year and a
+    column per name. Missing combinations count 0."""
+    frame = pd.DataFrame.from_records(rows, columns=["year", "name", "count"])
+    table = frame.pivot_table(index="year", columns="name", values="count", aggfunc="sum", fill_value=0)
+    return table.sort_index()
+
+
+def render_trend(kind, title, rows, width=600, height=400, top_n=TOP_N):
+    """Renders a chart over all years from (year, name, count) rows:
+    "stacked"  keyword counts stacked per year
+    "heatmap"  counts per payperiod and year
+    "top"      the `top_n` names with the highest count over all years,
+               split by year
+    Returns PNG bytes like render_chart."""
+    figure = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title)
+    table = pivot(rows)
+    if table.empty:
+        pass
+    elif kind == "stacked":
+        # Each keyword's bars start where the keywords before it end
+        counts = table.to_numpy()
+        bottoms = np.cumsum(counts, axis=1) - counts
+        years = [str(year) for year in table.index]
+        for i, keyword in enumerate(table.columns):
+            axes.bar(years, counts[:, i], bottom=bottoms[:, i], label=keyword)
+        axes.legend(fontsize="small", ncol=2)
+    elif kind == "heatmap":
+        image = axes.imshow(table.to_numpy(), aspect="auto", cmap="viridis")
+        axes.set_yticks(np.arange(len(table.index)), [str(year) for year in table.index])
+        axes.set_xticks(np.arange(len(table.columns)), [str(payperiod) for payperiod in table.columns])
+        axes.set_xlabel("Payperiod")
+        figure.colorbar(image, ax=axes)
+    elif kind == "top":
+        top = table[table.sum(axis=0).nlargest(top_n).index].T.iloc[::-1]
+        counts = top.to_numpy()
+        lefts = np.cumsum(counts, axis=1) - counts
+        for i, year in enumerate(top.columns):
+            axes.barh(top.index, counts[:, i], left=lefts[:, i], label=str(year))
+        axes.legend(fontsize="small")
+    figure.tight_layout()
+    out = io.BytesIO()
+    figure.savefig(out, format="png")
+    return out.getvalue()
 
 
 class ChartView(tk.Frame):
-    def __init__(self, parent):
+    def __init__(self, parent, cache_size=CHART_CACHE_SIZE):
         super().__init__(parent)
-        self.figure = Figure(figsize = (6, 4), dpi=100)
-        self.canvas = FigureCanvasTkAgg(self.figure, master = self)
-
-        # Add Toolbar
-        # self.toolbar = NavigationToolbar2Tk(self.canvas, self)
-        self.canvas.get_tk_widget().pack(fill='both',expand='True')
-
-        # Set up axes
-        self.axes = self.figure.add_subplot(1,1,1)
-        # self.axes.set_xlabel(x_axis)
-        # self.axes.set_ylabel(y_axis)
-
-        # Setup for legend
-        self.lines = []
-        self.line_labels = []
-
-    # def draw_lines(self, data):
-    def draw_pie(self, title, fracts, labels, explode, autopct, shadow=True, startangle=90):
-        self.axes.clear()
-        self.axes.set_title(title)
-        self.axes.pie(fracts, explode=explode, labels=labels, autopct=autopct)
-        self.canvas.draw()
-
-    def draw_bars(self, title, size, labels):
-        self.axes.clear()
-        self.axes.set_title(title)
-        self.axes.bar(labels, size)
-        self.canvas.draw()
+        # No border or padding, the image alone sets the size of the view and
+        # rendering at that size does not make it grow
+        self.label = tk.Label(self, borderwidth=0, padx=0, pady=0, highlightthickness=0)
+        self.label.pack(fill='both',expand='True')
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.key = None
+
+    def size(self):
+        """Returns the size a chart should be rendered at to fill the view."""
+        width, height = self.winfo_width(), self.winfo_height()
+        if width < 50 or height < 50:
+            # Not laid out yet
+            return 600, 400
+        return width, height
+
+    def show_cached(self, key):
+        """Shows the chart cached under `key`. Returns False if there is none."""
+        image = self.cache.get(key)
+        if image is None:
+            return False
+        self.cache.move_to_end(key)
+        self.key = key
+        self.label.configure(image=image)
+        return True
+
+    def show_png(self, key, png):
+        """Shows a chart rendered by render_chart and caches it under `key`."""
+        image = tk.PhotoImage(data=png, format="png")
+        self.cache[key] = image
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        self.key = key
+        self.label.configure(image=image)
+
+    def draw_pie(self, title, fracts, labels, key=None):
+        self.show_png(key or ("pie", title), render_chart("pie", title, fracts, labels, *self.size()))
+
+    def draw_bars(self, title, size, labels, key=None):
+        self.show_png(key or ("bars", title), render_chart("bars", title, size, labels, *self.size()))
 
     def clear(self):
-        self.axes.clear()
-        self.canvas.draw()
+        self.key = None
+        self.label.configure(image="")
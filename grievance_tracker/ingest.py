@@ -0,0 +1,214 @@
+"""Watched inbox folder: files scanned into it are added to the archive.
+
+    python -m grievance_tracker watch INBOX [--interval 5] [--location Orem]
+
+The inbox is polled. An index of the mtime and size of every file seen is
+kept on disk, in INBOX/.ingest_index.json, so a pass only stats the
+entries and looks closer at new or changed ones; nothing is hashed twice.
+A file is only taken once it has not changed for --settle seconds, so
+files that are still being written are left for the next pass.
+
+Location, year and payperiod are taken from the path, see PATTERNS:
+
+    Orem/2021/PP03/scan 12.pdf
+    Orem/2021-pp3 overtime.pdf
+
+Values that cannot be inferred come from --location, --year and
+--payperiod. Files without a year or payperiod are reported and left in
+the inbox. New files go through bulk_import in batches, like a manual
+import, including the text extraction. A file that is replaced under the
+same name is imported again, as a new file, if its content changed; its
+earlier version stays in the archive. A file that is only touched is not. Every pass reports the throughput
+and the lag from a file's last change to its commit.
+"""
+import json
+import os
+import re
+import statistics
+import time
+
+from . import bulk_import
+
+INDEX_FILE = ".ingest_index.json"
+POLL_SECONDS = 5.0
+SETTLE_SECONDS = 2.0
+# Named groups location, year and payperiod, matched against the path
+# relative to the inbox with '/' separators. The first match of a group wins.
+PATTERNS = [
+    r"(?i)(?:^|[^a-z])(?:pp|pay ?period)[ _-]?(?P<payperiod>\d{1,2})(?!\d)",
+    r"(?:^|\D)(?P<year>(?:19|20)\d\d)(?!\d)",
+    # The top folder is the location unless it is a year or payperiod
+    r"^(?!(?:19|20)\d\d/|(?i:pp|pay ?period)[ _-]?\d)(?P<location>[^/]+)/",
+]
+PAYPERIODS = range(1, 28)
+
+
+def infer_fields(relpath, patterns, defaults):
+    """Returns location, year and payperiod of the file at `relpath`, taken
+    from the first of `patterns` that matches each, else from `defaults`.
+    Returns None if the year or payperiod is missing or out of range."""
+    fields = {}
+    for pattern in patterns:
+        match = pattern.search(relpath)
+        if match:
+            for name, value in match.groupdict().items():
+                if value is not None and name not in fields:
+                    fields[name] = value
+    for name, value in defaults.items():
+        if fields.get(name) is None and value is not None:
+            fields[name] = value
+    try:
+        fields["year"] = int(fields["year"])
+        fields["payperiod"] = int(fields["payperiod"])
+    except (KeyError, ValueError):
+        return None
+    if fields["payperiod"] not in PAYPERIODS:
+        return None
+    fields.setdefault("location", "")
+    return fields
+
+
+class Inbox:
+    """The files of `directory` and the on-disk index of the ones seen."""
+
+    def __init__(self, directory, index_file=None, settle=SETTLE_SECONDS):
+        self.directory = os.path.abspath(directory)
+        self.index_file = index_file or os.path.join(self.directory, INDEX_FILE)
+        self.settle = settle
+        # relative path -> [mtime_ns, size]
+        self.index = {}
+        # The same for files whose fields could not be inferred. Not saved,
+        # so they are tried again after a restart with other defaults.
+        self.unplaced = {}
+        self.changed = False
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file) as fh:
+                    self.index = json.load(fh)
+            except (OSError, ValueError) as e:
+                print("Cannot read the inbox index, starting a new one:", e)
+
+    def entries(self, directory=None, prefix=""):
+        """Yields (relative path, DirEntry) of all files below `directory`."""
+        with os.scandir(directory or self.directory) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.entries(entry.path, prefix + entry.name + "/")
+                elif entry.is_file():
+                    yield prefix + entry.name, entry
+
+    def scan(self):
+        """Returns (relative path, path, [mtime_ns, size]) of the files that
+        are new or changed since they were indexed and have settled. Files
+        that are gone are dropped from the index."""
+        now = time.time_ns()
+        found = set()
+        candidates = []
+        for relpath, entry in self.entries():
+            found.add(relpath)
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            key = [stat.st_mtime_ns, stat.st_size]
+            if self.index.get(relpath) == key or self.unplaced.get(relpath) == key:
+                continue
+            if now - stat.st_mtime_ns < self.settle * 1e9:
+                # Probably still being written
+                continue
+            candidates.append((relpath, entry.path, key))
+        for relpath in set(self.index) - found:
+            del self.index[relpath]
+            self.changed = True
+        return candidates
+
+    def mark(self, relpath, key):
+        self.index[relpath] = key
+        self.changed = True
+
+    def save(self):
+        """Writes the index if it has changed, replacing the old one at once."""
+        if not self.changed:
+            return
+        tmp = self.index_file + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(self.index, fh)
+        os.replace(tmp, self.index_file)
+        self.changed = False
+
+
+def ingest(db, inbox, upload_dir, patterns, defaults, batch_size=bulk_import.BATCH_SIZE, indexer=None, report=print):
+    """Runs one pass over `inbox`. Returns a dict with the number of files
+    found, imported, skipped, failed and unknown (fields not inferred), the
+    seconds taken and the lag of the imported files."""
+    start = time.perf_counter()
+    candidates = inbox.scan()
+    jobs, unknown = [], 0
+    for relpath, path, key in candidates:
+        fields = infer_fields(relpath, patterns, defaults)
+        if fields is None:
+            report("Cannot tell the year and payperiod of {}, left in the inbox".format(relpath))
+            unknown += 1
+            # Looked at again when it changes, e.g. is renamed
+            inbox.unplaced[relpath] = key
+            continue
+        jobs.append(dict(fields, path=path, keywords=[], persons=[], relpath=relpath, key=key))
+    stats = {"found": len(candidates), "imported": 0, "skipped": 0, "failed": 0, "unknown": unknown, "lag": []}
+    if jobs:
+        result = bulk_import.bulk_import(db, jobs, upload_dir, batch_size, report=lambda msg: None,
+                                         text=indexer is not None, indexer=indexer, origin=inbox.directory)
+        for name in ("imported", "skipped", "failed"):
+            stats[name] = result[name]
+        # Files that failed are tried again in the next pass
+        imported = db.imported_sources()
+        committed = time.time_ns()
+        for job in jobs:
+            if job.get("source") in imported:
+                inbox.mark(job["relpath"], job["key"])
+                if "filename" in job:
+                    stats["lag"].append((committed - job["key"][0]) / 1e9)
+    inbox.save()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def watch(db, directory, upload_dir, patterns=PATTERNS, defaults=None, interval=POLL_SECONDS,
+          settle=SETTLE_SECONDS, once=False, text=True, report=print):
+    """Ingests new files of `directory` every `interval` seconds until
+    interrupted, or once."""
+    patterns = [re.compile(pattern) for pattern in patterns]
+    defaults = defaults or {}
+    inbox = Inbox(directory, settle=settle)
+    indexer = None
+    if text:
+        from . import extract
+        indexer = extract.TextIndexer(db, upload_dir)
+    total, started = 0, time.perf_counter()
+    report("Watching {} every {:.0f} s".format(inbox.directory, interval))
+    try:
+        while True:
+            stats = ingest(db, inbox, upload_dir, patterns, defaults, indexer=indexer, report=report)
+            if indexer is not None:
+                # Stores the texts extracted since the last pass
+                indexer.collect()
+                indexer.store()
+            if stats["found"]:
+                total += stats["imported"]
+                lag = stats["lag"]
+                report("{found} new files: {imported} imported, {skipped} skipped, {failed} failed, {unknown} without fields".format(**stats)
+                       + " in {:.1f} s ({:.1f} files/s)".format(stats["seconds"], stats["imported"] / stats["seconds"])
+                       + (", lag median {:.1f} s, max {:.1f} s".format(statistics.median(lag), max(lag)) if lag else "")
+                       + ", {} files since start".format(total))
+            if once:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        inbox.save()
+        if indexer is not None:
+            indexer.close()
+    report("{} files imported in {:.0f} s".format(total, time.perf_counter() - started))
+    return total
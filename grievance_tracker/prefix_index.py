@@ -0,0 +1,148 @@
+"""In-memory prefix index for the search-as-you-type box.
+
+Every (token, file id) pair of the filenames, locations, keywords and person
+names is kept in one sorted list. All pairs whose token starts with a prefix
+form one contiguous slice of that list, found with two bisects. The pairs of
+each file are also kept as a set, so a word in several fields of one file is
+one pair, and retagging a file only touches the pairs that changed.
+"""
+import bisect
+import heapq
+import re
+import sys
+import threading
+from operator import itemgetter
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+MAX_CHAR = chr(sys.maxunicode)
+# From this many changed pairs on, update_files rebuilds the pair list with
+# splice() instead of inserting and deleting pair by pair
+BULK_UPDATE = 16
+file_id_of = itemgetter(1)
+
+
+def tokenize(text):
+    """Splits `text` like the FTS5 unicode61 tokenizer: lower case, on
+    everything that is not a letter or digit."""
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def splice(pairs, removed, added):
+    """Returns the sorted list `pairs` without the sorted `removed` and with
+    the sorted `added`. The unchanged runs in between are copied as slices,
+    so only the changes are compared."""
+    out = []
+    start = 0
+    for pair, insert in sorted([(pair, False) for pair in removed] + [(pair, True) for pair in added]):
+        pos = bisect.bisect_left(pairs, pair, start)
+        out.extend(pairs[start:pos])
+        if insert:
+            out.append(pair)
+            start = pos
+        else:
+            start = pos + 1
+    out.extend(pairs[start:])
+    return out
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.pairs = []
+        self.file_pairs = {}
+        self.filenames = {}
+        self.max_id = 0
+        self.lock = threading.RLock()
+
+    @classmethod
+    def build(cls, rows):
+        """Builds the index from (file_id, filename, text...) rows in one pass."""
+        index = cls()
+        for file_id, filename, *texts in rows:
+            index.filenames[file_id] = filename
+            pairs = index.file_pairs.setdefault(file_id, set())
+            for text in (filename,) + tuple(texts):
+                pairs.update((token, file_id) for token in tokenize(text))
+        index.pairs = sorted(set().union(*index.file_pairs.values()))
+        index.max_id = max(index.filenames, default=0)
+        return index
+
+    def update_files(self, rows):
+        """Replaces the tokens of the files in `rows`, (file_id, filename,
+        text...) each, e.g. after they have been tagged. Only the pairs that
+        changed are touched."""
+        with self.lock:
+            old, new = set(), set()
+            for file_id, filename, *texts in rows:
+                old |= self.file_pairs.pop(file_id, set())
+                self.filenames[file_id] = filename
+                self.max_id = max(self.max_id, file_id)
+                file_pairs = self.file_pairs[file_id] = set()
+                for text in (filename,) + tuple(texts):
+                    file_pairs.update((token, file_id) for token in tokenize(text))
+                new |= file_pairs
+            removed, added = sorted(old - new), sorted(new - old)
+            if len(removed) + len(added) < BULK_UPDATE:
+                for pair in removed:
+                    del self.pairs[bisect.bisect_left(self.pairs, pair)]
+                for pair in added:
+                    bisect.insort(self.pairs, pair)
+            else:
+                self.pairs = splice(self.pairs, removed, added)
+
+    def remove_file(self, file_id):
+        with self.lock:
+            self.filenames.pop(file_id, None)
+            for pair in list(self.file_pairs.get(file_id, ())):
+                self.drop(pair)
+
+    def drop(self, pair):
+        del self.pairs[bisect.bisect_left(self.pairs, pair)]
+        pairs = self.file_pairs[pair[1]]
+        pairs.discard(pair)
+        if not pairs:
+            del self.file_pairs[pair[1]]
+
+    def span(self, prefix):
+        """Returns the slice bounds of the pairs whose token starts with `prefix`."""
+        return (bisect.bisect_left(self.pairs, (prefix,)),
+                bisect.bisect_left(self.pairs, (prefix + MAX_CHAR,)))
+
+    def search(self, searchterm, limit=None, offset=0, more_ids=()):
+        """Returns the number of files whose tokens start with every word of
+        `searchterm`, and one page of their filenames, newest first. The
+        files `more_ids`, found elsewhere, count as matches as well. An empty
+        searchterm matches all files."""
+        terms = set(tokenize(searchterm))
+        with self.lock:
+            if terms:
+                # Narrowest prefix first, the others only filter its files
+                spans = sorted((self.span(term) for term in terms), key=lambda s: s[1] - s[0])
+                lo, hi = spans[0]
+                ids = set(map(file_id_of, self.pairs[lo:hi]))
+                for lo, hi in spans[1:]:
+                    if not ids:
+                        break
+                    ids.intersection_update(map(file_id_of, self.pairs[lo:hi]))
+                ids.update(file_id for file_id in more_ids if file_id in self.filenames)
+            else:
+                ids = set(self.filenames)
+            return len(ids), [self.filenames[file_id] for file_id in self.newest(ids, limit, offset)]
+
+    def newest(self, ids, limit, offset):
+        """Returns the page of `ids` in descending order."""
+        if limit is None:
+            return sorted(ids, reverse=True)[offset:]
+        wanted = offset + limit
+        if wanted <= 0:
+            return []
+        # Short prefixes match most of the archive. Then counting down from
+        # the newest id finds a page much faster than a heap over all ids.
+        if ids and wanted * self.max_id < len(ids) * len(ids):
+            page = []
+            for file_id in range(self.max_id, 0, -1):
+                if file_id in ids:
+                    page.append(file_id)
+                    if len(page) == wanted:
+                        break
+            return page[offset:]
+        return heapq.nlargest(wanted, ids)[offset:]
@@ -0,0 +1,167 @@
+"""Client for the archive server, usable in place of a Database.
+
+    db = RemoteDatabase("http://127.0.0.1:8750")
+    db.search("safety", 100)
+
+RemoteDatabase has the Database methods the application uses and sends them
+to the server, see server.py. Every thread keeps its own HTTP connection,
+so it can be shared with the worker threads like a Database.
+"""
+import http.client
+import json
+import os
+import tempfile
+import threading
+import urllib.parse
+
+from . import server
+from .store import CHUNK_SIZE
+
+# Files opened from the server are downloaded here
+DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), "grievance_tracker")
+
+
+class RemoteError(Exception):
+    """The server could not carry out a request."""
+
+
+def decode(name, value):
+    """Undoes what JSON did to the result of method `name`."""
+    if isinstance(value, dict) and "__dataframe__" in value:
+        import pandas as pd
+        frame = value["__dataframe__"]
+        return pd.DataFrame(frame["data"], columns=frame["columns"])
+    if name == "get_payperiods":
+        return {int(payperiod): count for payperiod, count in value.items()}
+    if name in ("get_years", "search_records") or name.endswith("_counts_by_year"):
+        return [tuple(row) for row in value]
+    if name == "prefix_search":
+        return tuple(value)
+    return value
+
+
+class RemoteDatabase:
+    """Access to the archive served at `url`."""
+
+    def __init__(self, url, timeout=60):
+        self.url = urllib.parse.urlsplit(url)
+        self.timeout = timeout
+        self.local = threading.local()
+        # Searches go to the server, there is no local prefix index
+        self.prefix_index = None
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+        return conn
+
+    def request(self, method, path, body=None, headers=None):
+        """Sends a request and returns the response, which the caller has to
+        read completely. A kept-alive connection that the server has closed
+        in the meantime is reopened once."""
+        for attempt in (0, 1):
+            conn = self.connection()
+            try:
+                if hasattr(body, "seek"):
+                    body.seek(0)
+                conn.request(method, path, body, headers or {})
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+
+    def result(self, response):
+        payload = json.loads(response.read())
+        if response.status != 200:
+            raise RemoteError(payload.get("error", response.reason))
+        return payload["result"]
+
+    def call(self, name, *args):
+        response = self.request("POST", "/api/" + name, json.dumps({"args": args}),
+                                {"Content-Type": "application/json"})
+        return decode(name, self.result(response))
+
+    def close(self):
+        """Closes the HTTP connection of the calling thread."""
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    def close_all(self):
+        self.close()
+
+    def upload_file(self, directory, source, fields, task=None, name=None):
+        """Sends the file `source` to the server, which stores it and adds it
+        under a new serial number. `directory` is ignored, the server keeps
+        its own. Returns the new filename and the same result as
+        Database.upload_file: 1 once added, a negative value on errors."""
+        query = urllib.parse.urlencode({
+            "name": name or os.path.basename(source),
+            "location": fields["location"],
+            "year": fields["year"],
+            "payperiod": fields["payperiod"],
+            "keywords": ";".join(fields.get("keywords", ())),
+            "persons": ";".join(fields.get("persons", ()))})
+        size = os.path.getsize(source)
+        with open(source, "rb") as fh:
+            response = self.request("POST", "/upload?" + query, UploadBody(fh, size, task),
+                                    {"Content-Length": str(size), "Content-Type": "application/octet-stream"})
+            return tuple(self.result(response))
+
+    def file_path(self, directory, filename):
+        """Downloads the stored file `filename` and returns the local path."""
+        path = os.path.join(DOWNLOAD_DIR, os.path.basename(filename))
+        response = self.request("GET", "/files/" + urllib.parse.quote(filename))
+        if response.status != 200:
+            self.result(response)
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        with open(path, "wb") as fh:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                fh.write(chunk)
+        return path
+
+    def delete_file(self, directory, filename):
+        return self.call("delete_file", filename)
+
+    def prefix_search(self, searchterm, limit=None, offset=0, task=None):
+        # A request that has been sent cannot be interrupted, `task` is ignored
+        return self.call("prefix_search", searchterm, limit, offset)
+
+
+class UploadBody:
+    """File object for http.client that reports the upload progress to `task`."""
+
+    def __init__(self, fh, size, task=None):
+        self.fh = fh
+        self.size = size or 1
+        self.task = task
+        self.done = 0
+
+    def seek(self, offset):
+        self.fh.seek(offset)
+        self.done = offset
+
+    def read(self, size=-1):
+        # http.client asks for small blocks; larger ones mean fewer progress reports
+        if self.task:
+            self.task.check()
+        chunk = self.fh.read(CHUNK_SIZE)
+        self.done += len(chunk)
+        if self.task:
+            self.task.report(self.done / self.size)
+        return chunk
+
+
+def remote_method(name):
+    def method(self, *args):
+        return self.call(name, *args)
+    method.__name__ = name
+    return method
+
+
+for _name in (server.READ_METHODS | server.WRITE_METHODS) - server.DIRECTORY_METHODS:
+    if _name not in vars(RemoteDatabase):
+        setattr(RemoteDatabase, _name, remote_method(_name))
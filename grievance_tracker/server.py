@@ -0,0 +1,290 @@
+"""HTTP/JSON server that lets several users work on one archive.
+
+    python -m grievance_tracker serve [--host 127.0.0.1] [--port 8750]
+
+    POST /api/<method>   body {"args": [...]}, answers {"result": ...}
+    POST /upload?name=&location=&year=&payperiod=&keywords=&persons=
+                         body is the file content, answers {"result": [filename, result]}
+    GET  /files/<filename>
+                         the stored file
+
+<method> is one of the Database methods in READ_METHODS or WRITE_METHODS.
+Reads run concurrently on a thread pool, every thread with its own
+connection. Writes go through a queue to a single writer task, which runs
+them one after another on one thread; uploads that wait in the queue
+together are added in one transaction. The text of uploaded files is
+extracted for the search in worker processes, see extract.py. Errors are
+answered with {"error": message}.
+
+There is no authentication. Bind the server to localhost or to a network
+that only trusted users can reach.
+"""
+import asyncio
+import functools
+import json
+import os
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from . import store
+from .bulk_import import split_list
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8750
+READ_THREADS = 8
+# Most writes the writer task takes from the queue at once
+WRITE_BATCH = 100
+
+READ_METHODS = {
+    "is_file_in_db", "get_location", "is_keyword_in_db", "is_person_in_db",
+    "search", "search_count", "search_records", "prefix_search",
+    "get_keywords", "get_person", "get_payperiods", "get_years", "get_latest_id", "data_version",
+    "list_keywords", "keywords_on_file", "persons_on_file",
+    "keyword_counts_by_year", "person_counts_by_year", "payperiod_counts_by_year",
+}
+WRITE_METHODS = {
+    "add_keyword", "delete_keyword", "add_person", "update_location",
+    "add_keyword_to_file", "delete_keyword_from_file",
+    "add_person_to_file", "delete_person_from_file", "delete_file", "tag_files",
+}
+# Methods whose first argument is the upload directory, which only the
+# server knows. Clients leave it out.
+DIRECTORY_METHODS = {"delete_file"}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def encode(value):
+    """Makes a Database result JSON serializable. DataFrames are sent as
+    columns and rows and rebuilt by the client."""
+    if type(value).__name__ == "DataFrame":
+        return {"__dataframe__": {"columns": list(value.columns), "data": value.values.tolist()}}
+    return value
+
+
+class Server:
+    """Serves `db` and the files stored in `upload_dir`."""
+
+    def __init__(self, db, upload_dir, read_threads=READ_THREADS, text=True):
+        self.db = db
+        self.upload_dir = upload_dir
+        self.text = text
+        self.indexer = None
+        self.readers = ThreadPoolExecutor(read_threads, thread_name_prefix="read")
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="write")
+        self.queue = None
+        self.server = None
+        self.writer_task = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.queue = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self.write_loop())
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.writer_task.cancel()
+        self.readers.shutdown()
+        self.writer.shutdown()
+        if self.indexer is not None:
+            self.indexer.abort()
+        self.db.close_all()
+
+    async def read(self, func, *args):
+        """Runs `func` on a reader thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.readers, functools.partial(func, *args))
+
+    async def write(self, name, args):
+        """Queues a write for the writer task and waits for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((name, args, future))
+        return await future
+
+    async def write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < WRITE_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            results = await loop.run_in_executor(self.writer, self.run_writes, batch)
+            for (name, args, future), (ok, value) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def run_writes(self, batch):
+        """Runs on the writer thread. Returns (ok, result or exception) for
+        every write of `batch`."""
+        results = [None] * len(batch)
+        uploads = [i for i, (name, args, future) in enumerate(batch) if name == "upload"]
+        if uploads:
+            try:
+                for i, result in zip(uploads, self.add_uploads([batch[i][1] for i in uploads])):
+                    results[i] = (True, result)
+            except Exception as e:
+                for i in uploads:
+                    results[i] = (False, e)
+        for i, (name, args, future) in enumerate(batch):
+            if name == "upload":
+                continue
+            if name in DIRECTORY_METHODS:
+                args = [self.upload_dir] + list(args)
+            try:
+                results[i] = (True, getattr(self.db, name)(*args))
+            except Exception as e:
+                results[i] = (False, e)
+        return results
+
+    def add_uploads(self, uploads):
+        """Adds the stored uploads, (fields, name) each, in one transaction.
+        Returns the new filename and the result for each of them, the same
+        as Database.upload_file: 1 for an added file, -3 for uploads whose
+        stored content was deleted before they were added, or the error of
+        files_to_db."""
+        rows = [dict(fields, name=name) for fields, name in uploads]
+        res = self.db.files_to_db(rows, self.upload_dir)
+        if res >= 0 and self.text:
+            if self.indexer is None:
+                from . import extract
+                self.indexer = extract.TextIndexer(self.db, self.upload_dir)
+            # A reader thread waits for the extraction, the writer goes on
+            self.readers.submit(self.index_text, [row["filename"] for row in rows if "filename" in row])
+        # The body of an upload whose stored content was deleted meanwhile is
+        # gone, the client has to send it again
+        return [(row.get("filename", row["name"]), -3 if row.get("blob_missing") else 1 if res >= 0 else res)
+                for row in rows]
+
+    def index_text(self, filenames):
+        self.indexer.submit(filenames)
+        self.indexer.flush()
+
+    async def handle(self, reader, writer):
+        """Serves the requests of one connection, which may be kept alive."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    await self.dispatch(method, urllib.parse.urlsplit(target), length, reader, writer)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    if isinstance(e, HTTPError):
+                        status = e.status
+                    elif isinstance(e, (ValueError, KeyError)):
+                        status = 400
+                    else:
+                        status = 500
+                    await self.send_json(writer, status, {"error": "{}: {}".format(type(e).__name__, e)})
+                    # Part of the request body may still be unread
+                    break
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, url, length, reader, writer):
+        path = urllib.parse.unquote(url.path)
+        if path.startswith("/api/"):
+            if method != "POST":
+                raise HTTPError(405, "Use POST for {}".format(path))
+            name = path[len("/api/"):]
+            body = await reader.readexactly(length) if length else b"{}"
+            args = json.loads(body).get("args", [])
+            if name in READ_METHODS:
+                result = await self.read(getattr(self.db, name), *args)
+            elif name in WRITE_METHODS:
+                result = await self.write(name, args)
+            else:
+                raise HTTPError(404, "Unknown method {}".format(name))
+            await self.send_json(writer, 200, {"result": encode(result)})
+        elif path == "/upload":
+            if method != "POST":
+                raise HTTPError(405, "Use POST for /upload")
+            query = dict(urllib.parse.parse_qsl(url.query))
+            name = os.path.basename(query["name"])
+            fields = {"location": query["location"],
+                      "year": query["year"],
+                      "payperiod": query["payperiod"],
+                      "keywords": split_list(query.get("keywords")),
+                      "persons": split_list(query.get("persons"))}
+            fields.update(await self.receive_blob(reader, length, os.path.splitext(name)[1]))
+            result = await self.write("upload", (fields, name))
+            await self.send_json(writer, 200, {"result": result})
+        elif path.startswith("/files/"):
+            if method != "GET":
+                raise HTTPError(405, "Use GET for /files/")
+            filename = path[len("/files/"):]
+            if not await self.read(self.db.is_file_in_db, filename):
+                raise HTTPError(404, "File {} is not in the database".format(filename))
+            await self.send_file(writer, await self.read(self.db.file_path, self.upload_dir, filename))
+        else:
+            raise HTTPError(404, "Not found: {}".format(path))
+
+    async def receive_blob(self, reader, length, ext):
+        """Stores the request body in the blob store while it arrives."""
+        blob = await self.read(store.BlobWriter, self.upload_dir)
+        try:
+            remaining = length
+            while remaining:
+                chunk = await reader.read(min(remaining, store.CHUNK_SIZE))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(chunk)
+                await self.read(blob.write, chunk)
+            return await self.read(blob.finish, ext, self.db)
+        except BaseException:
+            blob.abort()
+            raise
+
+    async def send_json(self, writer, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(
+            status, REASONS.get(status, ""), len(body)).encode("latin-1") + body)
+        await writer.drain()
+
+    async def send_file(self, writer, path):
+        size = os.path.getsize(path)
+        writer.write("HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\nContent-Length: {}\r\n\r\n".format(
+            size).encode("latin-1"))
+        with open(path, "rb") as fh:
+            while True:
+                chunk = await self.read(fh.read, store.CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+
+async def serve(db, upload_dir, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Serves the Database `db` until cancelled."""
+    server = Server(db, upload_dir)
+    await server.start(host, port)
+    print("Serving {} on http://{}:{}/".format(db.filename, host, port))
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
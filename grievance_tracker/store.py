@@ -0,0 +1,282 @@
+"""Content-addressed storage of the uploaded files.
+
+Every file is stored once under the SHA-256 of its content, in
+`<upload dir>/blobs/<first two hex digits>/<sha256><extension>`. The rows in
+tbl_file reference the blob through tbl_blob, so uploading the same scan
+twice does not use more disk.
+
+A file is hashed while it is copied. Only if a blob of exactly the same size
+already exists is the file hashed first, so that a duplicate costs one read
+and an index lookup and is never copied.
+
+Blobs are compressed while they are written if a sample of their start
+compresses well: text and uncompressed PDFs with gzip, or with lzma if that
+saves clearly more. Scans that are compressed already are stored as they
+are. Compressed blobs live in `blobs/gz/` and `blobs/xz/`, so the path tells
+how to read them; sha256 and size are those of the original content.
+open_blob() reads any blob. Programs that need a plain file get a
+decompressed copy from the BlobCache.
+"""
+import gzip
+import hashlib
+import lzma
+import os
+import tempfile
+import threading
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+BLOB_DIR = "blobs"
+# Suffix of a blob that delete_file has moved aside until its delete commits
+DELETED_SUFFIX = ".deleted"
+# Set to False to store new files as they are
+COMPRESS = True
+# Bytes of a file looked at to choose how to store it
+SAMPLE_SIZE = 64 * 1024
+LZMA_SAMPLE_SIZE = 16 * 1024
+# Smaller files are not worth compressing
+MIN_COMPRESS_SIZE = 4096
+# A file is stored compressed if gzip shrinks the sample below this ratio,
+# and with lzma if that is smaller again by LZMA_GAIN. lzma writes about 20
+# times slower than gzip, so it has to save clearly more.
+MAX_RATIO = 0.9
+LZMA_GAIN = 0.75
+GZIP_LEVEL = 6
+LZMA_PRESET = 6
+CODECS = {
+    "gz": lambda fh: gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=GZIP_LEVEL, mtime=0),
+    "xz": lambda fh: lzma.LZMAFile(fh, "wb", preset=LZMA_PRESET),
+}
+READERS = {"gz": gzip.open, "xz": lzma.open}
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "grievance_tracker_cache")
+CACHE_SIZE = 512 * 1024 * 1024
+
+
+def blob_relpath(sha256, ext, codec=""):
+    if codec:
+        return os.path.join(BLOB_DIR, codec, sha256[:2], sha256 + ext + "." + codec)
+    return os.path.join(BLOB_DIR, sha256[:2], sha256 + ext)
+
+
+def blob_codec(path):
+    """Returns the codec a blob at `path` is compressed with, or ""."""
+    parts = os.path.normpath(path).split(os.sep)
+    if len(parts) >= 4 and parts[-4] == BLOB_DIR and parts[-3] in CODECS:
+        return parts[-3]
+    return ""
+
+
+def blob_name(path):
+    """Returns the file name of a blob without the codec suffix, <sha256><ext>."""
+    name = os.path.basename(path)
+    codec = blob_codec(path)
+    return name[:-len(codec) - 1] if codec else name
+
+
+def choose_codec(sample):
+    """Returns the codec that suits data like `sample`, "" to store it as it is."""
+    if len(sample) < MIN_COMPRESS_SIZE:
+        return ""
+    deflated = len(zlib.compress(sample, GZIP_LEVEL)) / len(sample)
+    if deflated > MAX_RATIO:
+        return ""
+    # lzma is slow, both are compared on a smaller piece
+    probe = sample[:LZMA_SAMPLE_SIZE]
+    xz = len(lzma.compress(probe, preset=LZMA_PRESET))
+    return "xz" if xz < len(zlib.compress(probe, GZIP_LEVEL)) * LZMA_GAIN else "gz"
+
+
+def open_blob(path):
+    """Opens the blob at `path` for reading its original content."""
+    codec = blob_codec(path)
+    return READERS[codec](path, "rb") if codec else open(path, "rb")
+
+
+def hash_blob(path, chunk_size=CHUNK_SIZE):
+    """Returns the SHA-256 hex digest of the original content of a blob."""
+    digest = hashlib.sha256()
+    with open_blob(path) as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(src, task=None, chunk_size=CHUNK_SIZE):
+    """Returns the SHA-256 hex digest of `src`."""
+    digest = hashlib.sha256()
+    with open(src, "rb") as fsrc:
+        for chunk in iter(lambda: fsrc.read(chunk_size), b""):
+            if task:
+                task.check()
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobWriter:
+    """Writes a blob chunk by chunk while hashing it, into a temporary file
+    that finish() moves into place. Used for files and for uploads that
+    arrive over the network. With `compress`, the first SAMPLE_SIZE bytes
+    are held back until the codec is chosen."""
+
+    def __init__(self, directory, compress=COMPRESS):
+        self.directory = directory
+        tmp_dir = os.path.join(directory, BLOB_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self.raw = os.fdopen(fd, "wb")
+        self.file = None
+        self.codec = None if compress else ""
+        self.sample = []
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        if self.file is None:
+            self.sample.append(chunk)
+            if self.size >= SAMPLE_SIZE:
+                self.start()
+        else:
+            self.file.write(chunk)
+
+    def start(self):
+        data = b"".join(self.sample)
+        self.sample = None
+        if self.codec is None:
+            self.codec = choose_codec(data[:SAMPLE_SIZE])
+        self.file = CODECS[self.codec](self.raw) if self.codec else self.raw
+        self.file.write(data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.raw.close()
+
+    def abort(self):
+        self.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+    def finish(self, ext, db=None):
+        """Returns the sha256, size and relative path of the blob. If `db`
+        has a blob with the same content already, that one is returned and
+        the new copy is dropped. Pass the upload directory to files_to_db,
+        which makes sure the blob is still there when the file is added."""
+        if self.file is None:
+            self.start()
+        self.close()
+        sha256 = self.digest.hexdigest()
+        blob = db.get_blob(sha256) if db is not None else None
+        if blob:
+            os.remove(self.tmp)
+            return blob
+        path = blob_relpath(sha256, ext.lower(), self.codec)
+        final = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        if os.path.exists(final):
+            os.remove(self.tmp)
+        else:
+            os.replace(self.tmp, final)
+        return {"sha256": sha256, "size": self.size, "path": path}
+
+
+def copy_and_hash(src, directory, task=None, chunk_size=CHUNK_SIZE):
+    """Copies `src` into the blob store under `directory` while hashing it.
+    Returns the sha256, size and relative path of the blob."""
+    size = os.path.getsize(src) or 1
+    blob = BlobWriter(directory)
+    try:
+        with open(src, "rb") as fsrc:
+            for chunk in iter(lambda: fsrc.read(chunk_size), b""):
+                if task:
+                    task.check()
+                blob.write(chunk)
+                if task:
+                    task.report(blob.size / size)
+        return blob.finish(os.path.splitext(src)[1])
+    except BaseException:
+        blob.abort()
+        raise
+
+
+def put_file(db, directory, src, task=None, chunk_size=CHUNK_SIZE):
+    """Stores `src` under `directory` unless its content is stored already.
+    Returns a dict with sha256, size and path of the blob, ready to be merged
+    into the rows passed to Database.files_to_db. The blob can be deleted
+    before the row is added; files_to_db finds that out in its transaction."""
+    if db.has_blob_of_size(os.path.getsize(src)):
+        blob = db.get_blob(hash_file(src, task, chunk_size))
+        if blob:
+            return blob
+    return copy_and_hash(src, directory, task, chunk_size)
+
+
+class BlobCache:
+    """Decompressed copies of compressed blobs, for programs that need a
+    plain file, like a PDF viewer. Copies are made on first use; the least
+    recently used ones are removed once the cache holds more than
+    `max_size` bytes."""
+
+    def __init__(self, directory=CACHE_DIR, max_size=CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    def path(self, blob_path):
+        """Returns the path of a plain copy of the blob at `blob_path`; the
+        blob itself if it is not compressed."""
+        if not blob_codec(blob_path):
+            return blob_path
+        cached = os.path.join(self.directory, blob_name(blob_path))
+        if os.path.exists(cached):
+            # The modification time orders the copies for eviction
+            os.utime(cached)
+            return cached
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out, open_blob(blob_path) as src:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+            os.replace(tmp, cached)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict(cached)
+        return cached
+
+    def evict(self, keep=None):
+        """Removes the least recently used copies, except `keep`, until the
+        cache fits in max_size."""
+        with self.lock:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith(".part"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for mtime, size, path in entries)
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    # Still open in a viewer on Windows
+                    pass
+
+    def discard(self, blob_path):
+        """Removes the copy of a deleted blob."""
+        cached = os.path.join(self.directory, blob_name(blob_path))
+        if blob_codec(blob_path) and os.path.exists(cached):
+            try:
+                os.remove(cached)
+            except OSError:
+                pass
+
+
+cache = BlobCache()
@@ -0,0 +1,179 @@
+"""Checks that the upload directory and the database agree.
+
+    python -m grievance_tracker verify [--hash] [--repair]
+
+An upload stores the file before the row is committed, and delete_file
+moves the file aside before it commits, so a crash in between leaves a
+file that no row uses or a row whose file is gone. verify finds
+
+- missing files: rows whose stored content is not in the upload directory,
+- orphans: files in the upload directory that no row uses,
+- damaged files: stored content whose size, or with --hash whose SHA-256,
+  differs from tbl_blob; the size of compressed blobs is only checked by
+  --hash,
+- orphaned rows: links, imports and texts of files, keywords or persons
+  that are gone, and blobs no file uses.
+
+The directory is scanned by a thread pool, one directory per task, and
+compared with one read of tbl_file. With --repair, rows of missing files
+and orphaned rows are deleted, and orphans are moved to orphans/ in the
+upload directory. Orphans changed in the last hour are left alone; they
+may belong to an upload that is not committed yet. Damaged files cannot be
+repaired, restore them from a backup.
+"""
+import lzma
+import os
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import store
+
+THREADS = 8
+ORPHAN_DIR = "orphans"
+# Orphans younger than this may be uploads in progress
+GRACE_SECONDS = 3600
+
+
+def scan_directory(directory, threads=THREADS):
+    """Returns {path relative to `directory`: (size, mtime)} of all files
+    below `directory`, except hidden ones and the orphans/ folder."""
+    def scan(relpath):
+        files, dirs = [], []
+        with os.scandir(os.path.join(directory, relpath)) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                path = os.path.join(relpath, entry.name) if relpath else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if path != ORPHAN_DIR:
+                        dirs.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat()
+                    files.append((path, stat.st_size, stat.st_mtime))
+        return files, dirs
+
+    found = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = {pool.submit(scan, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                for path, size, mtime in files:
+                    found[path] = (size, mtime)
+                pending.update(pool.submit(scan, path) for path in dirs)
+    return found
+
+
+def hash_blob(path):
+    try:
+        return store.hash_blob(path)
+    except (OSError, EOFError, lzma.LZMAError, zlib.error):
+        # A truncated or corrupt compressed blob
+        return None
+
+
+def verify(db, directory, check_hash=False, threads=THREADS):
+    """Compares `directory` with `db`. Returns a dict with the number of
+    files and scanned files, lists of missing (file id, filename), orphans
+    and damaged paths, the orphaned rows per table, the unused blobs and
+    the seconds taken."""
+    start = time.perf_counter()
+    on_disk = scan_directory(directory, threads)
+    # Read after the scan, so a file committed meanwhile is not an orphan
+    files = db.stored_files()
+    stored = {}
+    for file_id, filename, path, sha256, size in files:
+        stored.setdefault(path, (sha256, size, []))[2].append((file_id, filename))
+
+    missing, damaged, to_hash = [], [], []
+    for path, (sha256, size, rows) in stored.items():
+        if path not in on_disk:
+            missing.extend(rows)
+        elif size is not None and not store.blob_codec(path) and on_disk[path][0] != size:
+            damaged.append(path)
+        elif check_hash and sha256 is not None:
+            to_hash.append((path, sha256))
+    if to_hash:
+        # hashlib releases the GIL, the threads hash in parallel
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            digests = pool.map(lambda item: hash_blob(os.path.join(directory, item[0])), to_hash)
+            damaged.extend(path for (path, sha256), digest in zip(to_hash, digests) if digest != sha256)
+
+    return {"files": len(files),
+            "scanned": len(on_disk),
+            "missing": sorted(missing, key=lambda row: row[1]),
+            "orphans": sorted((path, on_disk[path][1]) for path in on_disk.keys() - stored.keys()),
+            "damaged": sorted(damaged),
+            "orphan_rows": db.orphan_rows(),
+            "unused_blobs": len(db.unused_blobs()),
+            "found": len(stored.keys() & on_disk.keys()),
+            "seconds": time.perf_counter() - start}
+
+
+def repair(db, directory, result, report=print):
+    """Fixes what verify() found, see the module docstring. Returns the
+    number of problems left."""
+    left = len(result["damaged"])
+    if result["missing"]:
+        if not result["found"]:
+            # Most likely the wrong directory, not a lost archive
+            report("None of the stored files are in {}, the rows of missing files are kept.".format(directory))
+            left += len(result["missing"])
+        elif db.forget_files([file_id for file_id, filename in result["missing"]]) < 0:
+            left += len(result["missing"])
+        else:
+            report("{} rows of missing files deleted".format(len(result["missing"])))
+    if sum(result["orphan_rows"].values()) + result["unused_blobs"]:
+        count = db.delete_orphan_rows()
+        if count < 0:
+            left += sum(result["orphan_rows"].values()) + result["unused_blobs"]
+        else:
+            report("{} orphaned rows deleted".format(count))
+    moved, recent = 0, 0
+    for path, mtime in result["orphans"]:
+        if time.time() - mtime < GRACE_SECONDS:
+            recent += 1
+            continue
+        src = os.path.join(directory, path)
+        try:
+            if path.endswith((".part", store.DELETED_SUFFIX)):
+                # A copy that never finished or a delete that did
+                os.remove(src)
+            else:
+                dst = os.path.join(directory, ORPHAN_DIR, path)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.replace(src, dst)
+            moved += 1
+        except OSError as e:
+            print("Cannot move {}: {}".format(src, e))
+            left += 1
+    if moved:
+        report("{} orphans moved to {}".format(moved, os.path.join(directory, ORPHAN_DIR)))
+    if recent:
+        report("{} orphans changed in the last hour left in place".format(recent))
+    return left + recent
+
+
+def print_result(result, report=print):
+    for file_id, filename in result["missing"]:
+        report("missing: {}".format(filename))
+    for path, mtime in result["orphans"]:
+        report("orphan:  {}".format(path))
+    for path in result["damaged"]:
+        report("damaged: {}".format(path))
+    for table, count in result["orphan_rows"].items():
+        if count:
+            report("{} orphaned rows in {}".format(count, table))
+    if result["unused_blobs"]:
+        report("{} blobs are not used by any file".format(result["unused_blobs"]))
+    report("{files} files, {scanned} stored files checked in {seconds:.1f} s: ".format(**result)
+           + "{} missing, {} orphans, {} damaged, {} orphaned rows.".format(
+               len(result["missing"]), len(result["orphans"]), len(result["damaged"]),
+               sum(result["orphan_rows"].values()) + result["unused_blobs"]))
+
+
+def problems(result):
+    return (len(result["missing"]) + len(result["orphans"]) + len(result["damaged"])
+            + sum(result["orphan_rows"].values()) + result["unused_blobs"])
@@ -135,6 +135,67 @@ class MainMenu(tk.Menu):
 
 
 
+class Icons:
+    """Icons of the content views. Every icon is loaded once, on first use,
+    and shared by all views."""
+
+    def __init__(self):
+        self.images = {}
+
+    def get(self, name):
+        if name not in self.images:
+            self.images[name] = tk.PhotoImage(file='icons/{}.png'.format(name)).subsample(2,2)
+        return self.images[name]
+
+
+class ItemList(tk.Frame):
+    """List of names, every row with a delete button.
+    show() compares the new names with the shown ones and only adds and
+    removes the rows that differ, rows that stay keep their widgets.
+    A click on a delete button calls on_delete with the name of the row."""
+
+    def __init__(self, parent, icon, on_delete=None, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.icon = icon
+        self.on_delete = on_delete
+        self.items = []
+        # name -> [label, button, grid row]
+        self.rows = {}
+        self.columnconfigure(0,weight=1)
+
+    def show(self, items):
+        items = list(dict.fromkeys(items))
+        keep = set(items)
+        for item in self.items:
+            if item not in keep:
+                label, but_del, row = self.rows.pop(item)
+                label.destroy()
+                but_del.destroy()
+        for cnt, item in enumerate(items):
+            widgets = self.rows.get(item)
+            if widgets is None:
+                name = ttk.Label(self,text=item,justify="left")
+                but_del = tk.Button(self,image=self.icon,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25,
+                                    command=lambda item=item: self.delete(item))
+                widgets = self.rows[item] = [name, but_del, None]
+            if widgets[2] != cnt:
+                # New row, or moved up by a removed row
+                widgets[0].grid(row=cnt,column=0,sticky=(tk.N+tk.S+tk.E+tk.W))
+                widgets[1].grid(row=cnt,column=2)
+                widgets[2] = cnt
+        self.items = items
+
+    def add(self, item):
+        self.show(self.items + [item])
+
+    def remove(self, item):
+        self.show([x for x in self.items if x != item])
+
+    def delete(self, item):
+        if self.on_delete:
+            self.on_delete(item)
+
+
 class MainView(tk.Frame):
     """Main view of the application"""
 
@@ -148,18 +209,25 @@ class MainView(tk.Frame):
         self.nav_view = NavigationView(self)
         self.nav_view.grid(row=1,column=0,sticky=(tk.N+tk.S+tk.W))
 
-        self.content_view = []
+        # Content views in the order of the navigation. They are built on
+        # first use by build_view and kept in content_view.
+        self.view_classes = [ContentView_upload, ContentView_search, ContentView_keywords,
+                             ContentView_graphics, ContentView_details]
+        self.content_view = {}
+        self.icons = Icons()
         parent.update_idletasks()
-        self.content_view.append(ContentView_upload(self))
-        self.content_view.append(ContentView_search(self))
-        self.content_view.append(ContentView_keywords(self))
-        self.content_view.append(ContentView_graphics(self))
-        self.content_view.append(ContentView_details(self))
-        self.content_view[0].grid(row=1,column=1,sticky=(tk.N+tk.E+tk.S+tk.W))
+        self.status_view = StatusView(self)
+        self.status_view.grid(row=2,column=0,columnspan=2,sticky=(tk.E+tk.W))
         self.columnconfigure(1,weight=1)
         self.rowconfigure(1,weight=1)
 
 
+    def build_view(self, view_no):
+        """Builds content view `view_no` and returns it."""
+        view = self.view_classes[view_no](self)
+        self.content_view[view_no] = view
+        return view
+
     def get(self):
         data = {}
         for key, widget in self.inputs.items():
@@ -178,6 +246,42 @@ class TitleView(tk.Frame):
         heading.pack(fill='x',expand=True)
 
 
+class StatusView(tk.Frame):
+    """Status bar showing the running background task and its progress"""
+    def __init__(self, parent, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.var_status = tk.StringVar()
+
+        lbl_status = ttk.Label(self, textvariable=self.var_status)
+        lbl_status.grid(row=0,column=0,padx=(10,5),sticky=(tk.E+tk.W))
+        self.prg_status = ttk.Progressbar(self, length=200, maximum=1.0)
+        self.prg_status.grid(row=0,column=1,padx=5)
+        self.but_cancel = ttk.Button(self, text="Cancel")
+        self.but_cancel.grid(row=0,column=2,padx=(5,10))
+        self.columnconfigure(0,weight=1)
+
+        self.show_tasks([])
+
+    def show_tasks(self, tasks):
+        if tasks:
+            self.var_status.set(tasks[-1].description + ("" if len(tasks) == 1 else " (+{} more)".format(len(tasks)-1)))
+            if str(self.prg_status['mode']) != 'determinate' or self.prg_status['value'] == 0:
+                self.prg_status.configure(mode='indeterminate')
+                self.prg_status.start(20)
+            self.but_cancel.state(['!disabled'])
+        else:
+            self.var_status.set('')
+            self.prg_status.stop()
+            self.prg_status.configure(mode='determinate', value=0)
+            self.but_cancel.state(['disabled'])
+
+    def show_progress(self, fraction):
+        if str(self.prg_status['mode']) != 'determinate':
+            self.prg_status.stop()
+            self.prg_status.configure(mode='determinate')
+        self.prg_status.configure(value=fraction)
+
+
 class NavigationView(tk.Frame):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
@@ -229,12 +333,19 @@ class ContentView_upload(tk.Frame):
 
 
 class ContentView_search(tk.Frame):
+    """Search view. Results are shown one page at a time in a Treeview,
+    which only draws the rows that are visible."""
+    PAGE_SIZE = 100
+
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
-        self.ico_cross = tk.PhotoImage(file='icons/cross.png').subsample(2,2)
-        self.ico_eye = tk.PhotoImage(file='icons/eye.png').subsample(2,2) 
+        self.ico_cross = parent.icons.get('cross')
+        self.ico_eye = parent.icons.get('eye')
 
         self.var_searchterm = tk.StringVar()
+        self.var_page = tk.StringVar()
+        self.var_tag_keyword = tk.StringVar()
+        self.var_tag_person = tk.StringVar()
 
         heading = ttk.Label(self,text="Search")
         heading.grid(row=1,padx=(50,5),pady=(20,10),sticky=(tk.N+tk.S+tk.E+tk.W))
@@ -247,39 +358,89 @@ class ContentView_search(tk.Frame):
         self.frm_res = tk.Frame(self)
         self.frm_res.grid(row=3,column=0,columnspan=4,padx=(50,5),sticky=(tk.N+tk.S+tk.E+tk.W))
 
+        self.tree_res = ttk.Treeview(self.frm_res, columns=("filename",), show="headings", selectmode="extended")
+        self.tree_res.heading("filename", text="File", anchor=tk.W)
+        self.tree_res.grid(row=0,column=0,sticky=(tk.N+tk.S+tk.E+tk.W))
+        scr_res = ttk.Scrollbar(self.frm_res, orient=tk.VERTICAL, command=self.tree_res.yview)
+        scr_res.grid(row=0,column=1,sticky=(tk.N+tk.S))
+        self.tree_res.configure(yscrollcommand=scr_res.set)
+
+        frm_actions = tk.Frame(self.frm_res)
+        frm_actions.grid(row=0,column=2,padx=(5,0),sticky=tk.N)
+        self.but_show = tk.Button(frm_actions,image=self.ico_eye,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25)
+        self.but_show.grid(row=0,column=0,pady=(0,5))
+        self.but_del = tk.Button(frm_actions,image=self.ico_cross,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25)
+        self.but_del.grid(row=1,column=0)
+
+        frm_pages = tk.Frame(self.frm_res)
+        frm_pages.grid(row=1,column=0,pady=5,sticky=(tk.E+tk.W))
+        self.but_prev = ttk.Button(frm_pages, text="< Previous")
+        self.but_prev.grid(row=0,column=0)
+        lbl_page = ttk.Label(frm_pages, textvariable=self.var_page, anchor=tk.CENTER)
+        lbl_page.grid(row=0,column=1,sticky=(tk.E+tk.W))
+        self.but_next = ttk.Button(frm_pages, text="Next >")
+        self.but_next.grid(row=0,column=2)
+        frm_pages.columnconfigure(1,weight=1)
+
+        # Tag all selected results at once
+        frm_tag = tk.Frame(self)
+        frm_tag.grid(row=4,column=0,columnspan=4,padx=(50,5),pady=(0,10),sticky=(tk.E+tk.W))
+        lbl_tag = ttk.Label(frm_tag, text="Selected files:")
+        lbl_tag.grid(row=0,column=0,padx=(0,5))
+        lbl_tag_keyword = ttk.Label(frm_tag, text="Keyword")
+        lbl_tag_keyword.grid(row=0,column=1,padx=(5,2))
+        self.cmb_tag_keyword = ttk.Combobox(frm_tag, textvariable=self.var_tag_keyword, width=15)
+        self.cmb_tag_keyword.grid(row=0,column=2)
+        lbl_tag_person = ttk.Label(frm_tag, text="Person")
+        lbl_tag_person.grid(row=0,column=3,padx=(5,2))
+        self.inp_tag_person = ttk.Entry(frm_tag, textvariable=self.var_tag_person, width=15)
+        self.inp_tag_person.grid(row=0,column=4)
+        self.but_tag = ttk.Button(frm_tag, text="Add")
+        self.but_tag.grid(row=0,column=5,padx=(5,0))
+        self.but_untag = ttk.Button(frm_tag, text="Remove")
+        self.but_untag.grid(row=0,column=6,padx=(5,0))
+
+        self.frm_res.columnconfigure(0,weight=1)
+        self.frm_res.rowconfigure(0,weight=1)
+
         self.columnconfigure(0,weight=1)
         self.columnconfigure(1,weight=1)
         self.columnconfigure(2,weight=1)
         self.columnconfigure(3,weight=1)
         self.rowconfigure(3,weight=1) 
 
-        self.search_result_list = []
-    
-    def show_results(self, results):
-        self.result_rows=[]
-        for item in self.frm_res.winfo_children():
-            item.destroy()
-        self.search_result_list=[]
-        for cnt,result in enumerate(results):
-            # line=ttk.Frame(self.frm_res)
-            # line.grid(row=cnt,column=0)
-            name=ttk.Label(self.frm_res,text=result,justify="left")
-            name.grid(row=cnt,column=0,sticky=(tk.N+tk.S+tk.E+tk.W))
+        self.show_results([])
+
+    def show_results(self, results, page=0, total=0):
+        """Shows one page of results. `page` counts from 0 and `total` is
+        the number of results over all pages."""
+        self.tree_res.delete(*self.tree_res.get_children())
+        for filename in results:
+            self.tree_res.insert('', tk.END, iid=filename, values=(filename,))
 
-            but_show = tk.Button(self.frm_res,image=self.ico_eye,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25)
-            but_show.grid(row=cnt,column=1)
-            but_del = tk.Button(self.frm_res,image=self.ico_cross,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25)
-            but_del.grid(row=cnt,column=2)
+        pages = max(1, -(-total // self.PAGE_SIZE))
+        self.var_page.set("Page {} of {} ({} files)".format(page+1, pages, total))
+        self.but_prev.state(['!disabled'] if page > 0 else ['disabled'])
+        self.but_next.state(['!disabled'] if page+1 < pages else ['disabled'])
 
-            self.search_result_list.append([cnt,result,but_show,but_del,name])
+    def selected_result(self):
+        """Returns the filename of the selected result or None."""
+        selection = self.tree_res.selection()
+        return selection[0] if selection else None
 
-            self.frm_res.columnconfigure(0,weight=1)
+    def selected_results(self):
+        """Returns the filenames of all selected results."""
+        return list(self.tree_res.selection())
+
+    def remove_result(self, filename):
+        if self.tree_res.exists(filename):
+            self.tree_res.delete(filename)
 
 
 class ContentView_keywords(tk.Frame):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
-        self.ico_cross = tk.PhotoImage(file='icons/cross.png').subsample(2,2)
+        self.ico_cross = parent.icons.get('cross')
         self.var_keyword = tk.StringVar()
 
         heading = ttk.Label(self,text="Keywords")
@@ -292,6 +453,8 @@ class ContentView_keywords(tk.Frame):
         
         self.frm_keywords = tk.Frame(self)
         self.frm_keywords.grid(row=3,column=0,columnspan=4,padx=(50,5),sticky=(tk.N+tk.S+tk.E+tk.W))
+        self.lst_keywords = ItemList(self.frm_keywords, self.ico_cross)
+        self.lst_keywords.pack(fill='both',expand=True)
 
         self.columnconfigure(0,weight=1)
         self.columnconfigure(1,weight=1)
@@ -299,25 +462,8 @@ class ContentView_keywords(tk.Frame):
         self.columnconfigure(3,weight=1)
         self.rowconfigure(3,weight=1) 
 
-        self.keywords_list = []
-
     def show_keywords(self, keywords):
-        self.result_rows=[]
-        for item in self.frm_keywords.winfo_children():
-            item.destroy()
-        self.keywords_list=[]
-        for cnt,keyword in enumerate(keywords):
-            # line=ttk.Frame(self.frm_res)
-            # line.grid(row=cnt,column=0)
-            name=ttk.Label(self.frm_keywords,text=keyword,justify="left")
-            name.grid(row=cnt,column=0,sticky=(tk.N+tk.S+tk.E+tk.W))
-
-            but_del = tk.Button(self.frm_keywords,image=self.ico_cross,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25)
-            but_del.grid(row=cnt,column=2)
-
-            self.keywords_list.append([cnt,keyword,but_del,name])
-
-            self.frm_keywords.columnconfigure(0,weight=1)
+        self.lst_keywords.show(keywords)
 
 
 
@@ -341,7 +487,7 @@ class ContentView_details(tk.Frame):
     """Other than the other content views, this class shows the details of a file"""
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
-        self.ico_cross = tk.PhotoImage(file='icons/cross.png').subsample(2,2)
+        self.ico_cross = parent.icons.get('cross')
 
         self.var_filename = tk.StringVar()
         self.var_location = tk.StringVar()
@@ -364,9 +510,13 @@ class ContentView_details(tk.Frame):
 
         self.frm_keywords = ttk.Labelframe(self,text="Keywords")
         self.frm_keywords.grid(row=4,column=0,columnspan=2,padx=(50,5),sticky=(tk.N+tk.S+tk.E+tk.W))
+        self.lst_keywords = ItemList(self.frm_keywords, self.ico_cross)
+        self.lst_keywords.pack(fill='both',expand=True)
         
         self.frm_persons = ttk.Labelframe(self,text="Persons involved")
         self.frm_persons.grid(row=4,column=2,columnspan=2,padx=(5,5),sticky=(tk.N+tk.S+tk.E+tk.W))
+        self.lst_persons = ItemList(self.frm_persons, self.ico_cross)
+        self.lst_persons.pack(fill='both',expand=True)
 
         self.inp_person = LabelInput(self, "Add person", input_class=ttk.Entry, input_var=self.var_person)
         self.inp_person.grid(row=5,column=2,padx=(5,5))
@@ -387,43 +537,10 @@ class ContentView_details(tk.Frame):
         # self.columnconfigure(1,weight=1)
         self.columnconfigure(2,weight=1)
         # self.columnconfigure(3,weight=1)
-        self.rowconfigure(4,weight=1) 
-
-        self.keywords_list = []
-        self.persons_list = []
+        self.rowconfigure(4,weight=1)
 
     def show_keywords(self, keywords):
-        self.result_rows=[]
-        for item in self.frm_keywords.winfo_children():
-            item.destroy()
-        self.keywords_list=[]
-        for cnt,keyword in enumerate(keywords):
-            # line=ttk.Frame(self.frm_res)
-            # line.grid(row=cnt,column=0)
-            name=ttk.Label(self.frm_keywords,text=keyword,justify="left")
-            name.grid(row=cnt,column=0,sticky=(tk.N+tk.S+tk.E+tk.W))
-
-            but_del = tk.Button(self.frm_keywords,image=self.ico_cross,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25)
-            but_del.grid(row=cnt,column=2)
-
-            self.keywords_list.append([cnt,keyword,but_del,name])
-
-            self.frm_keywords.columnconfigure(0,weight=1)
-
+        self.lst_keywords.show(keywords)
 
     def show_persons(self, persons):
-        for item in self.frm_persons.winfo_children():
-            item.destroy()
-        self.persons_list=[]
-        for cnt,person in enumerate(persons):
-            # line=ttk.Frame(self.frm_res)
-            # line.grid(row=cnt,column=0)
-            name=ttk.Label(self.frm_persons,text=person,justify="left")
-            name.grid(row=cnt,column=0,sticky=(tk.N+tk.S+tk.E+tk.W))
-
-            but_del = tk.Button(self.frm_persons,image=self.ico_cross,highlightthickness=0, bd=0,borderwidth=0,relief=tk.FLAT,width=25,height=25)
-            but_del.grid(row=cnt,column=2)
-
-            self.persons_list.append([cnt,person,but_del,name])
-
-            self.frm_keywords.columnconfigure(0,weight=1)
+        self.lst_persons.show(persons)
@@ -0,0 +1,132 @@
+"""Background execution of database and file work for the Tk application.
+
+Jobs run on a thread pool. Their results, errors and progress reports are
+put on a queue that the Tk thread polls with `after()`, so callbacks always
+run on the Tk thread and the mainloop never waits for I/O.
+"""
+import contextlib
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    """Raised inside a job that noticed its task was cancelled."""
+
+
+class Task:
+    """Handle of a submitted job. The job receives it as its only argument
+    to report progress and to check for cancellation."""
+
+    def __init__(self, worker, description, on_done, on_error, on_progress):
+        self.worker = worker
+        self.description = description
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.interrupt = None
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            if self.interrupt:
+                self.interrupt()
+
+    @contextlib.contextmanager
+    def interrupting(self, interrupt):
+        """Calls `interrupt` if the task is cancelled while the block runs,
+        e.g. the interrupt() of the connection running a long query."""
+        with self.lock:
+            self.check()
+            self.interrupt = interrupt
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.interrupt = None
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def check(self):
+        """Raises Cancelled if the task has been cancelled."""
+        if self.cancelled.is_set():
+            raise Cancelled(self.description)
+
+    def report(self, fraction):
+        """Reports progress as a fraction between 0 and 1."""
+        self.worker.queue.put((self, "progress", fraction))
+
+
+class Worker:
+    """Runs jobs on worker threads and hands their results to the Tk thread."""
+    POLL_MS = 50
+
+    def __init__(self, root, max_workers=2, on_busy=None):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker")
+        self.queue = queue.Queue()
+        self.tasks = []
+        self.on_busy = on_busy
+        self.root.after(self.POLL_MS, self.poll)
+
+    def submit(self, job, on_done=None, on_error=None, on_progress=None, description=""):
+        """Runs `job(task)` on a worker thread.
+        `on_done(result)`, `on_error(exception)` and `on_progress(fraction)`
+        are called on the Tk thread. Nothing is called back for a task that
+        has been cancelled."""
+        task = Task(self, description, on_done, on_error, on_progress)
+        self.tasks.append(task)
+        self.pool.submit(self.run, job, task)
+        self.notify_busy()
+        return task
+
+    def run(self, job, task):
+        try:
+            if task.is_cancelled():
+                raise Cancelled(task.description)
+            self.queue.put((task, "done", job(task)))
+        except Exception as e:
+            self.queue.put((task, "error", e))
+
+    def poll(self):
+        try:
+            while True:
+                task, kind, value = self.queue.get_nowait()
+                if kind != "progress":
+                    self.tasks.remove(task)
+                    self.notify_busy()
+                if task.is_cancelled():
+                    continue
+                callback = {"done": task.on_done, "error": task.on_error, "progress": task.on_progress}[kind]
+                if callback:
+                    try:
+                        callback(value)
+                    except Exception as e:
+                        # One failing callback must not stop the results of the others
+                        print("Callback of background task '{}' failed:".format(task.description), e)
+                elif kind == "error":
+                    print("Background task '{}' failed:".format(task.description), value)
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.POLL_MS, self.poll)
+
+    def notify_busy(self):
+        if self.on_busy:
+            self.on_busy([task for task in self.tasks if not task.is_cancelled()])
+
+    def cancel_all(self):
+        for task in self.tasks:
+            task.cancel()
+        self.notify_busy()
+
+    def shutdown(self, wait=True):
+        """Cancels all tasks, drops the queued jobs and, with `wait`, waits
+        for the running ones to return. Cancelling interrupts the queries of
+        tasks that registered an interrupt, so this is quick."""
+        self.cancel_all()
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+